@@ -1,5 +1,6 @@
 import os
 import json
+from memory_structure.state_store import state_store
 
 # persona 데이터 로드
 def load_persona_data( filepath):
@@ -36,13 +37,8 @@ def make_scratch_memory(name: str, user , output_prompt: str):
         print("JSONDecodeError:", e)
         return  # JSON 변환에 실패하면 종료
 
-    # 파일 저장 경로 생성
-    s_m_filepath = f"memory_storage/{user['uid']}/{name}/scratch.json"
-    os.makedirs(os.path.dirname(s_m_filepath), exist_ok=True)
-
-    # JSON 데이터를 파일에 저장
-    with open(s_m_filepath, 'w', encoding='utf-8') as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    # 상태 저장소에 저장
+    state_store.set_scratch(user['uid'], name, data)
 
 # 파일 존재 여부 확인
 def check_file_exists(filepath):
@@ -56,32 +52,14 @@ def check_file_exists(filepath):
 
 # scratch data 업데이트
 def update_daily_req(uid, name, new_data):
-    # 파일 경로 생성
-    filepath = f"memory_storage/{uid}/{name}/scratch.json"
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-    
     # daily_req가 없으면 새로 생성
-    if 'daily_req' not in data:
-        data['daily_req'] = {}
+    daily_req = state_store.get_scratch_field(uid, name, 'daily_req', {})
     
-    # 데이터 업데이트
-    data['daily_req'] = {**data['daily_req'], **new_data}
-
-    with open(filepath, 'w', encoding='utf-8') as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    # 데이터 업데이트 (daily_req 필드만 저장)
+    state_store.update_scratch(uid, name, daily_req={**daily_req, **new_data})
 
 
 
 # 시간당 스케쥴 업데이트
 def update_daily_req_hourly(uid, name, new_data):
-    filepath = f"memory_storage/{uid}/{name}/scratch.json"
-
-    with open(filepath, 'r', encoding='utf-8') as file:
-        data = json.load(file)
-
-    data['daily_req_hourly'] = new_data
-
-    with open(filepath, 'w', encoding='utf-8') as file:
-        json.dump(data, file, ensure_ascii=False, indent=4)
+    state_store.update_scratch(uid, name, daily_req_hourly=new_data)
@@ -1,10 +1,12 @@
 from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
 from firebase_admin import firestore
 import firebase_admin
 from firebase_admin import credentials
 import json
+import asyncio
 from test_convo_v9 import *
 
 from global_method import *
@@ -21,7 +23,38 @@ from firebase_config import db
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # 백그라운드에서 진행 중인 대화 요약/관계 업데이트를 마무리
+    await drain_background_jobs()
+
+
+app = FastAPI(lifespan=lifespan)
+
+PERSONA_NAMES = ["Joy", "Anger", "Sadness", "Clone", "Custom"]
+
+
+async def plan_persona_day(persona, data, spatial_data):
+    """한 페르소나의 하루 일정, 시간별 계획, 이동 경로를 생성"""
+    await persona.plan(persona.name, True, data)
+    daily_schedule_hourly = await daily_plan_hourly(persona, data)
+
+    activities = []
+    for activity, duration in daily_schedule_hourly:
+        activities.append({
+            "activity": activity,
+            "duration": duration
+        })
+
+    route_plan = await plan_daily_route(activities, spatial_data, persona)
+    complete_schedule = create_full_schedule(route_plan, spatial_data, persona)
+
+    return {
+        "name": persona.name,
+        "wake_up_time": persona.scratch.wake_up_time,
+        "daily_schedule": complete_schedule
+    }
 
 
 
@@ -34,54 +67,27 @@ async def start(request: Request):
     print("게임 시작")
     data = await request.json()
     uid = data['uid']
-    daily_activity = []
 
     # 현재 날짜 구하기 (시간은 제외)
     today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
 
-    personas = [
-        Persona("Joy", data),
-        Persona("Anger", data),
-        Persona("Sadness", data),
-        Persona("Clone", data),
-        Persona("Custom", data)
-    ]
+    # 첫 접속이면 페르소나 생성에 LLM 호출이 있으므로 스레드에서 동시에 생성
+    personas = await asyncio.gather(*[
+        asyncio.to_thread(Persona, name, data) for name in PERSONA_NAMES
+    ])
 
-    relationships = f"memory_storage/{uid}/relationships.json"
+    # 맵은 모든 유저/페르소나가 같으므로 공유 spatial.json 하나를 사용
+    spatial_data = get_spatial_data()
 
-    if not os.path.exists(relationships):
-        make_persona_association(personas, data)
+    # 관계 정보가 없거나 중간에 중단된 경우 남은 페르소나 쌍만 생성
+    if missing_relationship_pairs(personas, load_relationships(uid)):
+        await make_persona_association(personas, data)
 
-    
 
-    for persona in personas:
-        activities = []
-        
-        persona.plan(persona.name, True, data)
-        daily_plan_hourly(persona, data)
-        
-        json_file = json.load(open(f"memory_storage/{uid}/{persona.name}/scratch.json"))
-        daily_schedule_hourly = json_file["daily_req_hourly"]
-        
-        for activity, duration in daily_schedule_hourly:
-            activities.append({
-                "activity": activity,
-                "duration": duration
-            })
-        
-        spatial_memory = SpatialMemory(map_matrix, zone_labels)
-        filepath = f"memory_storage/{uid}/{persona.name}/spatial.json"
-        spatial_memory.export_spatial_memory(filepath)
-        
-        spatial_data = json.load(open(filepath))
-        route_plan = plan_daily_route(activities, spatial_data, persona)
-        complete_schedule = create_full_schedule(route_plan, spatial_data, persona)
-        
-        daily_activity.append({
-            "name": persona.name,
-            "wake_up_time": persona.scratch.wake_up_time,
-            "daily_schedule": complete_schedule
-        })
+    # 페르소나끼리는 서로 의존하지 않으므로 동시에 계획 (LLM 동시 요청 수는 run_gpt에서 제한)
+    daily_activity = await asyncio.gather(*[
+        plan_persona_day(persona, data, spatial_data) for persona in personas
+    ])
 
     try:
         # daily_activity를 JSON 문자열로 변환
@@ -137,8 +143,8 @@ async def chat_persona(request : Request):
     personas = []
     print(5)
     
-    # SpatialMemory 인스턴스 생성
-    spatial_memory = SpatialMemory(map_matrix, zone_labels)
+    # 공유 SpatialMemory 인스턴스
+    spatial_memory = get_spatial_memory()
     print(6)
     for character in characters:
         persona = Persona(character['name'], data)
@@ -178,7 +184,7 @@ async def chat_persona(request : Request):
         simulation.add_agent(sim_agent)
 
     print(10)
-    simulation.simulate_conversation()
+    await simulation.simulate_conversation()
 
     print(11)
 
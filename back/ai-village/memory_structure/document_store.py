@@ -0,0 +1,184 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+from typing import Iterator, List, Optional, Sequence, Set, Tuple
+
+# SQLite의 바인딩 변수 개수 제한을 넘지 않도록 IN 조회를 나눠서 실행
+_QUERY_CHUNK = 500
+
+
+class UserDocumentStore:
+    """한 사용자의 parent 문서 저장소 (사용자별 SQLite 파일 하나)
+
+    parent ID가 기본 키라서 존재 확인/조회가 디렉토리 스캔 없이 인덱스 조회로 끝나고,
+    mset/mget은 여러 문서를 한 번의 트랜잭션/쿼리로 처리합니다.
+    """
+
+    def __init__(self, path: str, user_id: str, legacy_dir: Optional[str] = None):
+        self.path = path
+        self.user_id = user_id
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS parents (id TEXT PRIMARY KEY, data BLOB NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                saved_count INTEGER NOT NULL,
+                last_hash TEXT NOT NULL
+            )
+        """)
+        self._conn.commit()
+        if legacy_dir:
+            self._import_legacy_files(legacy_dir)
+
+    def mset(self, key_value_pairs: Sequence[Tuple[str, bytes]]) -> None:
+        if not key_value_pairs:
+            return
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO parents (id, data) VALUES (?, ?)",
+                list(key_value_pairs)
+            )
+
+    def mget(self, keys: Sequence[str]) -> List[Optional[bytes]]:
+        found = {}
+        with self._lock:
+            for chunk in _chunks(list(keys)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id, data FROM parents WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                found.update(rows)
+        return [found.get(key) for key in keys]
+
+    def existing_keys(self, keys: Sequence[str]) -> Set[str]:
+        """keys 중 이미 저장된 ID (인덱스 조회만 하고 문서 본문은 읽지 않음)"""
+        existing = set()
+        with self._lock:
+            for chunk in _chunks(list(keys)):
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT id FROM parents WHERE id IN ({placeholders})", chunk
+                ).fetchall()
+                existing.update(row[0] for row in rows)
+        return existing
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM parents WHERE id = ?", [(key,) for key in keys])
+
+    def yield_keys(self, prefix: Optional[str] = None) -> Iterator[str]:
+        with self._lock:
+            if prefix:
+                rows = self._conn.execute(
+                    "SELECT id FROM parents WHERE id >= ? AND id < ? ORDER BY id", (prefix, prefix + "\uffff")
+                ).fetchall()
+            else:
+                rows = self._conn.execute("SELECT id FROM parents ORDER BY id").fetchall()
+        for row in rows:
+            yield row[0]
+
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def get_session_mark(self, session_id: str) -> Tuple[int, str]:
+        """세션에서 마지막으로 저장한 메시지 수와 마지막 메시지 해시 (저장 기록이 없으면 (0, ""))"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT saved_count, last_hash FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return (row[0], row[1]) if row else (0, "")
+
+    def set_session_mark(self, session_id: str, saved_count: int, last_hash: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, saved_count, last_hash) VALUES (?, ?, ?)",
+                (session_id, saved_count, last_hash)
+            )
+
+    def _import_legacy_files(self, legacy_dir: str):
+        """LocalFileStore에 파일 하나씩 저장돼 있던 parent 문서를 한 번만 가져옴
+
+        파일 이름(parent_{user_id}_{persona}_...)만으로는 밑줄이 들어간 ID를 구분할 수 없으므로
+        (예: "a"의 접두사가 "a_b"의 파일과도 맞음) 문서 metadata의 user_id가 정확히 같은 파일만 가져옵니다.
+        """
+        if self.get_meta("legacy_imported") or not os.path.isdir(legacy_dir):
+            return
+        prefix = f"parent_{self.user_id}_"
+        pairs = []
+        skipped = 0
+        for filename in os.listdir(legacy_dir):
+            path = os.path.join(legacy_dir, filename)
+            if not filename.startswith(prefix) or not os.path.isfile(path):
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            owner = _legacy_owner(data)
+            if owner == self.user_id:
+                pairs.append((filename, data))
+            elif owner is None:
+                skipped += 1
+        self.mset(pairs)
+        self.set_meta("legacy_imported", "1")
+        if pairs:
+            print(f"기존 parent 문서 {len(pairs)}개를 {self.path}로 가져왔습니다.")
+        if skipped:
+            print(f"사용자를 확인할 수 없는 기존 parent 문서 {skipped}개는 가져오지 않았습니다.")
+
+
+class ParentDocumentStore:
+    """사용자별로 파티션된 parent 문서 저장소 ({root_dir}/{sha256(user_id)}.sqlite3)
+
+    파일 이름은 사용자 ID 원문의 해시라서 ID에 어떤 문자가 들어 있어도 사용자끼리 겹치지 않습니다.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._partitions = {}
+        self._lock = threading.Lock()
+        os.makedirs(root_dir, exist_ok=True)
+
+    def for_user(self, user_id: str) -> UserDocumentStore:
+        with self._lock:
+            partition = self._partitions.get(user_id)
+            if partition is None:
+                filename = user_partition_name(user_id)
+                partition = UserDocumentStore(
+                    os.path.join(self.root_dir, filename),
+                    user_id,
+                    legacy_dir=self.root_dir
+                )
+                self._partitions[user_id] = partition
+            return partition
+
+
+def user_partition_name(user_id: str) -> str:
+    return hashlib.sha256(user_id.encode("utf-8")).hexdigest() + ".sqlite3"
+
+
+def _legacy_owner(data: bytes) -> Optional[str]:
+    """pickle된 parent 문서(langchain Document)의 metadata에 기록된 user_id (확인할 수 없으면 None)"""
+    try:
+        document = pickle.loads(data)
+    except Exception:
+        return None
+    metadata = getattr(document, "metadata", None)
+    if not isinstance(metadata, dict) or metadata.get("user_id") is None:
+        return None
+    return str(metadata["user_id"])
+
+
+def _chunks(items):
+    for i in range(0, len(items), _QUERY_CHUNK):
+        yield items[i:i + _QUERY_CHUNK]
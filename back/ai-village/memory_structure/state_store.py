@@ -0,0 +1,189 @@
+import os
+import copy
+import json
+import sqlite3
+import threading
+
+# 페르소나 상태 저장소 (SQLite)
+STATE_DB_PATH = os.getenv("PERSONA_STATE_DB", "memory_storage/state.db")
+
+
+class PersonaStateStore:
+    """scratch / 관계 정보를 필드 단위로 저장하는 SQLite 저장소
+
+    - 필드 하나를 바꿀 때 파일 전체를 다시 쓰지 않고 해당 행만 UPSERT
+    - 읽기는 프로세스 내 캐시에서 처리하고, 쓰기는 DB와 캐시에 함께 반영 (write-through)
+    - 여러 필드 변경은 하나의 트랜잭션으로 묶여 원자적으로 반영
+    - 기존 scratch.json / relationships.json은 처음 조회할 때 한 번 가져옴
+    """
+
+    def __init__(self, db_path: str = STATE_DB_PATH):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.RLock()
+        self._scratch = {}  # (uid, name) → dict
+        self._relationships = {}  # uid → {persona: {other: dict}}
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS scratch (
+                    uid TEXT NOT NULL,
+                    persona TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    PRIMARY KEY (uid, persona, field)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS relationships (
+                    uid TEXT NOT NULL,
+                    persona TEXT NOT NULL,
+                    other TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    PRIMARY KEY (uid, persona, other)
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    # ---------------------------------------------------------------- scratch
+
+    def _load_scratch(self, uid, name):
+        key = (uid, name)
+        scratch = self._scratch.get(key)
+        if scratch is not None:
+            return scratch
+
+        rows = self._connect().execute(
+            "SELECT field, value FROM scratch WHERE uid = ? AND persona = ?", (uid, name)
+        ).fetchall()
+        if rows:
+            scratch = {field: json.loads(value) for field, value in rows}
+        else:
+            scratch = self._import_json(f"memory_storage/{uid}/{name}/scratch.json")
+            if scratch:
+                self._write_scratch(uid, name, scratch)
+        if scratch:
+            self._scratch[key] = scratch
+        return scratch
+
+    def _write_scratch(self, uid, name, fields, replace=False):
+        conn = self._connect()
+        with conn:
+            if replace:
+                conn.execute("DELETE FROM scratch WHERE uid = ? AND persona = ?", (uid, name))
+            conn.executemany(
+                "INSERT INTO scratch (uid, persona, field, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (uid, persona, field) DO UPDATE SET value = excluded.value",
+                [(uid, name, field, json.dumps(value, ensure_ascii=False)) for field, value in fields.items()]
+            )
+
+    def has_scratch(self, uid, name) -> bool:
+        with self._lock:
+            return bool(self._load_scratch(uid, name))
+
+    def get_scratch(self, uid, name) -> dict:
+        """페르소나의 scratch 전체 (복사본)"""
+        with self._lock:
+            return copy.deepcopy(self._load_scratch(uid, name) or {})
+
+    def get_scratch_field(self, uid, name, field, default=None):
+        with self._lock:
+            return copy.deepcopy((self._load_scratch(uid, name) or {}).get(field, default))
+
+    def set_scratch(self, uid, name, data: dict):
+        """scratch 전체 교체 (페르소나 최초 생성 시)"""
+        with self._lock:
+            self._write_scratch(uid, name, data, replace=True)
+            self._scratch[(uid, name)] = copy.deepcopy(data)
+
+    def update_scratch(self, uid, name, **fields):
+        """scratch의 일부 필드만 변경"""
+        with self._lock:
+            scratch = self._load_scratch(uid, name) or {}
+            self._write_scratch(uid, name, fields)
+            scratch.update(copy.deepcopy(fields))
+            self._scratch[(uid, name)] = scratch
+
+    # ---------------------------------------------------------- relationships
+
+    def _load_relationships(self, uid):
+        relationships = self._relationships.get(uid)
+        if relationships is not None:
+            return relationships
+
+        rows = self._connect().execute(
+            "SELECT persona, other, data FROM relationships WHERE uid = ?", (uid,)
+        ).fetchall()
+        relationships = {}
+        if rows:
+            for persona, other, data in rows:
+                relationships.setdefault(persona, {})[other] = json.loads(data)
+        else:
+            relationships = self._import_json(f"memory_storage/{uid}/relationships.json")
+            pairs = [
+                (persona, other, data)
+                for persona, views in relationships.items()
+                for other, data in views.items()
+            ]
+            if pairs:
+                self._write_relationships(uid, pairs)
+        self._relationships[uid] = relationships
+        return relationships
+
+    def _write_relationships(self, uid, pairs):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO relationships (uid, persona, other, data) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (uid, persona, other) DO UPDATE SET data = excluded.data",
+                [(uid, persona, other, json.dumps(data, ensure_ascii=False)) for persona, other, data in pairs]
+            )
+
+    def get_relationships(self, uid) -> dict:
+        """유저의 전체 관계 정보 {persona: {other: 관계}} (복사본)"""
+        with self._lock:
+            return copy.deepcopy(self._load_relationships(uid))
+
+    def get_persona_relationships(self, uid, name) -> dict:
+        """한 페르소나의 관점에서 본 관계 정보 {other: 관계} (복사본)"""
+        with self._lock:
+            return copy.deepcopy(self._load_relationships(uid).get(name, {}))
+
+    def set_relationships(self, uid, pairs):
+        """관계 여러 개 저장 (pairs: [(persona, other, 관계 dict)], 하나의 트랜잭션)"""
+        with self._lock:
+            relationships = self._load_relationships(uid)
+            self._write_relationships(uid, pairs)
+            for persona, other, data in pairs:
+                relationships.setdefault(persona, {})[other] = copy.deepcopy(data)
+
+    def update_relationship(self, uid, persona, other, updates: dict):
+        """한 관계의 일부 항목만 변경"""
+        with self._lock:
+            data = copy.deepcopy(self._load_relationships(uid).get(persona, {}).get(other, {}))
+            data.update(updates)
+            self.set_relationships(uid, [(persona, other, data)])
+            return copy.deepcopy(data)
+
+    # ---------------------------------------------------------------- helpers
+
+    @staticmethod
+    def _import_json(path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except Exception as e:
+            print(f"{path} 가져오기 실패: {e}")
+            return {}
+
+
+state_store = PersonaStateStore()
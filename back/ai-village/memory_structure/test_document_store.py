@@ -0,0 +1,88 @@
+import os
+import pickle
+from types import SimpleNamespace
+
+from memory_structure.document_store import ParentDocumentStore, UserDocumentStore, user_partition_name
+
+
+def test_existing_keys_and_mget_preserve_order(tmp_path):
+    store = UserDocumentStore(str(tmp_path / "user.sqlite3"), "user")
+    store.mset([("parent_user_a", b"a"), ("parent_user_b", b"b")])
+
+    assert store.existing_keys(["parent_user_a", "parent_user_c", "parent_user_b"]) == {"parent_user_a", "parent_user_b"}
+    assert store.mget(["parent_user_b", "missing", "parent_user_a"]) == [b"b", None, b"a"]
+
+
+def test_mset_same_key_keeps_one_row(tmp_path):
+    store = UserDocumentStore(str(tmp_path / "user.sqlite3"), "user")
+    store.mset([("parent_user_a", b"old")])
+    store.mset([("parent_user_a", b"new")])
+
+    assert list(store.yield_keys()) == ["parent_user_a"]
+    assert store.mget(["parent_user_a"]) == [b"new"]
+
+
+def test_existing_keys_handles_more_than_one_query_chunk(tmp_path):
+    store = UserDocumentStore(str(tmp_path / "user.sqlite3"), "user")
+    keys = [f"parent_user_{i:04d}" for i in range(1200)]
+    store.mset([(key, b"x") for key in keys[::2]])
+
+    assert store.existing_keys(keys) == set(keys[::2])
+
+
+def legacy_parent(user_id, content):
+    return pickle.dumps(SimpleNamespace(page_content=content, metadata={"user_id": user_id, "persona_name": "p1"}))
+
+
+def test_legacy_files_are_imported_once_per_user(tmp_path):
+    root = tmp_path / "doc_store"
+    root.mkdir()
+    (root / "parent_alice_p1_0").write_bytes(legacy_parent("alice", "alice doc"))
+    (root / "parent_bob_p1_0").write_bytes(legacy_parent("bob", "bob doc"))
+
+    store = ParentDocumentStore(str(root)).for_user("alice")
+    assert list(store.yield_keys()) == ["parent_alice_p1_0"]
+    assert pickle.loads(store.mget(["parent_alice_p1_0"])[0]).page_content == "alice doc"
+
+    # 가져온 뒤 삭제한 문서는 다시 열어도 다시 가져오지 않음
+    store.mdelete(["parent_alice_p1_0"])
+    (root / "parent_alice_p2_0").write_bytes(legacy_parent("alice", "late"))
+    reopened = UserDocumentStore(store.path, "alice", legacy_dir=str(root))
+    assert list(reopened.yield_keys()) == []
+
+
+def test_legacy_import_matches_exact_user_id(tmp_path):
+    root = tmp_path / "doc_store"
+    root.mkdir()
+    # "a"의 접두사(parent_a_)는 "a_b"의 파일 이름과도 맞음
+    (root / "parent_a_p1_0").write_bytes(legacy_parent("a", "a doc"))
+    (root / "parent_a_b_p1_0").write_bytes(legacy_parent("a_b", "a_b doc"))
+    (root / "parent_a_unknown_0").write_bytes(b"not a pickle")
+
+    stores = ParentDocumentStore(str(root))
+    assert list(stores.for_user("a").yield_keys()) == ["parent_a_p1_0"]
+    assert list(stores.for_user("a_b").yield_keys()) == ["parent_a_b_p1_0"]
+
+
+def test_for_user_reuses_partition(tmp_path):
+    stores = ParentDocumentStore(str(tmp_path))
+    assert stores.for_user("a/b") is stores.for_user("a/b")
+    assert os.path.exists(tmp_path / user_partition_name("a/b"))
+
+
+def test_partition_names_do_not_collide(tmp_path):
+    # 예전처럼 특수문자를 "_"로 바꾸면 둘 다 a_b.sqlite3가 됨
+    stores = ParentDocumentStore(str(tmp_path))
+    stores.for_user("a/b").mset([("parent_a/b_x", b"slash")])
+    stores.for_user("a_b").mset([("parent_a_b_x", b"underscore")])
+
+    assert stores.for_user("a/b").path != stores.for_user("a_b").path
+    assert list(stores.for_user("a/b").yield_keys()) == ["parent_a/b_x"]
+    assert list(stores.for_user("a_b").yield_keys()) == ["parent_a_b_x"]
+
+
+def test_session_mark_roundtrip(tmp_path):
+    store = UserDocumentStore(str(tmp_path / "user.sqlite3"), "user")
+    assert store.get_session_mark("s") == (0, "")
+    store.set_session_mark("s", 4, "hash")
+    assert store.get_session_mark("s") == (4, "hash")
@@ -0,0 +1,108 @@
+import json
+import threading
+
+import pytest
+
+from memory_structure.state_store import PersonaStateStore
+
+
+@pytest.fixture(autouse=True)
+def isolated_cwd(tmp_path, monkeypatch):
+    # 기존 JSON 가져오기 경로(memory_storage/...)가 실제 작업 디렉터리를 보지 않도록
+    monkeypatch.chdir(tmp_path)
+
+
+def make_store(tmp_path):
+    return PersonaStateStore(str(tmp_path / "state.db"))
+
+
+def test_update_scratch_changes_only_given_fields(tmp_path):
+    store = make_store(tmp_path)
+    store.set_scratch("user", "Joy", {"name": "Joy", "curr_date": "2024-01-01", "wake_up_time": 7})
+    store.update_scratch("user", "Joy", wake_up_time=8)
+
+    assert store.get_scratch("user", "Joy") == {"name": "Joy", "curr_date": "2024-01-01", "wake_up_time": 8}
+    assert store.get_scratch_field("user", "Joy", "missing", "default") == "default"
+
+
+def test_set_scratch_replaces_old_fields(tmp_path):
+    store = make_store(tmp_path)
+    store.set_scratch("user", "Joy", {"name": "Joy", "old": 1})
+    store.set_scratch("user", "Joy", {"name": "Joy"})
+
+    assert store.get_scratch("user", "Joy") == {"name": "Joy"}
+    assert make_store(tmp_path).get_scratch("user", "Joy") == {"name": "Joy"}
+
+
+def test_cache_and_database_stay_consistent(tmp_path):
+    store = make_store(tmp_path)
+    store.set_scratch("user", "Joy", {"name": "Joy"})
+    store.update_scratch("user", "Joy", curr_date="2024-01-02")
+    store.set_relationships("user", [("Joy", "Anger", {"closeness": 3})])
+
+    # 반환값은 복사본이라 바꿔도 캐시에 반영되지 않음
+    store.get_scratch("user", "Joy")["name"] = "changed"
+    store.get_relationships("user")["Joy"]["Anger"]["closeness"] = 10
+
+    fresh = make_store(tmp_path)
+    for reader in (store, fresh):
+        assert reader.get_scratch("user", "Joy") == {"name": "Joy", "curr_date": "2024-01-02"}
+        assert reader.get_relationships("user") == {"Joy": {"Anger": {"closeness": 3}}}
+
+
+def test_json_files_are_imported_once(tmp_path):
+    persona_dir = tmp_path / "memory_storage" / "user" / "Joy"
+    persona_dir.mkdir(parents=True)
+    (persona_dir / "scratch.json").write_text(json.dumps({"name": "Joy", "wake_up_time": 7}), encoding="utf-8")
+    (tmp_path / "memory_storage" / "user" / "relationships.json").write_text(
+        json.dumps({"Joy": {"Anger": {"closeness": 5}}}), encoding="utf-8"
+    )
+
+    store = make_store(tmp_path)
+    assert store.has_scratch("user", "Joy")
+    assert store.get_persona_relationships("user", "Joy") == {"Anger": {"closeness": 5}}
+    store.update_scratch("user", "Joy", wake_up_time=9)
+
+    # 가져온 뒤에는 JSON이 바뀌어도 DB 값을 사용
+    (persona_dir / "scratch.json").write_text(json.dumps({"name": "Other"}), encoding="utf-8")
+    (tmp_path / "memory_storage" / "user" / "relationships.json").write_text(json.dumps({}), encoding="utf-8")
+
+    fresh = make_store(tmp_path)
+    assert fresh.get_scratch("user", "Joy") == {"name": "Joy", "wake_up_time": 9}
+    assert fresh.get_relationships("user") == {"Joy": {"Anger": {"closeness": 5}}}
+    assert not fresh.has_scratch("user", "Sadness")
+
+
+def test_update_relationship_upserts(tmp_path):
+    store = make_store(tmp_path)
+    assert store.update_relationship("user", "Joy", "Anger", {"closeness": 4}) == {"closeness": 4}
+    assert store.update_relationship("user", "Joy", "Anger", {"dynamics": "friendly"}) == {
+        "closeness": 4, "dynamics": "friendly"
+    }
+    store.set_relationships("user", [("Anger", "Joy", {"closeness": 2})])
+
+    assert make_store(tmp_path).get_relationships("user") == {
+        "Joy": {"Anger": {"closeness": 4, "dynamics": "friendly"}},
+        "Anger": {"Joy": {"closeness": 2}},
+    }
+
+
+def test_concurrent_writers_do_not_lose_updates(tmp_path):
+    store = make_store(tmp_path)
+    store.set_scratch("user", "Joy", {"name": "Joy"})
+
+    def write(i):
+        store.update_scratch("user", "Joy", **{f"field_{i}": i})
+        store.update_relationship("user", "Joy", "Anger", {f"key_{i}": i})
+
+    threads = [threading.Thread(target=write, args=(i,)) for i in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected_scratch = {"name": "Joy", **{f"field_{i}": i for i in range(16)}}
+    expected_relationship = {f"key_{i}": i for i in range(16)}
+    for reader in (store, make_store(tmp_path)):
+        assert reader.get_scratch("user", "Joy") == expected_scratch
+        assert reader.get_persona_relationships("user", "Joy") == {"Anger": expected_relationship}
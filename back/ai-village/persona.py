@@ -11,17 +11,13 @@ from spatial_memory.maze import *
 class Persona:
     def __init__(self , name , user) -> None:
 
-        scratch_saved = f"memory_storage/{user['uid']}/{name}/scratch.json"
-        
-        if (check_file_exists(scratch_saved)):
-            scratch_saved = json.load(open(scratch_saved))
-        else :
+        if not state_store.has_scratch(user['uid'], name):
             first_day_persona(name, user)
-            scratch_saved = json.load(open(scratch_saved))
+        scratch_saved = state_store.get_scratch(user['uid'], name)
 
         self.name = name
         self.scratch = Scratch(scratch_saved)
-        self.spatial_memory = SpatialMemory(map_matrix, zone_labels)
+        self.spatial_memory = get_spatial_memory()  # 프로세스 공유 인스턴스 참조
         self.daily_plan_count = 0 
         self.uid = user['uid']
 
@@ -29,8 +25,8 @@ class Persona:
 
         
 
-    def plan(self, name, new_day , user):
-        return plan(self ,new_day , user)
+    async def plan(self, name, new_day , user):
+        return await plan(self ,new_day , user)
     
     def get_map_data(self):
         return self.spatial_memory.map_matrix
@@ -40,20 +36,15 @@ class Persona:
     
     def _load_my_relationships(self, uid):
         """해당 페르소나의 관계 정보만 로드합니다."""
-        relationship_path = f"memory_storage/{uid}/relationships.json"
-        
-        if check_file_exists(relationship_path):
-            try:
-                with open(relationship_path, 'r', encoding='utf-8') as f:
-                    all_relationships = json.load(f)
-                    # 현재 페르소나의 관계 정보만 반환
-                    my_relationships = all_relationships.get(self.name, {})
-                    print(f"{self.name}의 관계 정보가 로드되었습니다.")
-                    return my_relationships
-            except Exception as e:
-                print(f"관계 정보 로드 중 오류 발생: {e}")
-                return {}
-        return {}
+        try:
+            # 현재 페르소나의 관계 정보만 반환
+            my_relationships = state_store.get_persona_relationships(uid, self.name)
+            if my_relationships:
+                print(f"{self.name}의 관계 정보가 로드되었습니다.")
+            return my_relationships
+        except Exception as e:
+            print(f"관계 정보 로드 중 오류 발생: {e}")
+            return {}
 
     def get_my_view_of(self, other_persona_name):
         """내가 바라보는 특정 페르소나와의 관계를 반환합니다."""
@@ -110,14 +101,8 @@ class Persona:
     def update_current_zone(self, zone: str):
         self.scratch.currentZone = zone  # scratch 객체에 currentZone 필드 추가
         
-        # scratch.json 파일 업데이트
-        json_file_path = f"memory_storage/{self.uid}/{self.name}/scratch.json"
-        with open(json_file_path, 'r+') as file:
-            scratch_data = json.load(file)
-            scratch_data['currentZone'] = zone
-            file.seek(0)
-            json.dump(scratch_data, file, indent=4)
-            file.truncate()
+        # 상태 저장소의 currentZone 필드만 업데이트
+        state_store.update_scratch(self.uid, self.name, currentZone=zone)
 
     def get_current_zone(self):
         return self.scratch.currentZone
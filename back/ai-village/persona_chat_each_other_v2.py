@@ -2,17 +2,34 @@ from langchain_core.prompts import MessagesPlaceholder, ChatPromptTemplate, Huma
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from typing import List, Dict
-import time
+import asyncio
 import random
 from datetime import datetime
 import json
 
 from persona import Persona
+from memory_structure.state_store import state_store
 
 from firebase_admin import firestore
 import firebase_admin
 from firebase_admin import credentials
 
+# 대화가 끝난 뒤 실행되는 요약/관계 업데이트 작업 (종료 시 drain_background_jobs로 마무리)
+background_jobs = set()
+
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+
+async def drain_background_jobs():
+    """진행 중인 백그라운드 작업이 모두 끝날 때까지 대기 (애플리케이션 종료 시 호출)"""
+    if background_jobs:
+        await asyncio.gather(*list(background_jobs), return_exceptions=True)
+
 
 
 
@@ -94,7 +111,7 @@ class ConversationAgent:
         
         self.llm = ChatOpenAI(model=model, temperature=0.7)
 
-    def receive_message(self, message: str, sender: str) -> str:
+    async def receive_message(self, message: str, sender: str) -> str:
         # 대화 기록에 메시지 추가
         self.chat_history.append({"sender": sender, "message": message})
         
@@ -108,7 +125,7 @@ class ConversationAgent:
         
         # 응답 생성
         chain = self.prompt | self.llm
-        response = chain.invoke({
+        response = await chain.ainvoke({
             "chat_history": formatted_history,
             "input": message
         })
@@ -119,23 +136,42 @@ class ConversationAgent:
         return response.content
 
 class ConversationSimulation:
-    def __init__(self, uid: str, db: firestore.Client):
+    def __init__(self, uid: str, db: firestore.Client, flush_size: int = 5):
         self.agents: Dict[str, ConversationAgent] = {}
         self.db = db
         self.uid = uid
+        self.flush_size = flush_size  # 메시지를 몇 개씩 모아서 batch로 저장할지
+        self.pending_messages = []
         
     def save_conversation(self, conversation_id: str, message: str, speaker: str, timestamp: datetime = None):
+        """메시지를 저장 대기열에 추가 (실제 저장은 flush_messages에서 batch로 처리)"""
         if timestamp is None:
             timestamp = datetime.now()
             
-        path = f"village/convo/{self.uid}"
-        conversation_ref = self.db.collection(path).document(conversation_id)
-        conversation_ref.collection('messages').add({
+        self.pending_messages.append((conversation_id, {
             'speaker': speaker,
             'content': message,
             'timestamp': timestamp,
             'location': self.agents[speaker].current_location
-        })
+        }))
+
+    def _commit_messages(self, messages):
+        path = f"village/convo/{self.uid}"
+        batch = self.db.batch()
+        for conversation_id, data in messages:
+            message_ref = self.db.collection(path).document(conversation_id).collection('messages').document()
+            batch.set(message_ref, data)
+        batch.commit()
+
+    async def flush_messages(self, force: bool = False):
+        """대기 중인 메시지를 하나의 batch 쓰기로 저장 (force가 아니면 flush_size만큼 모였을 때만)"""
+        if not self.pending_messages or (not force and len(self.pending_messages) < self.flush_size):
+            return
+        messages, self.pending_messages = self.pending_messages, []
+        try:
+            await asyncio.to_thread(self._commit_messages, messages)
+        except Exception as e:
+            print(f"대화 메시지 저장 중 오류 발생: {str(e)}")
 
     def add_agent(self, agent: ConversationAgent):
         self.agents[agent.name] = agent
@@ -162,7 +198,7 @@ class ConversationSimulation:
         
         return "\n".join(reversed(previous_messages)) if previous_messages else "이전 대화 없음"
 
-    def generate_initial_message(self, speaker_agent: ConversationAgent) -> str:
+    async def generate_initial_message(self, speaker_agent: ConversationAgent) -> str:
         """선택된 페르소나의 성격에 맞는 대화 시작 메시지를 생성"""
         llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.7)
         
@@ -170,7 +206,7 @@ class ConversationSimulation:
         listener_name = next(name for name in self.agents.keys() if name != speaker_agent.name)
         
         # 이전 대화 내용 가져오기
-        previous_conversation = self.get_previous_conversation(speaker_agent.name, listener_name)
+        previous_conversation = await asyncio.to_thread(self.get_previous_conversation, speaker_agent.name, listener_name)
         
         prompt = f"""당신은 {speaker_agent.name}입니다.
 
@@ -196,7 +232,7 @@ class ConversationSimulation:
 
 응답 형식: 대화 시작 문장만 작성해주세요."""
 
-        response = llm.invoke(prompt)
+        response = await llm.ainvoke(prompt)
         return response.content.strip()
     
     def select_initial_speaker(self) -> ConversationAgent:
@@ -221,14 +257,12 @@ class ConversationSimulation:
         # 가중치를 기반으로 초기 화자 선택
         return random.choices(agents_list, weights=weights, k=1)[0]
 
-    def update_relationship(self, conversation_summary: str, speaker: str, listener: str):
+    async def update_relationship(self, conversation_summary: str, speaker: str, listener: str):
         """대화 내용을 바탕으로 관계 정보 업데이트"""
         llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
         
-        # relationships.json 읽기
-        json_path = f"memory_storage/{self.uid}/relationships.json"
-        with open(json_path, 'r', encoding='utf-8') as file:
-            relationships = json.load(file)
+        # 현재 관계 정보 읽기 (상태 저장소 캐시)
+        relationships = await asyncio.to_thread(state_store.get_relationships, self.uid)
         
         prompt = f"""
         다음은 {speaker}와 {listener} 사이의 대화 요약입니다:
@@ -246,23 +280,42 @@ class ConversationSimulation:
         """
         
         try:
-            response = llm.invoke(prompt)
+            response = await llm.ainvoke(prompt)
             updates = json.loads(response.content)
             
-            # 관계 정보 업데이트
+            # 관계 정보 업데이트 (양방향, 바뀐 두 관계만 저장)
             relationships[speaker][listener].update(updates)
-            relationships[listener][speaker].update(updates)  # 양방향 업데이트
-            
-            # 파일 저장
-            with open(json_path, 'w', encoding='utf-8') as file:
-                json.dump(relationships, file, ensure_ascii=False, indent=2)
+            relationships[listener][speaker].update(updates)
+            await asyncio.to_thread(state_store.set_relationships, self.uid, [
+                (speaker, listener, relationships[speaker][listener]),
+                (listener, speaker, relationships[listener][speaker]),
+            ])
                 
             print(f"\n{speaker}와 {listener}의 관계가 업데이트되었습니다.")
             
         except Exception as e:
             print(f"관계 업데이트 중 오류 발생: {str(e)}")
 
-    def simulate_conversation(self, turns: int = 10):
+    async def summarize_and_update_relationship(self, convo_data):
+        """대화 요약 후 관계 정보 업데이트 (대화 응답과 별개로 백그라운드에서 실행)"""
+        try:
+            llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
+            conversation_summary_prompt = f"""
+            다음 대화를 요약해주세요:
+            {convo_data}
+            
+            주요 감정 변화와 상호작용을 중심으로 요약해주세요.
+            """
+            
+            conversation_summary = (await llm.ainvoke(conversation_summary_prompt)).content
+            
+            # 관계 정보 업데이트
+            participants = list(self.agents.keys())
+            await self.update_relationship(conversation_summary, participants[0], participants[1])
+        except Exception as e:
+            print(f"대화 요약 중 오류 발생: {str(e)}")
+
+    async def simulate_conversation(self, turns: int = 10):
         # 참여자 이름만으로 conversation_id 생성
         participants = sorted([agent.name for agent in self.agents.values()])
         conversation_id = f"{'-'.join(participants)}"
@@ -273,7 +326,7 @@ class ConversationSimulation:
         
         # 대화 시작 시간을 별도 필드로 저장
         conversation_ref = self.db.collection(path).document(conversation_id)
-        conversation_ref.set({
+        await asyncio.to_thread(conversation_ref.set, {
             'participants': participants,
             'conversations': firestore.ArrayUnion([{
                 'start_time': datetime.now(),
@@ -283,7 +336,7 @@ class ConversationSimulation:
         
         # 초기 화자 선택
         initial_speaker = self.select_initial_speaker()
-        initial_message = self.generate_initial_message(initial_speaker)
+        initial_message = await self.generate_initial_message(initial_speaker)
         
         print(f"\n=== 대화 시작 ===")
         print(f"{initial_speaker.name}: {initial_message}")
@@ -305,51 +358,43 @@ class ConversationSimulation:
         turn_count = 0
         
 
-        while turn_count < turns:
-            speakers = list(self.agents.keys())
-            current_idx = speakers.index(current_speaker)
-            next_speaker = speakers[(current_idx + 1) % len(speakers)]
-            
-            response = self.agents[next_speaker].receive_message(current_message, current_speaker)
-            
-            convo_data.append({
-                'speaker': next_speaker,
-                'message': response
-            })
-            time.sleep(0.5)
-            print(f"{next_speaker}: {response}")
-            
-            # 응답 저장
-            self.save_conversation(
-                conversation_id=conversation_id,
-                message=response,
-                speaker=next_speaker
-            )
-            
-            if "<END>" in response:
-                print("\n=== 대화가 자연스럽게 종료되었습니다 ===")
-                break
-            
-            current_speaker = next_speaker
-            current_message = response
-            turn_count += 1
-            
-            if turn_count >= turns:
-                print(f"\n=== {turns}턴의 대화가 완료되었습니다 ===")
-        
-        # 대화가 끝난 후 관계 업데이트를 위한 대화 요약
-        llm = ChatOpenAI(model="gpt-4o-mini", temperature=0.3)
-        conversation_summary_prompt = f"""
-        다음 대화를 요약해주세요:
-        {convo_data}
-        
-        주요 감정 변화와 상호작용을 중심으로 요약해주세요.
-        """
-        
-        conversation_summary = llm.invoke(conversation_summary_prompt).content
+        try:
+            while turn_count < turns:
+                speakers = list(self.agents.keys())
+                current_idx = speakers.index(current_speaker)
+                next_speaker = speakers[(current_idx + 1) % len(speakers)]
+                
+                response = await self.agents[next_speaker].receive_message(current_message, current_speaker)
+                
+                convo_data.append({
+                    'speaker': next_speaker,
+                    'message': response
+                })
+                print(f"{next_speaker}: {response}")
+                
+                # 응답 저장 (flush_size만큼 모이면 batch로 저장)
+                self.save_conversation(
+                    conversation_id=conversation_id,
+                    message=response,
+                    speaker=next_speaker
+                )
+                await self.flush_messages()
+                
+                if "<END>" in response:
+                    print("\n=== 대화가 자연스럽게 종료되었습니다 ===")
+                    break
+                
+                current_speaker = next_speaker
+                current_message = response
+                turn_count += 1
+                
+                if turn_count >= turns:
+                    print(f"\n=== {turns}턴의 대화가 완료되었습니다 ===")
+        finally:
+            # 중간에 오류가 나도 이미 생성된 메시지는 저장
+            await self.flush_messages(force=True)
         
-        # 관계 정보 업데이트
-        participants = list(self.agents.keys())
-        self.update_relationship(conversation_summary, participants[0], participants[1])
-
+        # 대화 요약과 관계 업데이트는 백그라운드에서 실행
+        run_in_background(self.summarize_and_update_relationship(convo_data))
 
+        return convo_data
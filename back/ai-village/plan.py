@@ -1,6 +1,6 @@
 from run_gpt import *
 
-def plan(persona, new_day , user):
+async def plan(persona, new_day , user):
 
     if new_day :
-        new_day_plan(persona , user)
\ No newline at end of file
+        await new_day_plan(persona , user)
\ No newline at end of file
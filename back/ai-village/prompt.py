@@ -40,3 +40,37 @@ def create_location_prompt(persona, activity, duration, current_position, spatia
 
     return prompt
 
+
+
+def create_route_prompt(persona, activities, current_position, zone_table):
+
+    activity_lines = "\n".join(
+        f"        {i + 1}. {activity['activity']} ({activity['duration']} 분)"
+        for i, activity in enumerate(activities)
+    )
+
+    prompt = f"""
+        {persona.scratch.get_str_iss()}
+
+        {persona.name} 의 하루 일정 전체에 대해 각 활동의 최적의 위치를 한 번에 추천해주세요.
+
+        시작 위치 : {current_position}
+
+        활동 목록 (순서대로 진행) :
+{activity_lines}
+
+        당신이 살고 있는 공간의 구역 정보 (구역명 / 기능 / 수용 인원 / 위치 좌표 목록) :
+{zone_table}
+
+        고려사항:
+        1. 활동의 성격에 맞는 공간을 선택해주세요
+            - 명상/휴식 → 조용한 공간
+            - 사회적 활동 → 공용 공간
+        2. 이전 활동 위치에서의 접근성을 고려해주세요
+        3. 해당 공간의 수용 인원을 확인해주세요
+        4. position 은 반드시 선택한 구역의 위치 좌표 목록에 있는 좌표여야 합니다
+
+        모든 활동에 대해 활동 번호(index), 구역명(zone), 좌표(position)를 빠짐없이 응답해주세요.
+    """
+
+    return prompt
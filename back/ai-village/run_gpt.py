@@ -1,11 +1,15 @@
 from langchain_openai import ChatOpenAI
 import json
+import os
+import asyncio
 from dotenv import load_dotenv
 from global_method import *
 from datetime import datetime
 import re
 from prompt import *
 import numpy as np
+from typing import List
+from pydantic import BaseModel, Field
 from spatial_memory.spatial import PathFinder, Position
 from spatial_memory.maze import map_matrix, zone_labels
 
@@ -19,6 +23,27 @@ from firebase_admin import credentials
 
 from firebase_config import db
 
+# 동시에 보내는 LLM 요청 수 (여러 페르소나를 동시에 계획할 때 rate limit 보호)
+LLM_CONCURRENCY = int(os.getenv('LLM_CONCURRENCY', 8))
+_llm_semaphore = asyncio.Semaphore(LLM_CONCURRENCY)
+_llms = {}
+
+
+def get_llm(temperature=0):
+    """temperature별로 ChatOpenAI 클라이언트를 하나씩 만들어 재사용"""
+    llm = _llms.get(temperature)
+    if llm is None:
+        llm = ChatOpenAI(temperature=temperature, model="gpt-4o-mini")
+        _llms[temperature] = llm
+    return llm
+
+
+async def ainvoke_llm(prompt, temperature=0):
+    """동시 요청 수 제한 안에서 LLM을 비동기로 호출하고 응답 텍스트를 반환"""
+    async with _llm_semaphore:
+        response = await get_llm(temperature).ainvoke(prompt)
+    return response.content
+
 def first_day_persona(name , user):
 
     doc_ref = db.collection('users').document(user['uid'])
@@ -122,7 +147,7 @@ def first_day_persona(name , user):
 # first_day_persona("Joy", user)
 
 # 새로운 날의 스케쥴 생성
-def new_day_plan( persona , user ):
+async def new_day_plan( persona , user ):
 
     today = datetime.today()
 
@@ -145,32 +170,19 @@ def new_day_plan( persona , user ):
         return format
     
     def set_curr_date(persona, formatted_date):
-        with open(f"memory_storage/{user['uid']}/{persona.name}/scratch.json", 'r', encoding='utf-8') as file:
-            data = json.load(file)
-
-        data['curr_date'] = formatted_date
+        state_store.update_scratch(user['uid'], persona.name, curr_date=formatted_date)
 
         persona.scratch.curr_date = formatted_date
 
-        with open(f"memory_storage/{user['uid']}/{persona.name}/scratch.json", 'w', encoding='utf-8') as file:
-            json.dump(data, file, ensure_ascii=False, indent=4)
-
 
     
-    set_curr_date(persona , formatted_date)
+    await asyncio.to_thread(set_curr_date, persona, formatted_date)
 
-    response = wake_up_time(persona , today)
+    response = await wake_up_time(persona , today)
 
     persona.scratch.wake_up_time = response
 
-    filepath = f"memory_storage/{user['uid']}/{persona.name}/scratch.json"
-
-    persona_scratch = load_persona_data(filepath)
-
-    persona_scratch["wake_up_time"] = response
-
-    with open(filepath, 'w', encoding='utf-8') as file:
-        json.dump(persona_scratch, file, ensure_ascii=False, indent=4)
+    await asyncio.to_thread(state_store.update_scratch, user['uid'], persona.name, wake_up_time=response)
 
     prompt = f"""
 
@@ -187,23 +199,18 @@ def new_day_plan( persona , user ):
 
 """
 
-    llm = ChatOpenAI(
-        temperature= 0,
-        model_name = "gpt-4o-mini",
-    )
+    response = await ainvoke_llm(prompt, temperature=0)
 
-    response = llm.invoke(prompt)
-
-    print(response.content)
+    print(response)
 
-    daily_req = __func_clean_up(response.content)
+    daily_req = __func_clean_up(response)
 
     update_daily_req(user['uid'], persona.name , daily_req)
 
     persona.scratch.daily_req = daily_req[formatted_date]
 
 
-def daily_plan_hourly(persona , user):
+async def daily_plan_hourly(persona , user):
 
     now = datetime.now()
 
@@ -233,20 +240,15 @@ def daily_plan_hourly(persona , user):
     이제 당신의 계획을 작성해 주세요.
 """ 
 
-    llm = ChatOpenAI(
-        temperature=0.2,
-        model = "gpt-4o-mini",
-    )
+    response = await ainvoke_llm(prompt, temperature=0.2)
 
-    response = llm.invoke(prompt)
-
-    print(response.content)
+    print(response)
 
     # 빈 리스트 생성
     events = []
 
     # 각 줄을 분리하여 반복 처리
-    for line in response.content.split("\n"):
+    for line in response.split("\n"):
     # 각 줄을 ", "를 기준으로 분리
         parts = line.split(", ")
         if len(parts) == 2:
@@ -264,10 +266,12 @@ def daily_plan_hourly(persona , user):
 
     update_daily_req_hourly(user['uid'], persona.name , events)
 
+    return events
+
 
 
 
-def wake_up_time(persona , day):
+async def wake_up_time(persona , day):
     prompt = f"""
         # Input
         오늘은 {day} 입니다.
@@ -278,57 +282,170 @@ def wake_up_time(persona , day):
         6am
         """
     
-    llm = ChatOpenAI(
-        temperature=0.8,
-        model = "gpt-4o-mini",
-    )
+    response = await ainvoke_llm(prompt, temperature=0.8)
 
-    response = llm.invoke(prompt)
+    print(response)
 
-    print(response.content)
+    return response.replace('Exam','')
 
-    return response.content.replace('Exam','')
 
 
 
 
+class ActivityLocation(BaseModel):
+    index: int = Field(description="활동 번호 (1부터 시작)")
+    zone: str = Field(description="추천 장소명")
+    position: List[int] = Field(description="선택한 구역 안의 좌표 [x, y]")
 
-# spatial_data => data spatial.json 값
-def plan_daily_route(daily_activity, spatial_data,persona):
-    current_position = spatial_data["zones"][f"{persona.name}_home"]["positions"][0] #시작점
-    route_plan = []
 
+class RoutePlan(BaseModel):
+    locations: List[ActivityLocation] = Field(description="활동 순서대로의 위치 목록")
 
 
-    for activity_obj in daily_activity: # <- 이부분 개선이 필요할듯
-        activity = activity_obj["activity"]
-        duration = activity_obj["duration"]
+def get_zone_positions(spatial_data):
+    """구역명 → 유효한 좌표 집합 (LLM이 고른 위치 검증용)"""
+    return {
+        name: {tuple(position) for position in zone["positions"]}
+        for name, zone in spatial_data["zones"].items()
+    }
 
-        
-        prompt = create_location_prompt(persona, activity, duration, current_position, spatial_data)
 
-        llm = ChatOpenAI(
-            temperature=0.8,
-            model = "gpt-4o-mini",
-        )
+def create_zone_table(spatial_data):
+    lines = []
+    for name, zone in spatial_data["zones"].items():
+        if name == "Entrance":  # 출입구는 활동 장소가 아님
+            continue
+        attributes = zone["attributes"]
+        positions = ", ".join(f"[{x},{y}]" for x, y in zone["positions"])
+        lines.append(f"        - {name} / {attributes['function']} / {attributes['capacity']}명 / {positions}")
+    return "\n".join(lines)
+
+
+def is_valid_location(location_info, zone_positions):
+    # LLM 응답이 dict가 아니면(리스트, 문자열 등) 유효하지 않은 위치로 보고 재시도/대체 로직으로 넘김
+    if not isinstance(location_info, dict):
+        return False
+    zone = location_info.get("zone")
+    position = location_info.get("position")
+    if not isinstance(zone, str) or zone not in zone_positions:
+        return False
+    if not isinstance(position, (list, tuple)) or len(position) != 2:
+        return False
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in position):
+        return False
+    return tuple(position) in zone_positions[zone]
+
+
+async def locate_activity(persona, activity, duration, current_position, spatial_data):
+    """활동 하나의 위치를 LLM으로 추천받음"""
+    prompt = create_location_prompt(persona, activity, duration, current_position, spatial_data)
+
+    location_info = await ainvoke_llm(prompt, temperature=0.8)
+
+    location_info = location_info.replace("```json","").replace("```","")
+
+    location_info = json.loads(location_info)
+
+    print("location_info 활동 정보 값",location_info)
+
+    return location_info
 
-        location_info = llm.invoke(prompt).content
 
-        location_info = location_info.replace("```json","").replace("```","")
+async def plan_route_batched(daily_activity, spatial_data, persona, current_position):
+    """하루 전체 활동의 위치를 한 번의 structured output 요청으로 추천받음
 
-        location_info = json.loads(location_info)
+    Returns:
+        활동 순서대로의 location_info 리스트 (응답에 없거나 구역/좌표가 유효하지 않은 활동은 None)
+    """
+    prompt = create_route_prompt(persona, daily_activity, current_position, create_zone_table(spatial_data))
+    zone_positions = get_zone_positions(spatial_data)
+
+    try:
+        async with _llm_semaphore:
+            result = await get_llm(0.8).with_structured_output(RoutePlan).ainvoke(prompt)
+    except Exception as e:
+        print(f"일괄 경로 계획 중 오류: {str(e)}")
+        return [None] * len(daily_activity)
+
+    locations = [None] * len(daily_activity)
+    for location in result.locations:
+        i = location.index - 1
+        location_info = {"zone": location.zone, "position": list(location.position)}
+        if 0 <= i < len(locations) and locations[i] is None and is_valid_location(location_info, zone_positions):
+            locations[i] = location_info
 
-        print("location_info 활동 정보 값",location_info)
+    print(f"일괄 경로 계획: {sum(1 for l in locations if l is not None)}/{len(locations)}개 활동 위치 확정")
+    return locations
+
+
+# spatial_data => data spatial.json 값
+async def plan_daily_route(daily_activity, spatial_data, persona, batched=True):
+    """활동별 위치를 정해서 경로 계획을 생성
 
+    batched=True이면 전체 활동을 한 번의 요청으로 배치하고,
+    유효하지 않은 활동만 활동별 요청으로 다시 추천받습니다.
+    """
+    home = f"{persona.name}_home"
+    current_position = spatial_data["zones"][home]["positions"][0] #시작점
+
+    if not batched:
+        route_plan = []
+        for activity_obj in daily_activity:
+            activity = activity_obj["activity"]
+            duration = activity_obj["duration"]
+
+            location_info = await locate_activity(persona, activity, duration, current_position, spatial_data)
+
+            route_plan.append({
+                "activity" : activity,
+                "location" : location_info["position"],
+                "duration" : duration,
+                "zone" : location_info["zone"]
+            })
+
+            current_position = location_info["position"]
+
+        return route_plan
+
+    locations = await plan_route_batched(daily_activity, spatial_data, persona, current_position)
+
+    # 유효하지 않은 활동만 활동별로 다시 요청 (직전 활동의 확정 위치 기준, 서로 독립이라 동시에 실행)
+    zone_positions = get_zone_positions(spatial_data)
+    previous = {"zone": home, "position": current_position}
+    retries = {}
+    for i, location_info in enumerate(locations):
+        if location_info is None:
+            retries[i] = previous
+        else:
+            previous = location_info
+
+    if retries:
+        results = await asyncio.gather(*[
+            locate_activity(
+                persona,
+                daily_activity[i]["activity"],
+                daily_activity[i]["duration"],
+                retries[i]["position"],
+                spatial_data
+            )
+            for i in retries
+        ], return_exceptions=True)
+
+        for i, result in zip(retries, results):
+            if isinstance(result, Exception) or not is_valid_location(result, zone_positions):
+                print(f"활동 위치 추천 실패, 이전 위치에 머무름: {daily_activity[i]['activity']}")
+                result = retries[i]
+            locations[i] = result
+
+    route_plan = []
+    for activity_obj, location_info in zip(daily_activity, locations):
         route_plan.append({
-            "activity" : activity,
-            "location" : location_info["position"],
-            "duration" : duration,
+            "activity" : activity_obj["activity"],
+            "location" : list(location_info["position"]),
+            "duration" : activity_obj["duration"],
             "zone" : location_info["zone"]
         })
 
-        current_position = location_info["position"]
-
     return route_plan
 
 
@@ -377,6 +494,17 @@ def create_full_schedule(route_plan, spatial_data, persona):
     return complete_schedule
 
 
+_pathfinder = None
+
+
+def get_pathfinder():
+    """맵이 정적이므로 PathFinder(와 경로 테이블)는 프로세스에서 한 번만 생성"""
+    global _pathfinder
+    if _pathfinder is None:
+        _pathfinder = PathFinder(np.array(map_matrix))
+    return _pathfinder
+
+
 def get_path_between_points(start, end, spatial_data):
     """
     spatial.py의 PathFinder를 사용하여 두 점 사이의 경로를 찾습니다.
@@ -389,9 +517,7 @@ def get_path_between_points(start, end, spatial_data):
     Returns:
         path: 경로 좌표 리스트
     """
-    # numpy array로 변환
-    maze_matrix = np.array(map_matrix)
-    pathfinder = PathFinder(maze_matrix)
+    pathfinder = get_pathfinder()
     
     # Position 객체로 변환
     start_pos = Position(start[0], start[1])
@@ -410,98 +536,208 @@ def get_path_between_points(start, end, spatial_data):
 
 
 
-def make_persona_association(personas, user):
-    """페르소나 간의 사회적 관계를 생성합니다."""
-    relationships = {}
+RELATIONSHIP_RETRIES = 3
+
+DEFAULT_RELATIONSHIP = {
+    "relationship_type": "지인",
+    "closeness": 5,
+    "dynamics": "일반적인 관계",
+    "interaction_style": "기본적인 예의를 지키는 관계",
+    "common_activities": ["가벼운 대화"],
+    "potential_conflicts": ["특별한 갈등 없음"]
+}
+
+
+def create_relationship_prompt(persona1, persona2):
+    return f"""
+    당신은 복잡한 인간 관계와 심리를 분석하는 전문가입니다.
+    {persona1.name}의 관점에서 {persona2.name}와의 관계를 분석해주세요.
+
+    관점 주체 ({persona1.name}):
+    {persona1.scratch.get_str_iss()}
+
+    성격: {persona1.scratch.get_str_personality()}
     
-    for persona1 in personas:
-        relationships[persona1.name] = {}
-        for persona2 in personas:
-            if persona1.name != persona2.name:
-                prompt = f"""
-                당신은 복잡한 인간 관계와 심리를 분석하는 전문가입니다.
-                {persona1.name}의 관점에서 {persona2.name}와의 관계를 분석해주세요.
-
-                관점 주체 ({persona1.name}):
-                {persona1.scratch.get_str_iss()}
-
-                성격: {persona1.scratch.get_str_personality()}
-                
-                
-                상대방 ({persona2.name}):
-                {persona2.scratch.get_str_iss()}
+    
+    상대방 ({persona2.name}):
+    {persona2.scratch.get_str_iss()}
 
-                성격: {persona2.scratch.get_str_personality()}
-                
-                
-                다음 사항들을 고려하여 {persona1.name}의 관점에서 관계를 설정해주세요:
-
-                1. {persona1.name}의 성격과 특징이 {persona2.name}를 어떻게 인식하고 평가하는지
-                2. {persona1.name}이 느끼는 친밀도는 {persona2.name}이 느끼는 것과 다를 수 있음
-                3. {persona1.name}의 가치관과 성격에 따라 관계를 바라보는 독특한 시각 반영
-                4. {persona1.name}이 선호하는 상호작용 방식과 활동이 {persona2.name}과 다를 수 있음
-                5. {persona1.name}이 특별히 민감하게 느끼는 갈등 포인트 고려
-
-                예시 차이점:
-                - Joy가 느끼는 Sadness와의 친밀도(8)와 Sadness가 느끼는 Joy와의 친밀도(6)는 다를 수 있음
-                - Anger는 특정 활동을 즐겁게 여기지만, 상대방은 부담스러워할 수 있음
-                - 한 쪽이 멘토 역할이라 생각하지만, 다른 쪽은 동등한 관계로 여길 수 있음
-
-                다음 JSON 형식으로 응답해주세요:
-                {{
-                    "relationship_type": "{persona1.name}이 생각하는 {persona2.name}과의 구체적 관계 유형",
-                    "closeness": "{persona1.name}이 느끼는 친밀도 (1-10)",
-                    "dynamics": "{persona1.name}의 관점에서 바라본 관계 역학",
-                    "interaction_style": "{persona1.name}이 선호하는 {persona2.name}과의 상호작용 방식",
-                    "common_activities": ["{persona1.name}이 {persona2.name}과 하고 싶어하는 활동들"],
-                    "potential_conflicts": ["{persona1.name}이 특히 민감하게 느끼는 갈등 요소들"]
-                }}
-                
-                각 페르소나의 성격과 특성을 깊이 반영하여, 비대칭적이고 독특한 관계를 설정해주세요.
-                JSON 형식만 응답해주세요.
-                """
-                
-                llm = ChatOpenAI(
-                    temperature=1,
-                    model="gpt-4o-mini"
-                )
-                
-                try:
-                    response = llm.invoke(prompt)
-                    # JSON 부분만 추출하기 위한 처리
-                    content = response.content.strip()
-                    if content.startswith('```json'):
-                        content = content.replace('```json', '').replace('```', '').strip()
-                    
-                    relationship_data = json.loads(content)
-                    relationships[persona1.name][persona2.name] = relationship_data
-                    
-                    print(f"\n{persona1.name}와 {persona2.name}의 관계가 생성되었습니다.")
-                    
-                except json.JSONDecodeError as e:
-                    print(f"\nJSON 파싱 오류 ({persona1.name}-{persona2.name}): {e}")
-                    print(f"받은 응답: {response.content}")
-                    # 오류 시 기본 관계 설정
-                    relationships[persona1.name][persona2.name] = {
-                        "relationship_type": "지인",
-                        "closeness": 5,
-                        "dynamics": "일반적인 관계",
-                        "interaction_style": "기본적인 예의를 지키는 관계",
-                        "common_activities": ["가벼운 대화"],
-                        "potential_conflicts": ["특별한 갈등 없음"]
-                    }
+    성격: {persona2.scratch.get_str_personality()}
     
-    # 관계 정보를 파일로 저장
-    relationship_path = f"memory_storage/{user['uid']}/relationships.json"
-    with open(relationship_path, 'w', encoding='utf-8') as f:
-        json.dump(relationships, f, ensure_ascii=False, indent=2)
     
-    # 각 페르소나의 관계 정보 업데이트
-    for persona in personas:
-        persona.load_relationships(user['uid'])
+    다음 사항들을 고려하여 {persona1.name}의 관점에서 관계를 설정해주세요:
+
+    1. {persona1.name}의 성격과 특징이 {persona2.name}를 어떻게 인식하고 평가하는지
+    2. {persona1.name}이 느끼는 친밀도는 {persona2.name}이 느끼는 것과 다를 수 있음
+    3. {persona1.name}의 가치관과 성격에 따라 관계를 바라보는 독특한 시각 반영
+    4. {persona1.name}이 선호하는 상호작용 방식과 활동이 {persona2.name}과 다를 수 있음
+    5. {persona1.name}이 특별히 민감하게 느끼는 갈등 포인트 고려
+
+    예시 차이점:
+    - Joy가 느끼는 Sadness와의 친밀도(8)와 Sadness가 느끼는 Joy와의 친밀도(6)는 다를 수 있음
+    - Anger는 특정 활동을 즐겁게 여기지만, 상대방은 부담스러워할 수 있음
+    - 한 쪽이 멘토 역할이라 생각하지만, 다른 쪽은 동등한 관계로 여길 수 있음
+
+    다음 JSON 형식으로 응답해주세요:
+    {{
+        "relationship_type": "{persona1.name}이 생각하는 {persona2.name}과의 구체적 관계 유형",
+        "closeness": "{persona1.name}이 느끼는 친밀도 (1-10)",
+        "dynamics": "{persona1.name}의 관점에서 바라본 관계 역학",
+        "interaction_style": "{persona1.name}이 선호하는 {persona2.name}과의 상호작용 방식",
+        "common_activities": ["{persona1.name}이 {persona2.name}과 하고 싶어하는 활동들"],
+        "potential_conflicts": ["{persona1.name}이 특히 민감하게 느끼는 갈등 요소들"]
+    }}
     
-    return relationships
+    각 페르소나의 성격과 특성을 깊이 반영하여, 비대칭적이고 독특한 관계를 설정해주세요.
+    JSON 형식만 응답해주세요.
+    """
+
+
+def create_relationship_batch_prompt(persona1, others):
+    other_profiles = "\n".join(
+        f"""
+    상대방 ({other.name}):
+    {other.scratch.get_str_iss()}
+
+    성격: {other.scratch.get_str_personality()}
+"""
+        for other in others
+    )
+    other_names = ", ".join(other.name for other in others)
+
+    return f"""
+    당신은 복잡한 인간 관계와 심리를 분석하는 전문가입니다.
+    {persona1.name}의 관점에서 {other_names} 각각과의 관계를 분석해주세요.
 
+    관점 주체 ({persona1.name}):
+    {persona1.scratch.get_str_iss()}
 
+    성격: {persona1.scratch.get_str_personality()}
 
+    {other_profiles}
 
+    다음 사항들을 고려하여 {persona1.name}의 관점에서 각 상대방과의 관계를 설정해주세요:
+
+    1. {persona1.name}의 성격과 특징이 각 상대방을 어떻게 인식하고 평가하는지
+    2. {persona1.name}이 느끼는 친밀도는 상대방이 느끼는 것과 다를 수 있음
+    3. {persona1.name}의 가치관과 성격에 따라 관계를 바라보는 독특한 시각 반영
+    4. {persona1.name}이 선호하는 상호작용 방식과 활동이 상대방마다 다를 수 있음
+    5. {persona1.name}이 특별히 민감하게 느끼는 갈등 포인트 고려
+
+    상대방 이름을 키로 하는 다음 JSON 형식으로 응답해주세요:
+    {{
+        "상대방 이름": {{
+            "relationship_type": "{persona1.name}이 생각하는 상대방과의 구체적 관계 유형",
+            "closeness": "{persona1.name}이 느끼는 친밀도 (1-10)",
+            "dynamics": "{persona1.name}의 관점에서 바라본 관계 역학",
+            "interaction_style": "{persona1.name}이 선호하는 상대방과의 상호작용 방식",
+            "common_activities": ["{persona1.name}이 상대방과 하고 싶어하는 활동들"],
+            "potential_conflicts": ["{persona1.name}이 특히 민감하게 느끼는 갈등 요소들"]
+        }}
+    }}
+
+    각 페르소나의 성격과 특성을 깊이 반영하여, 비대칭적이고 독특한 관계를 설정해주세요.
+    JSON 형식만 응답해주세요.
+    """
+
+
+def parse_relationship_response(content):
+    # JSON 부분만 추출하기 위한 처리
+    content = content.strip()
+    if content.startswith('```json'):
+        content = content.replace('```json', '').replace('```', '').strip()
+    return json.loads(content)
+
+
+async def ainvoke_json_with_retry(prompt, label, temperature=1, retries=RELATIONSHIP_RETRIES):
+    """LLM 응답을 JSON으로 파싱, 실패하면 지수 백오프로 재시도 (모두 실패하면 None)"""
+    for attempt in range(retries):
+        try:
+            return parse_relationship_response(await ainvoke_llm(prompt, temperature=temperature))
+        except Exception as e:
+            print(f"\n관계 생성 오류 ({label}, {attempt + 1}/{retries}회): {e}")
+            if attempt < retries - 1:
+                await asyncio.sleep(2 ** attempt)
+    return None
+
+
+def load_relationships(uid):
+    """저장된 관계 정보 (중간에 중단된 경우 완료된 쌍만 들어 있음)"""
+    return state_store.get_relationships(uid)
+
+
+def missing_relationship_pairs(personas, relationships):
+    return [
+        (persona1, persona2)
+        for persona1 in personas
+        for persona2 in personas
+        if persona1.name != persona2.name and persona2.name not in relationships.get(persona1.name, {})
+    ]
+
+
+async def make_persona_association(personas, user, batched=False):
+    """페르소나 간의 사회적 관계를 생성합니다.
+
+    관계 쌍은 동시에 생성되고(동시 요청 수는 LLM_CONCURRENCY로 제한) 완료될 때마다
+    상태 저장소에 저장되므로, 중간에 중단돼도 다음 호출에서 남은 쌍만 생성합니다.
+    batched=True이면 페르소나 한 명의 관점에서 나머지 모두와의 관계를 한 번에 요청합니다.
+    """
+    uid = user['uid']
+    # 상태 저장소 호출은 SQLite I/O가 있으므로 이벤트 루프를 막지 않도록 스레드에서 실행
+    relationships = await asyncio.to_thread(load_relationships, uid)
+    for persona in personas:
+        relationships.setdefault(persona.name, {})
+
+    missing = missing_relationship_pairs(personas, relationships)
+    failed = []
+
+    async def save_pairs(pairs):
+        # 완료된 쌍만 행 단위로 저장
+        await asyncio.to_thread(state_store.set_relationships, uid, [
+            (persona1.name, persona2.name, relationship_data)
+            for (persona1, persona2), relationship_data in pairs
+        ])
+        for (persona1, persona2), relationship_data in pairs:
+            relationships[persona1.name][persona2.name] = relationship_data
+            print(f"\n{persona1.name}와 {persona2.name}의 관계가 생성되었습니다.")
+
+    async def make_pair(persona1, persona2):
+        relationship_data = await ainvoke_json_with_retry(
+            create_relationship_prompt(persona1, persona2),
+            f"{persona1.name}-{persona2.name}"
+        )
+        if relationship_data is None:
+            failed.append((persona1, persona2))
+        else:
+            await save_pairs([((persona1, persona2), relationship_data)])
+
+    async def make_view(persona1, others):
+        views = await ainvoke_json_with_retry(
+            create_relationship_batch_prompt(persona1, others),
+            f"{persona1.name}-*"
+        )
+        views = views if isinstance(views, dict) else {}
+        done = [((persona1, other), views[other.name]) for other in others if isinstance(views.get(other.name), dict)]
+        if done:
+            await save_pairs(done)
+        # 응답에서 빠진 상대방은 쌍별로 다시 요청
+        done_names = {other.name for (_, other), _ in done}
+        await asyncio.gather(*[make_pair(persona1, other) for other in others if other.name not in done_names])
+
+    if batched:
+        others_by_persona = {}
+        for persona1, persona2 in missing:
+            others_by_persona.setdefault(persona1.name, (persona1, []))[1].append(persona2)
+        await asyncio.gather(*[make_view(persona1, others) for persona1, others in others_by_persona.values()])
+    else:
+        await asyncio.gather(*[make_pair(persona1, persona2) for persona1, persona2 in missing])
+
+    # 끝내 실패한 쌍은 기본 관계로 사용하되 저장하지 않음 (다음 호출에서 다시 생성)
+    for persona1, persona2 in failed:
+        relationships[persona1.name][persona2.name] = dict(DEFAULT_RELATIONSHIP)
+
+    # 각 페르소나의 관계 정보 업데이트
+    for persona in personas:
+        persona.relationships = relationships.get(persona.name, {})
+    
+    return relationships
@@ -0,0 +1,125 @@
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# 출발점별 BFS 트리를 기억해 둘 최대 개수 (트리 하나는 이동 가능한 칸 수만큼의 int32 배열 2개)
+ROUTE_CACHE_SIZE = 512
+
+UNREACHABLE = -1
+
+
+def map_hash(maze: np.ndarray) -> str:
+    """맵 모양과 셀 값으로 만든 해시 (같은 맵이면 항상 같은 값)"""
+    maze = np.ascontiguousarray(maze, dtype=np.int64)
+    digest = hashlib.sha256()
+    digest.update(f"{maze.shape}".encode("utf-8"))
+    digest.update(maze.tobytes())
+    return digest.hexdigest()
+
+
+class RouteTable:
+    """정적인 맵의 최단 경로 조회
+
+    처음 조회된 출발점에서만 BFS를 한 번 돌려(이동 비용이 모두 1이므로 다익스트라와 같은 결과)
+    그 출발점의 이전 칸(predecessor)과 거리 배열을 LRU 캐시에 보관합니다.
+    같은 출발점의 이후 조회는 이전 칸을 따라가기만 하면 되므로 경로 길이에 비례합니다.
+    메모리는 O(이동 가능한 칸 수 × ROUTE_CACHE_SIZE)로 제한됩니다.
+    """
+
+    def __init__(self, maze: np.ndarray, movement_cost: Callable[[int, int], Optional[int]],
+                 cache_size: int = ROUTE_CACHE_SIZE):
+        rows, cols = maze.shape
+        self.cells = np.argwhere(maze != 1)  # (N, 2) 이동 가능한 칸의 (x, y)
+        self._index = {(int(x), int(y)): i for i, (x, y) in enumerate(self.cells)}
+        self.cache_size = cache_size
+        self._trees = OrderedDict()  # 출발 인덱스 → (predecessors, distances)
+        self._lock = threading.Lock()
+
+        # 인접 리스트 (PathFinder.get_neighbors와 같은 이동 규칙)
+        self._neighbors: List[List[int]] = []
+        for x, y in self.cells:
+            adjacent = []
+            for dx, dy in ((0, 1), (1, 0), (0, -1), (-1, 0)):
+                new_x, new_y = x + dx, y + dy
+                if not (0 <= new_x < rows and 0 <= new_y < cols):
+                    continue
+                if maze[new_x, new_y] == 1:
+                    continue
+                if movement_cost(maze[x, y], maze[new_x, new_y]) is not None:
+                    adjacent.append(self._index[(int(new_x), int(new_y))])
+            self._neighbors.append(adjacent)
+
+    def _bfs(self, source: int) -> Tuple[np.ndarray, np.ndarray]:
+        size = len(self.cells)
+        pred = np.full(size, UNREACHABLE, dtype=np.int32)
+        dist = np.full(size, UNREACHABLE, dtype=np.int32)
+        pred[source] = source
+        dist[source] = 0
+        queue = deque([source])
+        while queue:
+            current = queue.popleft()
+            for next_cell in self._neighbors[current]:
+                if dist[next_cell] == UNREACHABLE:
+                    dist[next_cell] = dist[current] + 1
+                    pred[next_cell] = current
+                    queue.append(next_cell)
+        return pred, dist
+
+    def _tree(self, source: int) -> Tuple[np.ndarray, np.ndarray]:
+        with self._lock:
+            tree = self._trees.get(source)
+            if tree is not None:
+                self._trees.move_to_end(source)
+                return tree
+        tree = self._bfs(source)
+        with self._lock:
+            self._trees[source] = tree
+            while len(self._trees) > self.cache_size:
+                self._trees.popitem(last=False)
+        return tree
+
+    def has_cell(self, x: int, y: int) -> bool:
+        return (x, y) in self._index
+
+    def distance(self, start: Tuple[int, int], end: Tuple[int, int]) -> Optional[int]:
+        """두 칸 사이의 최단 이동 비용 (캐시된 출발점이면 O(1), 도달 불가면 None)"""
+        source = self._index.get(start)
+        target = self._index.get(end)
+        if source is None or target is None:
+            return None
+        cost = int(self._tree(source)[1][target])
+        return None if cost == UNREACHABLE else cost
+
+    def path(self, start: Tuple[int, int], end: Tuple[int, int]) -> Optional[Tuple[List[Tuple[int, int]], int]]:
+        """두 칸 사이의 최단 경로와 비용 (도달 불가면 None)"""
+        source = self._index.get(start)
+        target = self._index.get(end)
+        if source is None or target is None:
+            return None
+        pred, dist = self._tree(source)
+        if dist[target] == UNREACHABLE:
+            return None
+
+        cells = [target]
+        while cells[-1] != source:
+            cells.append(int(pred[cells[-1]]))
+        cells.reverse()
+        return [(int(self.cells[i][0]), int(self.cells[i][1])) for i in cells], len(cells) - 1
+
+
+_tables: Dict[str, RouteTable] = {}
+_tables_lock = threading.Lock()
+
+
+def get_route_table(maze: np.ndarray, movement_cost: Callable[[int, int], Optional[int]]) -> RouteTable:
+    """맵 해시별 경로 조회 객체 (같은 맵을 쓰는 PathFinder끼리 BFS 캐시를 공유)"""
+    key = map_hash(maze)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = RouteTable(maze, movement_cost)
+            _tables[key] = table
+        return table
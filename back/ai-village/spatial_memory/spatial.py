@@ -4,7 +4,11 @@ from dataclasses import dataclass
 import json
 from collections import defaultdict
 import heapq
+import hashlib
+import threading
+from itertools import combinations
 from .maze import *
+from .routing import get_route_table
 # from maze import map_matrix, zone_labels
 
 import sys
@@ -43,6 +47,14 @@ class PathFinder:
     def __init__(self, maze_matrix: np.ndarray):
         self.maze = maze_matrix
         self.rows, self.cols = maze_matrix.shape
+        self._routes = None
+
+    @property
+    def routes(self):
+        # 경로 조회 객체는 처음 경로를 찾을 때 만들고, 출발점별 BFS는 조회될 때마다 계산해 캐시
+        if self._routes is None:
+            self._routes = get_route_table(self.maze, self.calculate_movement_cost)
+        return self._routes
         
     def get_neighbors(self, pos: Position) -> List[Tuple[Position, int]]:
         """주어진 위치에서 이동 가능한 이웃 위치들을 반환"""
@@ -97,15 +109,38 @@ class PathFinder:
         return None
 
     def find_shortest_path(self, start: Position, end: Position) -> Optional[Tuple[List[Position], int]]:
+        """최단 경로 탐색 (출발점별 BFS 캐시 조회, 이동 가능한 칸이 아니면 다익스트라)"""
+        start_cell = (int(start.x), int(start.y))
+        end_cell = (int(end.x), int(end.y))
+        if self.routes.has_cell(*start_cell) and self.routes.has_cell(*end_cell):
+            result = self.routes.path(start_cell, end_cell)
+            if result is None:
+                return None
+            cells, cost = result
+            return [Position(x, y) for x, y in cells], cost
+
+        return self.find_shortest_path_dijkstra(start, end)
+
+    def get_distance(self, start: Position, end: Position) -> Optional[int]:
+        """두 위치 사이의 최단 이동 비용 (경로를 만들지 않고 BFS 거리에서 바로 조회)"""
+        return self.routes.distance((int(start.x), int(start.y)), (int(end.x), int(end.y)))
+
+    def find_shortest_path_dijkstra(self, start: Position, end: Position) -> Optional[Tuple[List[Position], int]]:
         """다익스트라 알고리즘을 사용한 최단 경로 탐색"""
-        # 우선순위 큐 초기화
-        queue = [(0, start, [start])]
+        # 우선순위 큐 초기화 (경로는 이전 위치만 기록했다가 마지막에 복원)
+        queue = [(0, start)]
+        previous = {start: None}
+        costs = {start: 0}
         visited = set()
         
         while queue:
-            cost, current, path = heapq.heappop(queue)
+            cost, current = heapq.heappop(queue)
             
             if current == end:
+                path = [current]
+                while previous[path[-1]] is not None:
+                    path.append(previous[path[-1]])
+                path.reverse()
                 return path, cost
                 
             if current in visited:
@@ -115,19 +150,43 @@ class PathFinder:
             
             # 이웃 노드 탐색
             for next_pos, move_cost in self.get_neighbors(current):
-                if next_pos not in visited:
-                    new_cost = cost + move_cost
-                    new_path = path + [next_pos]
-                    heapq.heappush(queue, (new_cost, next_pos, new_path))
+                new_cost = cost + move_cost
+                if next_pos not in visited and new_cost < costs.get(next_pos, float('inf')):
+                    costs[next_pos] = new_cost
+                    previous[next_pos] = current
+                    heapq.heappush(queue, (new_cost, next_pos))
         
         return None
 
+# export 형식이 바뀌면 올려서 공유 spatial.json을 다시 생성
+SPATIAL_EXPORT_VERSION = 1
+SHARED_SPATIAL_DIR = "memory_storage/spatial"
+
+
+def spatial_version(map_matrix, zone_labels) -> str:
+    """맵과 구역 라벨로 만든 버전 키 (맵이 바뀌면 값이 바뀜)"""
+    digest = hashlib.sha256()
+    digest.update(f"v{SPATIAL_EXPORT_VERSION}".encode("utf-8"))
+    digest.update(np.ascontiguousarray(np.array(map_matrix), dtype=np.int64).tobytes())
+    digest.update(json.dumps(sorted((int(k), v) for k, v in zone_labels.items())).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
 class SpatialMemory:
     def __init__(self, map_matrix: List[List[int]], zone_labels: Dict[int, str]):
         self.map_matrix = np.array(map_matrix)
+        # 여러 페르소나/요청이 같은 인스턴스를 공유하므로 맵 배열은 읽기 전용
+        self.map_matrix.setflags(write=False)
         self.zone_labels = zone_labels
+        self.version = spatial_version(map_matrix, zone_labels)
         self.zones: Dict[int, Zone] = {}
+        self.zone_distances: Dict[Tuple[int, int], Optional[int]] = {}
         self.pathfinder = PathFinder(self.map_matrix)
+        # 각 칸의 상하좌우 이웃 값 (4, rows, cols), 맵 밖은 -1
+        padded = np.pad(self.map_matrix, 1, constant_values=-1)
+        self.neighbor_values = np.stack([padded[1:-1, 2:], padded[1:-1, :-2], padded[2:, 1:-1], padded[:-2, 1:-1]])
+        self.neighbor_values.setflags(write=False)
+        self.zone_cells: Dict[int, np.ndarray] = {}
         self.initialize_spatial_memory()
     
     def get_zone_center(self, zone_id: int) -> Optional[Position]:
@@ -151,6 +210,13 @@ class SpatialMemory:
 
     def initialize_spatial_memory(self):
         """맵의 공간 정보를 분석하고 초기화"""
+        # 맵을 한 번만 정렬해서 구역별 칸 인덱스로 나눔 (stable 정렬이라 행 우선 순서 유지)
+        flat = self.map_matrix.ravel()
+        order = np.argsort(flat, kind="stable")
+        values, starts = np.unique(flat[order], return_index=True)
+        for value, cells in zip(values, np.split(order, starts[1:])):
+            self.zone_cells[int(value)] = np.column_stack(np.unravel_index(cells, self.map_matrix.shape))
+
         # 각 구역별 정보 수집
         for zone_id, zone_name in self.zone_labels.items():
             if zone_id in [0, 1]:  # 경로와 벽은 제외
@@ -172,40 +238,41 @@ class SpatialMemory:
                 attributes=attributes
             )
 
+    def _zone_coordinates(self, zone_id: int) -> np.ndarray:
+        cells = self.zone_cells.get(zone_id)
+        if cells is None:
+            cells = np.argwhere(self.map_matrix == zone_id)
+        return cells
+
     def find_zone_positions(self, zone_id: int) -> List[Position]:
         """특정 구역의 모든 위치 찾기"""
-        positions = []
-        for i in range(self.map_matrix.shape[0]):
-            for j in range(self.map_matrix.shape[1]):
-                if self.map_matrix[i, j] == zone_id:
-                    positions.append(Position(i, j))
-        return positions
-
-    def find_zone_entrances(self, positions: List[Position]) -> List[Position]:
+        return [Position(int(x), int(y)) for x, y in self._zone_coordinates(zone_id)]
+
+    def _neighbors_of(self, positions: List[Position]):
+        """위치들의 좌표 배열과 상하좌우 이웃 값 (4, n)"""
+        xs = np.fromiter((p.x for p in positions), dtype=np.int64, count=len(positions))
+        ys = np.fromiter((p.y for p in positions), dtype=np.int64, count=len(positions))
+        return xs, ys, self.neighbor_values[:, xs, ys]
+
+    def find_zone_entrances(self, positions: List[Position]) -> List[Tuple[int, int]]:
         """구역의 출입구 위치 찾기"""
-        entrances = []
-        for pos in positions:
-            # 인접한 셀 확인
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                new_x, new_y = pos.x + dx, pos.y + dy
-                if (0 <= new_x < self.map_matrix.shape[0] and 
-                    0 <= new_y < self.map_matrix.shape[1] and 
-                    self.map_matrix[new_x, new_y] == 8):  # 8은 출입구
-                    entrances.append(Position(new_x, new_y))
-        return list(set([(e.x, e.y) for e in entrances]))  # 중복 제거
+        if not positions:
+            return []
+        xs, ys, neighbors = self._neighbors_of(positions)
+        entrances = set()
+        for (dx, dy), values in zip([(0, 1), (0, -1), (1, 0), (-1, 0)], neighbors):
+            hits = values == 8  # 8은 출입구
+            entrances.update(zip((xs[hits] + dx).tolist(), (ys[hits] + dy).tolist()))
+        return sorted(entrances)
 
     def find_connected_zones(self, positions: List[Position]) -> List[int]:
         """연결된 구역 찾기"""
-        connected = set()
-        for pos in positions:
-            for dx, dy in [(0, 1), (0, -1), (1, 0), (-1, 0)]:
-                new_x, new_y = pos.x + dx, pos.y + dy
-                if (0 <= new_x < self.map_matrix.shape[0] and 
-                    0 <= new_y < self.map_matrix.shape[1]):
-                    value = self.map_matrix[new_x, new_y]
-                    if value not in [0, 1] and value != self.map_matrix[pos.x, pos.y]:
-                        connected.add(value)
-        return list(connected)
+        if not positions:
+            return []
+        xs, ys, neighbors = self._neighbors_of(positions)
+        own = self.map_matrix[xs, ys]
+        connected = (neighbors > 1) & (neighbors != own)  # 맵 밖(-1), 길(0), 벽(1), 같은 구역 제외
+        return [int(z) for z in np.unique(neighbors[connected])]
 
     def define_zone_attributes(self, zone_id: int, zone_name: str) -> Dict[str, any]:
         """구역별 특성 정의"""
@@ -219,7 +286,7 @@ class SpatialMemory:
 
     def estimate_zone_capacity(self, zone_id: int) -> int:
         """구역의 수용 능력 추정"""
-        zone_size = np.sum(self.map_matrix == zone_id)
+        zone_size = len(self._zone_coordinates(zone_id))
         # 간단한 수용력 계산 (구역 크기에 비례)
         return max(1, zone_size // 2)
     
@@ -257,6 +324,18 @@ class SpatialMemory:
             return self.optimize_path(path), cost
         return None
     
+    def get_zone_distance(self, start_zone: int, end_zone: int) -> Optional[int]:
+        """두 구역 중심점 사이의 최단 이동 비용 (구역 쌍별로 한 번만 조회)"""
+        key = (start_zone, end_zone)
+        if key not in self.zone_distances:
+            start_center = self.get_zone_center(start_zone)
+            end_center = self.get_zone_center(end_zone)
+            if not start_center or not end_center:
+                self.zone_distances[key] = None
+            else:
+                self.zone_distances[key] = self.pathfinder.get_distance(start_center, end_center)
+        return self.zone_distances[key]
+    
     def optimize_path(self, path: List[Position]) -> List[Position]:
         """경로 최적화"""
         if len(path) <= 2:
@@ -382,25 +461,26 @@ class SpatialMemory:
             }
 
         # 길(0)과 벽(1)의 위치 정보 저장
-        for i in range(self.map_matrix.shape[0]):
-            for j in range(self.map_matrix.shape[1]):
-                if self.map_matrix[i, j] == 0:  # 길
-                    export_data["paths"]["positions"].append([int(i), int(j)])
-                elif self.map_matrix[i, j] == 1:  # 벽
-                    export_data["walls"]["positions"].append([int(i), int(j)])
+        export_data["paths"]["positions"] = self._zone_coordinates(0).tolist()
+        export_data["walls"]["positions"] = self._zone_coordinates(1).tolist()
 
         # 연결성 정보 추가
         export_data["paths"]["connections"] = self._analyze_path_connections()
         
         # 디렉토리가 없으면 생성
-        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
         
+        # 임시 파일에 다 쓴 뒤 교체해서, 동시에 읽거나 중간에 죽어도 잘린 파일이 남지 않게 함
+        tmp_filename = f"{filename}.{os.getpid()}.{threading.get_ident()}.tmp"
         try:
-            with open(filename, 'w', encoding='utf-8') as f:
+            with open(tmp_filename, 'w', encoding='utf-8') as f:
                 json.dump(export_data, f, indent=2)
+            os.replace(tmp_filename, filename)
             print(f"Successfully exported spatial memory to {filename}")
         except Exception as e:
             print(f"Error exporting spatial memory: {str(e)}")
+            if os.path.exists(tmp_filename):
+                os.remove(tmp_filename)
 
     def _analyze_path_connections(self) -> Dict:
         """길의 연결성 분석"""
@@ -408,44 +488,30 @@ class SpatialMemory:
             "zone_connections": [],
             "intersection_points": []
         }
-        
-        # 길과 구역들 사이의 연결점 찾기
-        for i in range(self.map_matrix.shape[0]):
-            for j in range(self.map_matrix.shape[1]):
-                if self.map_matrix[i, j] == 0:  # 길인 경우
-                    adjacent_zones = set()
-                    is_intersection = False
-                    path_count = 0
-                    
-                    # 인접 셀 확인
-                    for di, dj in [(0, 1), (1, 0), (0, -1), (-1, 0)]:
-                        ni, nj = i + di, j + dj
-                        if (0 <= ni < self.map_matrix.shape[0] and 
-                            0 <= nj < self.map_matrix.shape[1]):
-                            cell_value = self.map_matrix[ni, nj]
-                            if cell_value > 1:  # 구역
-                                adjacent_zones.add(int(cell_value))
-                            elif cell_value == 0:  # 길
-                                path_count += 1
-                    
-                    # 3개 이상의 길이 만나는 지점을 교차점으로 간주
-                    if path_count >= 3:
-                        is_intersection = True
-                        connections["intersection_points"].append([int(i), int(j)])
-                    
-                    # 두 개 이상의 구역과 연결된 경우 연결정보 저장
-                    if len(adjacent_zones) >= 2:
-                        zones = sorted(list(adjacent_zones))
-                        for z1 in zones:
-                            for z2 in zones:
-                                if z1 < z2:
-                                    connections["zone_connections"].append({
-                                        "zones": [
-                                            self.zone_labels[z1],
-                                            self.zone_labels[z2]
-                                        ],
-                                        "connection_point": [int(i), int(j)]
-                                    })
+        is_path = self.map_matrix == 0
+
+        # 3개 이상의 길이 만나는 지점을 교차점으로 간주
+        path_count = (self.neighbor_values == 0).sum(axis=0)
+        connections["intersection_points"] = np.argwhere(is_path & (path_count >= 3)).tolist()
+
+        # 길과 구역들 사이의 연결점 찾기: 구역별로 "이웃에 이 구역이 있는 칸" 마스크를 만들고
+        # 두 개 이상의 구역과 맞닿은 길 칸에 대해서만 구역 쌍을 만듦
+        zone_ids = [int(z) for z in np.unique(self.map_matrix) if z > 1]
+        if not zone_ids:
+            return connections
+        adjacent = np.stack([(self.neighbor_values == z).any(axis=0) for z in zone_ids])
+        candidates = np.argwhere(is_path & (adjacent.sum(axis=0) >= 2))
+
+        for i, j in candidates.tolist():
+            zones = [zone_ids[k] for k in np.flatnonzero(adjacent[:, i, j])]
+            for z1, z2 in combinations(zones, 2):
+                connections["zone_connections"].append({
+                    "zones": [
+                        self.zone_labels[z1],
+                        self.zone_labels[z2]
+                    ],
+                    "connection_point": [i, j]
+                })
         
         return connections
 
@@ -519,6 +585,49 @@ class SpatialMemory:
             return self.zone_labels[zone_index]
         return "unknown"  # 좌표가 맵 범위를 벗어난 경우
 
+_spatial_memories: Dict[str, "SpatialMemory"] = {}
+_spatial_data: Dict[str, Dict] = {}
+_spatial_lock = threading.Lock()
+
+
+def get_spatial_memory(map_matrix: List[List[int]] = map_matrix, zone_labels: Dict[int, str] = zone_labels) -> SpatialMemory:
+    """맵 버전별로 프로세스에서 하나만 만드는 공유 SpatialMemory (읽기 전용으로 사용)"""
+    version = spatial_version(map_matrix, zone_labels)
+    with _spatial_lock:
+        spatial_memory = _spatial_memories.get(version)
+        if spatial_memory is None:
+            spatial_memory = SpatialMemory(map_matrix, zone_labels)
+            _spatial_memories[version] = spatial_memory
+        return spatial_memory
+
+
+def get_spatial_data(map_matrix: List[List[int]] = map_matrix, zone_labels: Dict[int, str] = zone_labels) -> Dict:
+    """공유 spatial.json 내용 (맵 버전별로 memory_storage/spatial/{version}.json에 한 번만 생성)
+
+    모든 페르소나가 같은 dict를 공유하므로 수정하지 말고 읽기만 해야 합니다.
+    """
+    spatial_memory = get_spatial_memory(map_matrix, zone_labels)
+    version = spatial_memory.version
+    with _spatial_lock:
+        spatial_data = _spatial_data.get(version)
+        if spatial_data is not None:
+            return spatial_data
+
+        filepath = os.path.join(SHARED_SPATIAL_DIR, f"{version}.json")
+        spatial_data = None
+        if os.path.exists(filepath):
+            try:
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    spatial_data = json.load(f)
+            except json.JSONDecodeError as e:
+                print(f"손상된 공간 정보 캐시를 다시 생성합니다 ({filepath}): {str(e)}")
+        if spatial_data is None:
+            spatial_memory.export_spatial_memory(filepath)
+            with open(filepath, 'r', encoding='utf-8') as f:
+                spatial_data = json.load(f)
+        _spatial_data[version] = spatial_data
+        return spatial_data
+
 # # 사용 예시
 # def main():
 #     spatial_memory = SpatialMemory(map_matrix, zone_labels)
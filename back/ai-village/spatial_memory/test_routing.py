@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from spatial_memory.maze import map_matrix
+from spatial_memory.routing import RouteTable
+from spatial_memory.spatial import PathFinder, Position
+
+
+def make_finder():
+    return PathFinder(np.array(map_matrix))
+
+
+def test_route_table_is_built_on_first_use():
+    finder = make_finder()
+    assert finder._routes is None
+    finder.get_distance(Position(0, 0), Position(0, 0))
+    assert finder._routes is not None
+
+
+def test_costs_match_dijkstra():
+    finder = make_finder()
+    cells = [Position(int(x), int(y)) for x, y in np.argwhere(finder.maze != 1)]
+    rng = random.Random(0)
+    for _ in range(500):
+        start, end = rng.choice(cells), rng.choice(cells)
+        expected = finder.find_shortest_path_dijkstra(start, end)
+        result = finder.find_shortest_path(start, end)
+        if expected is None:
+            assert result is None
+            assert finder.get_distance(start, end) is None
+            continue
+        path, cost = result
+        assert cost == expected[1]
+        assert finder.get_distance(start, end) == expected[1]
+        assert path[0] == start and path[-1] == end
+        for a, b in zip(path, path[1:]):
+            assert abs(a.x - b.x) + abs(a.y - b.y) == 1
+
+
+def test_tree_cache_is_bounded():
+    finder = make_finder()
+    table = RouteTable(finder.maze, finder.calculate_movement_cost, cache_size=4)
+    cells = [(int(x), int(y)) for x, y in table.cells]
+    for cell in cells[:10]:
+        table.distance(cell, cells[0])
+    assert len(table._trees) == 4
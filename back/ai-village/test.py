@@ -5,6 +5,7 @@ from spatial_memory.spatial import *
 from spatial_memory.maze import *
 from langchain_openai import ChatOpenAI
 from dotenv import load_dotenv
+import asyncio
 
 
 load_dotenv()
@@ -15,17 +16,15 @@ user = json.load(open('test.json'))
 joy_persona = Persona("Joy" , user)
 
 # 페르소나 스케쥴 생성
-joy_persona.plan("Joy",True, user)
+asyncio.run(joy_persona.plan("Joy",True, user))
 
 
 
 print(joy_persona.scratch.daily_req)
 
-daily_plan_hourly(joy_persona , user)
+asyncio.run(daily_plan_hourly(joy_persona , user))
 
-joy_data = json.load(open(f"memory_storage/{user['uid']}/Joy/scratch.json"))
-
-daily_schedule_hourlry = joy_data["daily_req_hourly"]
+daily_schedule_hourlry = state_store.get_scratch_field(user['uid'], "Joy", "daily_req_hourly", [])
 
 daily_activity = []
 
@@ -35,9 +34,9 @@ for activity in daily_schedule_hourlry:
 for d in daily_activity:
     print(d)
 
-spatial_data = json.load(open(f"memory_storage/{user['uid']}/Joy/spatial.json"))
+spatial_data = get_spatial_data()
 
-route_plan = plan_daily_route(daily_activity , spatial_data , joy_persona)
+route_plan = asyncio.run(plan_daily_route(daily_activity , spatial_data , joy_persona))
 
 print(route_plan)
 
@@ -27,6 +27,8 @@ import hashlib
 import json
 
 from persona import Persona
+from memory_structure.state_store import state_store
+from memory_structure.document_store import ParentDocumentStore
 PERSIST_DIRECTORY = "./chroma_db"
 STORE_DIRECTORY = "./doc_store"  # parent documents를 저장할 디렉토리
 
@@ -38,63 +40,76 @@ def create_stable_hash(content: str) -> str:
     """안정적인 해시 값을 생성합니다."""
     return hashlib.sha256(content.encode()).hexdigest()
 
-def get_stored_ids(store_dir: str) -> set:
-    """저장소 디렉토리에서 현재 저장된 모든 parent ID를 가져옵니다."""
-    stored_ids = set()
-    if os.path.exists(store_dir):
-        for filename in os.listdir(store_dir):
-            if filename.endswith('.bin'):
-                stored_ids.add(filename[:-4])  # .bin 제외한 ID
-    return stored_ids
-
 def process_and_store_documents(docs, vectorstore, store, user_id, persona_name):
     """문서를 처리하고 parent ID를 포함하여 저장합니다."""
     parent_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
     child_splitter = RecursiveCharacterTextSplitter(chunk_size=100, chunk_overlap=10)
     
     vector_docs = []
-    existing_ids = get_stored_ids(STORE_DIRECTORY)
+    user_store = store.for_user(user_id)
     
+    # Parent 문서로 분할 (parent ID에 사용자 ID와 페르소나 이름 포함)
+    parents = []
     for doc in docs:
-        # Parent 문서로 분할
-        parent_chunks = parent_splitter.split_documents([doc])
-        
-        for i, parent_chunk in enumerate(parent_chunks):
-            # parent ID에 사용자 ID와 페르소나 이름 포함
+        for i, parent_chunk in enumerate(parent_splitter.split_documents([doc])):
             parent_id = f"parent_{user_id}_{persona_name}_{create_stable_hash(parent_chunk.page_content)}_{i}"
-            
-            if parent_id in existing_ids:
-                continue
-            
-            store.mset([(parent_id, pickle.dumps(parent_chunk))])
-            
-            child_chunks = child_splitter.split_documents([parent_chunk])
-            
-            for child_chunk in child_chunks:
-                metadata = {
-                    "parent_id": parent_id,
-                    "user_id": user_id,
-                    "persona_name": persona_name,
-                    "original_source": doc.metadata.get("source", "unknown"),
-                    "chunk_type": "child"
-                }
-                child_chunk.metadata = metadata  # update 대신 직접 할당
-                vector_docs.append(child_chunk)
+            parents.append((doc, parent_id, parent_chunk))
+    
+    # 이미 저장된 parent는 인덱스 조회 한 번으로 걸러냄
+    existing_ids = user_store.existing_keys([parent_id for _, parent_id, _ in parents])
+    new_parents = []
     
+    for doc, parent_id, parent_chunk in parents:
+        if parent_id in existing_ids:
+            continue
+        existing_ids.add(parent_id)
+        new_parents.append((parent_id, pickle.dumps(parent_chunk)))
+        
+        child_chunks = child_splitter.split_documents([parent_chunk])
+        
+        for child_chunk in child_chunks:
+            metadata = {
+                "parent_id": parent_id,
+                "user_id": user_id,
+                "persona_name": persona_name,
+                "original_source": doc.metadata.get("source", "unknown"),
+                "chunk_type": "child"
+            }
+            child_chunk.metadata = metadata  # update 대신 직접 할당
+            vector_docs.append(child_chunk)
+    
+    # 청크 색인이 성공한 뒤에만 parent를 저장 (실패하면 다음 실행에서 다시 처리됨)
     if vector_docs:
         vectorstore.add_documents(vector_docs)
+    user_store.mset(new_parents)
     
     return len(vector_docs)
 
+def message_hash(msg) -> str:
+    msg_type = "사용자" if isinstance(msg, HumanMessage) else "AI"
+    return create_stable_hash(f"{msg_type}:{msg.content}")
+
 def save_conversation_to_chroma(memory, conversation_id, user_id, persona_name):
-    """대화 내용을 저장하고 vectorstore와 store에 영구적으로 저장합니다."""
+    """지난 저장 이후 추가된 메시지만 텍스트 파일, vectorstore, store에 저장합니다.
+
+    세션별로 저장한 메시지 수와 마지막 메시지 해시(high-water mark)를 기록해 두고,
+    같은 대화 기록이면 그 뒤의 메시지만 분할/임베딩합니다.
+    대화 기록이 새로 만들어진 경우(마지막 메시지가 다르면) 처음부터 저장합니다.
+    """
     base_path = Path(f"memory_storage/{user_id}/{persona_name}")
     base_path.mkdir(parents=True, exist_ok=True)
     text_path = base_path / "conversation.txt"
+    user_store = store.for_user(user_id)
     
     try:
+        messages = memory.messages
+        saved_count, last_hash = user_store.get_session_mark(conversation_id)
+        if not (0 < saved_count <= len(messages) and message_hash(messages[saved_count - 1]) == last_hash):
+            saved_count = 0
+        new_messages = messages[saved_count:]
+
         conversation_text = []
-        for msg in memory.messages:
+        for msg in new_messages:
             timestamp = str(datetime.now())
             msg_type = "사용자" if isinstance(msg, HumanMessage) else "AI"
             conversation_text.append(f"시간: {timestamp}")
@@ -102,11 +117,11 @@ def save_conversation_to_chroma(memory, conversation_id, user_id, persona_name):
             conversation_text.append(f"내용: {msg.content}")
             conversation_text.append("-" * 50)
         
-        # 대화 내용이 있는지 확인
+        # 새로 저장할 대화 내용이 있는지 확인
         if not conversation_text:
             return "저장할 대화 내용이 없습니다."
             
-        # 텍스트 파일에 저장
+        # 텍스트 파일에 새 메시지만 추가
         with open(text_path, 'a', encoding='utf-8') as f:
             f.write(f"\n세션 ID: {conversation_id}\n")
             f.write("\n".join(conversation_text))
@@ -119,14 +134,17 @@ def save_conversation_to_chroma(memory, conversation_id, user_id, persona_name):
                 "session_id": conversation_id,
                 "user_id": user_id,
                 "persona_name": persona_name,
-                "timestamp": str(datetime.now())
+                "timestamp": str(datetime.now()),
+                "message_start": saved_count,
+                "message_end": len(messages)
             }
         )
         
-        # vectorstore와 store에 저장
+        # vectorstore와 store에 저장한 뒤 high-water mark 갱신
         process_and_store_documents([new_doc], vectorstore, store, user_id, persona_name)
+        user_store.set_session_mark(conversation_id, len(messages), message_hash(messages[-1]))
         
-        print(f"대화 내용이 {text_path}에 저장되었습니다.")
+        print(f"대화 내용 {len(new_messages)}개 메시지가 {text_path}에 저장되었습니다.")
         return "대화 내용이 성공적으로 저장되었습니다."
         
     except Exception as e:
@@ -135,7 +153,7 @@ def save_conversation_to_chroma(memory, conversation_id, user_id, persona_name):
 
 # 초기 설정
 embeddings = OpenAIEmbeddings()
-store = LocalFileStore(STORE_DIRECTORY)
+store = ParentDocumentStore(STORE_DIRECTORY)  # 사용자별 SQLite 파일로 parent 문서 저장
 vectorstore = Chroma(
     collection_name="chat_history",
     embedding_function=embeddings,
@@ -203,7 +221,7 @@ def create_search_conversation(user_id: str, persona_name: str, persona: Persona
             
             parent_docs = []
             if parent_ids:
-                parent_docs_raw = store.mget(parent_ids)
+                parent_docs_raw = store.for_user(user_id).mget(parent_ids)
                 parent_docs = [pickle.loads(doc) for doc in parent_docs_raw if doc is not None]
             
             if not parent_docs:
@@ -258,13 +276,10 @@ Remember to:
 def create_get_current_zone(persona: Persona):
     """Create get current zone tool with persona"""
     def get_current_zone(query: str) -> str:
-        # scratch.json에서 현재 위치 가져오기
-        json_file_path = f"memory_storage/{persona.uid}/{persona.name}/scratch.json"
+        # 상태 저장소에서 현재 위치 가져오기
         try:
-            with open(json_file_path, 'r') as file:
-                scratch_data = json.load(file)
-                current_zone = scratch_data.get('currentZone', 'unknown')
-                
+            current_zone = state_store.get_scratch_field(persona.uid, persona.name, 'currentZone', 'unknown')
+            
             return f"현재 {persona.name}은(는) {current_zone}에 있습니다."
         except Exception as e:
             print(f"위치 정보 읽기 실패: {e}")
@@ -1,3 +1,5 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, File, UploadFile, WebSocket, Form
 from typing import Optional
 from PIL import Image
@@ -11,6 +13,8 @@ from firebase_admin import credentials
 from io import BytesIO
 
 from generate_image import *
+from comfy_client import comfy_client
+from workflow_registry import workflow_registry
 from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -26,7 +30,17 @@ firebase_admin.initialize_app(cred, {
 db = firestore.client()
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 워크플로우는 시작할 때 한 번 읽고 검증
+    workflow_registry.load_all()
+    # ComfyUI 클라이언트(세션/커넥션 풀)는 앱이 떠 있는 동안 재사용
+    await comfy_client.start()
+    yield
+    await comfy_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 
@@ -134,32 +148,55 @@ async def image_generate_default_websocket(uid: str, websocket: WebSocket):
             image = Image.open(image_path)
             print(4,image)
         
+        user_ref = db.collection('users').document(uid)
+        send_lock = asyncio.Lock()
+        store_lock = asyncio.Lock()
+        # persona 필드가 리스트(generate_v2_persona_image 형식)이면 점 경로 업데이트가 실패하므로
+        # 처음 저장할 때 맵으로 바꿔서 씀
+        user_doc = await asyncio.to_thread(user_ref.get)
+        persona_is_map = isinstance((user_doc.to_dict() or {}).get('persona'), dict)
+        stored = {}  # Firestore에 저장까지 끝난 감정별 이미지 URL
+
+        async def store_image(emotion, image_url):
+            nonlocal persona_is_map
+            async with store_lock:
+                if persona_is_map:
+                    await asyncio.to_thread(user_ref.update, {f"persona.{emotion}": image_url})
+                else:
+                    await asyncio.to_thread(user_ref.update, {"persona": {emotion: image_url}})
+                    persona_is_map = True
+
+        async def send_progress(emotion, event):
+            # 감정별 진행 상황 전송, 완료된 이미지는 Firestore에 저장된 뒤에 stored=True로 알림
+            frame = {"type": "emotion", "emotion": emotion, **event}
+            if event['status'] == 'complete':
+                try:
+                    await store_image(emotion, event['image_url'])
+                    stored[emotion] = event['image_url']
+                    frame['stored'] = True
+                except Exception as e:
+                    print(f"{emotion} 이미지 저장 오류: {str(e)}")
+                    frame['stored'] = False
+            async with send_lock:
+                await websocket.send_text(json.dumps(frame))
+
         # 이미지 처리 또는 저장
-        response = await generate_image_websocket(uid, image)
+        response = await generate_image_websocket(uid, image, send_progress)
         print(4)
 
         print("response : ", response['images'])
 
-        if response['status'] == 'complete':
-            images = response['images']
-            persona_data = {"persona" : {
-                'anger' : images['anger']['image_url'],
-                'disgust' : images['disgust']['image_url'],
-                'joy' : images['joy']['image_url'],
-                'sadness' : images['sadness']['image_url'],
-                'serious' : images['serious']['image_url']
-            }
-            }
-
-            user_ref = db.collection('users').document(uid)
-            result = user_ref.update(persona_data)
-
-            print('result ==================================', result)
+        images = response['images']
+
+        # 감정별 이미지는 완료될 때마다 store_image에서 이미 저장됨
+        # (persona 전체를 다시 덮어쓰면 이번에 실패한 감정의 기존 이미지가 지워지므로 하지 않음)
+        if response['status'] == 'complete' and stored:
             # 클라이언트에 성공 응답
             await websocket.send_text(json.dumps({
                 "status": "success",
                 "message": "페르소나 이미지가 생성되고 저장되었습니다.",
-                "images": persona_data
+                "images": {"persona": stored},
+                "failed": [emotion for emotion in images if emotion not in stored]
             }))
         else:
             # 이미지 생성 실패 시
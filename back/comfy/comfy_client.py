@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+from collections import OrderedDict
+import aiohttp
+
+# ComfyUI 서버 주소 (결과 이미지도 /view로 받아오므로 다른 호스트여도 됨)
+COMFYUI_URL = os.getenv("COMFYUI_URL", "http://127.0.0.1:8188")
+
+# 작업 하나당 최대 대기 시간 (여러 작업을 함께 큐에 넣으면 작업 수만큼 늘어남)
+JOB_TIMEOUT = 60
+# 웹소켓 연결이 끊겼을 때 /history 폴링 간격
+POLL_INTERVAL = 1
+# 세션 하나가 ComfyUI에 동시에 여는 최대 연결 수
+CONNECTION_LIMIT = 16
+# 업로드한 원본 이미지 이름을 기억해 둘 최대 개수 (내용 해시 기준)
+UPLOAD_CACHE_SIZE = 256
+
+
+class ComfyClient:
+    """ComfyUI 작업 클라이언트
+
+    - 앱 lifespan 동안 하나의 세션(커넥션 풀)을 모든 요청이 함께 사용
+    - 원본 이미지는 내용 해시로 이름을 정해 같은 이미지는 한 번만 업로드
+    - 여러 워크플로우를 한꺼번에 큐에 넣고, 완료 여부는 /history 폴링 대신
+      /ws 실행 이벤트(executing / execution_success)로 확인
+    - 웹소켓을 쓸 수 없으면 /history 폴링으로 대체
+    """
+
+    def __init__(self, base_url: str = COMFYUI_URL):
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = self.base_url.replace("http", "ws", 1)
+        self._session = None
+        self._uploads = OrderedDict()  # 이미지 해시 → 업로드 작업 (완료되면 파일 이름)
+
+    async def start(self):
+        self._ensure_session()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+        self._uploads.clear()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=CONNECTION_LIMIT))
+        return self._session
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # lifespan 밖(스크립트 등)에서 쓰는 경우를 위해 처음 사용할 때 세션을 만듦
+        return self._ensure_session()
+
+    async def upload_image(self, image_data: bytes, content_type: str = "image/png") -> str:
+        """ComfyUI input 폴더에 이미지를 올리고 워크플로우에서 쓸 파일 이름을 반환
+
+        같은 내용의 이미지는 이미 올린(또는 올리는 중인) 파일 이름을 그대로 사용합니다.
+        """
+        digest = hashlib.sha256(image_data).hexdigest()
+        upload = self._uploads.get(digest)
+        if upload is None:
+            upload = asyncio.ensure_future(self._upload(image_data, content_type, f"src_{digest[:32]}.png"))
+            self._uploads[digest] = upload
+            while len(self._uploads) > UPLOAD_CACHE_SIZE:
+                self._uploads.popitem(last=False)
+        self._uploads.move_to_end(digest)
+
+        try:
+            return await asyncio.shield(upload)
+        except Exception:
+            # 실패한 업로드는 다음 요청에서 다시 시도
+            if self._uploads.get(digest) is upload:
+                del self._uploads[digest]
+            raise
+
+    async def _upload(self, image_data: bytes, content_type: str, filename: str) -> str:
+        form = aiohttp.FormData()
+        form.add_field("image", image_data, filename=filename, content_type=content_type)
+        form.add_field('overwrite', 'true')
+
+        async with self.session.post(f"{self.base_url}/upload/image", data=form) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Error uploading image: {await response.text()}")
+            result = await response.json()
+            return result.get("name", filename)
+
+    async def queue_prompt(self, workflow: dict, client_id: str) -> str:
+        payload = {
+            "prompt": workflow,
+            "client_id": client_id
+        }
+        async with self.session.post(f"{self.base_url}/prompt", json=payload) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Error queueing prompt: {await response.text()}")
+            result = await response.json()
+            return result.get("prompt_id")
+
+    async def get_history(self, prompt_id: str):
+        async with self.session.get(f"{self.base_url}/history/{prompt_id}") as response:
+            if response.status != 200:
+                return None
+            history = await response.json()
+            return history.get(prompt_id)
+
+    async def fetch_output(self, image_info: dict) -> bytes:
+        """출력 이미지를 /view로 받아옴 (image_info: history outputs의 images 항목)"""
+        params = {
+            "filename": image_info["filename"],
+            "subfolder": image_info.get("subfolder", ""),
+            "type": image_info.get("type", "output"),
+        }
+        async with self.session.get(f"{self.base_url}/view", params=params) as response:
+            if response.status != 200:
+                raise RuntimeError(f"Error fetching output {params['filename']}: {await response.text()}")
+            return await response.read()
+
+    async def run_jobs(self, workflows: dict, timeout: float = None, on_event=None, on_result=None) -> dict:
+        """여러 워크플로우를 한꺼번에 실행하고 이름별 결과를 반환
+
+        결과: {name: {'status': 'complete', 'history': ...} 또는 {'status': 'error', 'message': ...}}
+        on_event: async (name, event) - 진행 상황 ({'status': 'queued'}, {'status': 'progress', 'step', 'steps'})
+        on_result: async (name, result) -> result - 작업 하나가 끝나는 즉시 호출되며 반환값이 최종 결과가 됨
+        """
+        results = {}
+        if not workflows:
+            return results
+
+        client_id = str(uuid.uuid4())
+        ws = None
+        try:
+            # 큐에 넣기 전에 연결해야 빨리 끝난 작업의 완료 이벤트를 놓치지 않음
+            ws = await self.session.ws_connect(f"{self.ws_url}/ws?clientId={client_id}", heartbeat=30)
+        except Exception as e:
+            print(f"ComfyUI 웹소켓 연결 실패, /history 폴링으로 대체합니다: {str(e)}")
+
+        jobs = {}  # prompt_id → name
+        pending = set()
+        finishing = []
+
+        def finish(name, prompt_id=None, history=None, error=None):
+            pending.discard(prompt_id)
+            finishing.append(asyncio.ensure_future(
+                self._finish_job(name, prompt_id, history, error, results, on_result)
+            ))
+
+        try:
+            for name, workflow in workflows.items():
+                try:
+                    prompt_id = await self.queue_prompt(workflow, client_id)
+                except Exception as e:
+                    print(f"Error queueing prompt for {name}: {str(e)}")
+                    finish(name, error=str(e))
+                    continue
+                jobs[prompt_id] = name
+                pending.add(prompt_id)
+                await _notify(on_event, name, {'status': 'queued'})
+
+            deadline = time.monotonic() + (timeout or JOB_TIMEOUT * max(1, len(jobs)))
+            if ws is not None:
+                await self._wait_events(ws, jobs, pending, finish, on_event, deadline)
+            await self._wait_history(jobs, pending, finish, deadline)
+        finally:
+            if ws is not None:
+                await ws.close()
+
+        for prompt_id in list(pending):
+            print(f"Timeout for prompt_id: {prompt_id}")
+            finish(jobs[prompt_id], prompt_id, error=f'Timeout while generating image for {jobs[prompt_id]}')
+        await asyncio.gather(*finishing)
+        return results
+
+    async def _finish_job(self, name, prompt_id, history, error, results: dict, on_result):
+        if error is None and history is None:
+            history = await self.get_history(prompt_id)
+            if history is None:
+                error = f'No history for prompt {prompt_id}'
+
+        if error is None:
+            result = {'status': 'complete', 'history': history}
+        else:
+            result = {'status': 'error', 'message': error}
+        if on_result is not None:
+            try:
+                result = await on_result(name, result)
+            except Exception as e:
+                print(f"Error handling result for {name}: {str(e)}")
+                result = {'status': 'error', 'message': str(e)}
+        results[name] = result
+
+    async def _wait_events(self, ws, jobs: dict, pending: set, finish, on_event, deadline: float):
+        """완료/실패 이벤트가 올 때마다 작업을 마무리 (연결이 끊기거나 시간이 다 되면 반환)"""
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                msg = await asyncio.wait_for(ws.receive(), remaining)
+            except asyncio.TimeoutError:
+                return
+            if msg.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSED, aiohttp.WSMsgType.ERROR):
+                print("ComfyUI 웹소켓 연결이 끊겨 /history 폴링으로 대체합니다.")
+                return
+            if msg.type != aiohttp.WSMsgType.TEXT:
+                continue  # 미리보기 이미지(바이너리) 등은 무시
+
+            try:
+                event = json.loads(msg.data)
+            except json.JSONDecodeError:
+                continue
+            event_type = event.get("type")
+            data = event.get("data") or {}
+            prompt_id = data.get("prompt_id")
+            if prompt_id not in pending:
+                continue
+
+            if event_type == "execution_success" or (event_type == "executing" and data.get("node") is None):
+                finish(jobs[prompt_id], prompt_id)
+            elif event_type in ("execution_error", "execution_interrupted"):
+                finish(jobs[prompt_id], prompt_id, error=data.get("exception_message") or event_type)
+            elif event_type == "progress":
+                await _notify(on_event, jobs[prompt_id], {
+                    'status': 'progress',
+                    'step': data.get("value"),
+                    'steps': data.get("max")
+                })
+
+    async def _wait_history(self, jobs: dict, pending: set, finish, deadline: float):
+        """웹소켓으로 확인하지 못한 작업을 /history 폴링으로 확인"""
+        while pending and time.monotonic() < deadline:
+            prompt_ids = list(pending)
+            histories = await asyncio.gather(*[self.get_history(prompt_id) for prompt_id in prompt_ids])
+            for prompt_id, history in zip(prompt_ids, histories):
+                if history is not None:
+                    finish(jobs[prompt_id], prompt_id, history=history)
+            if pending:
+                await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _notify(callback, name, event):
+    # 진행 상황 전달이 실패해도(클라이언트 연결 끊김 등) 생성은 계속 진행
+    if callback is None:
+        return
+    try:
+        await callback(name, event)
+    except Exception as e:
+        print(f"Error sending progress for {name}: {str(e)}")
+
+comfy_client = ComfyClient()
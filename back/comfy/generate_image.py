@@ -1,250 +1,145 @@
 from image_prompt import prompt
-import json
-import os
-import aiohttp
-import uuid
+import asyncio
 from firebase_admin import storage
 from fastapi import HTTPException, File, UploadFile
-import asyncio
-import copy
 import random
 from PIL import Image
 from io import BytesIO
+from comfy_client import comfy_client
+from workflow_registry import workflow_registry, WorkflowTemplate
 
-COMFUI_OUTPUT_DIR = r"C:\Users\201-29\Downloads\StabilityMatrix-win-x64\Data\Packages\ComfyUI\output"
-COMFYUI_URL = "http://127.0.0.1:8188"
+# 감정 이미지 생성에 쓰는 워크플로우 (workflows.json에 등록된 이름)
+CHARACTER_WORKFLOW = "character"
 
-async def load_workflow(workflow_path):
-    try:
-        with open(workflow_path, 'r', encoding='utf-8') as file:
-            workflow = json.load(file)
-            return workflow
-    except FileNotFoundError:
-        raise HTTPException(status_code=404, detail="Workflow not found")
-    except json.JSONDecodeError:
-        raise HTTPException(status_code=400, detail="Invalid workflow format")
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+NEGATIVE_PROMPT = "cross-eyed, unnatural eye alignment, distorted gaze direction, mismatched eye position, asymmetrical eyes, exaggerated reflections in eyes, blurred lips, smudged lips, distorted mouth, missing teeth, uneven teeth, broken teeth, overly sharp or exaggerated teeth, unnatural skin texture, unrealistic facial symmetry, artifacts, low quality, deformed face features, blurry details"
 
 async def generate_persona_image(uid: str, image: UploadFile = File(...)):
     print("Persona image generation service started")
 
     try:
-        workflow = await load_workflow('workflow.json')
-        
         emotions = ["joy", "sadness", "anger", "disgust", "serious"]
-        emotion_images = {}
-
-        for emotion in emotions:
-            try:
-                result = await make_character(prompt[emotion], copy.deepcopy(workflow), image, emotion)
-                emotion_images[emotion] = result
-                print(f"Generated image for {emotion}: {result}")
-            except Exception as e:
-                print(f"Error generating image for {emotion}: {str(e)}")
-                emotion_images[emotion] = {'status': 'error', 'message': str(e)}
-            
-            # 각 요청 사이에 잠시 대기
-            await asyncio.sleep(2)
-        
+        emotion_images = await generate_emotion_images(image, emotions, prompt)
         return {"status": "complete", "images": emotion_images}
     except Exception as e:
         print(f"Error in generate_persona_image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-async def queue_prompt(workflow: dict, client_id: str = ""):
-    print("queue_prompt 서비스 실행")
-    prompt_url = f"{COMFYUI_URL}/prompt"
-
-    payload = {
-        "prompt": workflow,
-        "client_id": client_id
-    }
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(prompt_url, json=payload) as response:
-            if response.status != 200:
-                raise HTTPException(status_code=response.status, detail=f"Error queueing prompt: {await response.text()}")
-            result = await response.json()
-            return result.get("prompt_id")
-    
-async def check_progress(prompt_id: str):
-    print(f"Checking progress for prompt_id: {prompt_id}")
-    history_url = f"{COMFYUI_URL}/history/{prompt_id}"
-    max_retries = 60  # 최대 60번 시도 (1분)
-    retry_count = 0
-    async with aiohttp.ClientSession() as session:
-        while retry_count < max_retries:
-            print(f"Retry count: {retry_count}")
-            async with session.get(history_url) as response:
-                if response.status == 200:
-                    history = await response.json()
-                    if prompt_id in history:
-                        return history[prompt_id]
-            await asyncio.sleep(1)  # 1초 대기
-            retry_count += 1
-    print(f"Max retries reached for prompt_id: {prompt_id}")
-    return None  # 최대 시도 횟수를 초과하면 None 반환
-
-
-def upload_image_to_firebase(local_image_path, destination_blob_name):
+
+def upload_image_to_firebase(image_data: bytes, destination_blob_name, content_type="image/png"):
     bucket = storage.bucket()
     blob = bucket.blob(destination_blob_name)
-    blob.upload_from_filename(local_image_path)
+    blob.upload_from_string(image_data, content_type=content_type)
 
     blob.make_public()
     return blob.public_url
 
 
-async def make_character(prompt_text: str, workflow: dict, image, emotion: str):
-    print(f"Starting image generation for {emotion}")
-    
-    random_seed = random.randint(0, 2**32 - 1)
-    workflow["25"]["inputs"]["text"] = prompt_text
-    workflow["34"]["inputs"]["text"] = prompt_text
-    workflow["19"]["inputs"]["noise_seed"] = random_seed
-    workflow["28"]["inputs"]["noise_seed"] = random_seed
-
-    url = f"{COMFYUI_URL}/upload/image"
-    unique_filename = f"{uuid.uuid4()}.png"
-    form = aiohttp.FormData()
-
-    # 이미지 타입에 따른 처리
+async def read_image_bytes(image):
+    """UploadFile 또는 PIL 이미지를 업로드용 바이트로 변환"""
     if isinstance(image, UploadFile):
         file_content = await image.read()
         await image.seek(0)
-        content_type = image.content_type
-    else:  # PIL Image
-        img_byte_arr = BytesIO()
-        image.save(img_byte_arr, format='PNG')
-        file_content = img_byte_arr.getvalue()
-        content_type = "image/png"
-
-    form.add_field("image", file_content, filename=unique_filename, content_type=content_type)
-    form.add_field('overwrite', 'true')
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, data=form) as response:
-            if response.status == 200:
-                workflow["1"]['inputs']['image'] = unique_filename
-                prompt_id = await queue_prompt(workflow)
-                result = await check_progress(prompt_id)
-
-                if result is None:
-                    return {'status': 'error', 'message': f'Timeout while generating image for {emotion}'}
-
-                if 'outputs' in result and '39' in result['outputs']:
-                    final_image_url = result['outputs']['39']['images'][0]['filename']
-                else:
-                    print(f"Unexpected result structure for {emotion}: {result}")
-                    return {'status': 'error', 'message': f'Unexpected result structure for {emotion}'}
-
-    if final_image_url:
-        local_image_path = os.path.join(COMFUI_OUTPUT_DIR, final_image_url)
-        destination_blob_name = f"generate_images/{emotion}_{final_image_url}"
-        firebase_url = upload_image_to_firebase(local_image_path, destination_blob_name)
-        return {'status': 'complete', 'image_url': firebase_url}
-    else:
-        return {'status': 'error', 'message': f'Failed to generate image for {emotion}'}
-        
+        return file_content, image.content_type
+    img_byte_arr = BytesIO()
+    image.save(img_byte_arr, format='PNG')
+    return img_byte_arr.getvalue(), "image/png"
+
+
+async def save_character_output(emotion: str, result: dict, template: WorkflowTemplate):
+    """ComfyUI 실행 결과 이미지를 /view로 받아 Firebase에 업로드 (업로드는 스레드에서 실행)"""
+    if result['status'] != 'complete':
+        return result
+
+    history = result['history']
+    images = template.output_images(history)
+    if not images:
+        print(f"Unexpected result structure for {emotion}: {history}")
+        return {'status': 'error', 'message': f'Unexpected result structure for {emotion}'}
+
+    image_data = await comfy_client.fetch_output(images[0])
+    destination_blob_name = f"generate_images/{emotion}_{images[0]['filename']}"
+    firebase_url = await asyncio.to_thread(upload_image_to_firebase, image_data, destination_blob_name)
+    return {'status': 'complete', 'image_url': firebase_url}
+
+
+async def generate_emotion_images(image, emotions, prompts, negative_prompt: str = None, on_update=None):
+    """원본 이미지를 한 번 업로드하고 감정별 워크플로우를 한꺼번에 큐에 넣어 생성
+
+    on_update: async (emotion, event) - 감정별 진행 상황
+    ({'status': 'queued'}, {'status': 'progress', 'step', 'steps'}, 완료/실패 시 최종 결과)
+    """
+    template = workflow_registry.get(CHARACTER_WORKFLOW)
+    emotion_images = {}
+
+    async def notify(emotion, event):
+        # 진행 상황 전달이 실패해도(클라이언트 연결 끊김 등) 생성은 계속 진행
+        if on_update is None:
+            return
+        try:
+            await on_update(emotion, event)
+        except Exception as e:
+            print(f"Error sending progress for {emotion}: {str(e)}")
+
+    image_data, content_type = await read_image_bytes(image)
+    image_name = await comfy_client.upload_image(image_data, content_type)
+
+    workflows = {}
+    for emotion in emotions:
+        try:
+            workflows[emotion] = template.build(
+                prompt=prompts[emotion],
+                negative_prompt=negative_prompt,
+                # 시드 노드(두 KSampler)에는 모두 같은 값이 들어감
+                seed=random.randint(0, 2**32 - 1),
+                image=image_name
+            )
+        except Exception as e:
+            print(f"Error generating image for {emotion}: {str(e)}")
+            emotion_images[emotion] = {'status': 'error', 'message': str(e)}
+            await notify(emotion, emotion_images[emotion])
+
+    async def save_output(emotion, result):
+        # 이미지 하나가 끝나면 나머지를 기다리지 않고 바로 업로드
+        try:
+            result = await save_character_output(emotion, result, template)
+            print(f"Generated image for {emotion}: {result}")
+        except Exception as e:
+            print(f"Error generating image for {emotion}: {str(e)}")
+            result = {'status': 'error', 'message': str(e)}
+        await notify(emotion, result)
+        return result
+
+    results = await comfy_client.run_jobs(workflows, on_event=notify, on_result=save_output)
+    emotion_images.update(results)
+
+    return {emotion: emotion_images[emotion] for emotion in emotions}
+
+
 async def regenerate_image(emotion: str, image: UploadFile = File(...)):
     print(f"Regenerating image for {emotion}")
 
     try:
-        workflow = await load_workflow('workflow.json')
-
-        result = await make_character(prompt[emotion], copy.deepcopy(workflow), image, emotion)
+        results = await generate_emotion_images(image, [emotion], prompt)
+        result = results[emotion]
         return result
     except Exception as e:
         print(f"Error in regenerate_image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
     
-async def generate_image_websocket(uid: str, image_data : bytes):
+async def generate_image_websocket(uid: str, image_data : bytes, on_update=None):
     print("generate_image_websocket 호출")
     print(uid)
     print(image_data)
     print("===============================")   
     try:
-        workflow = await load_workflow('workflow.json')
-        
         emotions = ["joy", "sadness", "anger", "disgust", "serious"]
-        emotion_images = {}
-
-        for emotion in emotions:
-            try:
-                result = await make_character_websocket(prompt[emotion], copy.deepcopy(workflow), image_data, emotion)
-                emotion_images[emotion] = result
-                print(f"Generated image for {emotion}: {result}")
-            except Exception as e:
-                print(f"Error generating image for {emotion}: {str(e)}")
-                emotion_images[emotion] = {'status': 'error', 'message': str(e)}
-            
-            # 각 요청 사이에 잠시 대기
-            await asyncio.sleep(2)
+        emotion_images = await generate_emotion_images(image_data, emotions, prompt, NEGATIVE_PROMPT, on_update)
         
         return {"status": "complete", "images": emotion_images}
     except Exception as e:
         print(f"Error in generate_persona_image: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-async def make_character_websocket(prompt_text: str, workflow: dict, image: Image.Image, emotion: str):
-    print(f"Starting image generation for {emotion}")
-    
-    # PIL 이미지 객체를 바이트로 변환
-    img_byte_arr = BytesIO()
-    image.save(img_byte_arr, format='PNG')
-    image_data = img_byte_arr.getvalue()
-    
-    # 랜덤 시드 생성
-    random_seed = random.randint(0, 2**32 - 1)
-    
-    # 25,34 positive prompt
-    workflow["25"]["inputs"]["text"] = prompt_text
-    workflow["34"]["inputs"]["text"] = prompt_text
-
-    # 7,24 negative prompt (기존과 동일)
-    workflow["7"]["inputs"]["text"] = "cross-eyed, unnatural eye alignment, distorted gaze direction, mismatched eye position, asymmetrical eyes, exaggerated reflections in eyes, blurred lips, smudged lips, distorted mouth, missing teeth, uneven teeth, broken teeth, overly sharp or exaggerated teeth, unnatural skin texture, unrealistic facial symmetry, artifacts, low quality, deformed face features, blurry details"
-    workflow["24"]["inputs"]["text"] = "cross-eyed, unnatural eye alignment, distorted gaze direction, mismatched eye position, asymmetrical eyes, exaggerated reflections in eyes, blurred lips, smudged lips, distorted mouth, missing teeth, uneven teeth, broken teeth, overly sharp or exaggerated teeth, unnatural skin texture, unrealistic facial symmetry, artifacts, low quality, deformed face features, blurry details"
-
-    # 랜덤 시드 적용 (19번과 28번 노드에 동일한 시드 적용)
-    workflow["19"]["inputs"]["noise_seed"] = random_seed
-    workflow["28"]["inputs"]["noise_seed"] = random_seed
-
-    url = f"{COMFYUI_URL}/upload/image"
-
-    # 고유한 파일 이름 생성
-    unique_filename = f"{uuid.uuid4()}.png"
-
-    form = aiohttp.FormData()
-    form.add_field("image", image_data, filename=unique_filename, content_type="image/png")
-    form.add_field('overwrite', 'true')
-
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, data=form) as response:
-            if response.status == 200:
-                workflow["1"]['inputs']['image'] = unique_filename
-                prompt_id = await queue_prompt(workflow)
-                result = await check_progress(prompt_id)
-
-                if result is None:
-                    return {'status': 'error', 'message': f'Timeout while generating image for {emotion}'}
-
-                if 'outputs' in result and '39' in result['outputs']:
-                    final_image_url = result['outputs']['39']['images'][0]['filename']
-                else:
-                    print(f"Unexpected result structure for {emotion}: {result}")
-                    return {'status': 'error', 'message': f'Unexpected result structure for {emotion}'}
-
-    if final_image_url:
-        local_image_path = os.path.join(COMFUI_OUTPUT_DIR, final_image_url)
-        destination_blob_name = f"generate_images/{emotion}_{final_image_url}"
-        firebase_url = upload_image_to_firebase(local_image_path, destination_blob_name)
-        return {'status': 'complete', 'image_url': firebase_url}
-    else:
-        return {'status': 'error', 'message': f'Failed to generate image for {emotion}'}
-
-
-
 async def generate_v2_persona_image(uid, final_image, customPersona, prompt, db):
     print("generate_v2_persona_image 호출")
     print(uid)
@@ -253,11 +148,8 @@ async def generate_v2_persona_image(uid, final_image, customPersona, prompt, db)
     print(prompt)
 
     try:
-        workflow = await load_workflow('workflow.json')
-        
         # emotions = ["joy", "sadness", "anger", "custom", "clone"]
         emotions = ["custom", "clone" , "joy" , "anger" , "sadness"]
-        emotion_images = {}
 
         user_ref = db.collection('users').document(uid)
 
@@ -270,20 +162,7 @@ async def generate_v2_persona_image(uid, final_image, customPersona, prompt, db)
         user_persona = user_doc['persona']
         
         print(user_persona)
-        for emotion in emotions:
-            try:
-                result = await make_character(prompt[emotion], copy.deepcopy(workflow), final_image, emotion)
-                emotion_images[emotion] = result
-                print(f"Generated image for {emotion}: {result}")
-
-            except Exception as e:
-                print(f"Error generating image for {emotion}: {str(e)}")
-                emotion_images[emotion] = {'status': 'error', 'message': str(e)}
-            
-            # 각 요청 사이에 잠시 대기
-            await asyncio.sleep(2)
-        
-
+        emotion_images = await generate_emotion_images(final_image, emotions, prompt)
 
         print('9999')
 
@@ -0,0 +1,194 @@
+import asyncio
+import uuid
+
+from aiohttp import web
+
+import comfy_client
+from comfy_client import ComfyClient
+
+
+class StubComfyUI:
+    """/upload/image, /prompt, /ws, /history, /view만 흉내 내는 로컬 ComfyUI 서버"""
+
+    def __init__(self, websocket=True, complete=True, steps=2, fail_uploads=0):
+        self.websocket = websocket
+        self.fail_uploads = fail_uploads
+        self.complete = complete
+        self.steps = steps
+        self.uploads = []
+        self.prompts = []
+        self.history = {}
+        self.sockets = {}
+        self.queue = asyncio.Queue()
+        self.runner = None
+        self.worker = None
+        self.url = None
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.add_routes([
+            web.post('/upload/image', self.upload),
+            web.post('/prompt', self.prompt),
+            web.get('/history/{prompt_id}', self.get_history),
+            web.get('/view', self.view),
+        ])
+        if self.websocket:
+            app.add_routes([web.get('/ws', self.ws)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}"
+        self.worker = asyncio.create_task(self.run_queue())
+        return self
+
+    async def __aexit__(self, *exc):
+        self.worker.cancel()
+        await self.runner.cleanup()
+
+    async def upload(self, request):
+        data = await request.post()
+        if self.fail_uploads:
+            self.fail_uploads -= 1
+            return web.Response(status=500, text="upload failed")
+        await asyncio.sleep(0.01)
+        self.uploads.append(data['image'].filename)
+        return web.json_response({"name": data['image'].filename})
+
+    async def prompt(self, request):
+        body = await request.json()
+        prompt_id = str(uuid.uuid4())
+        self.prompts.append(body)
+        await self.queue.put((prompt_id, body['client_id']))
+        return web.json_response({"prompt_id": prompt_id})
+
+    async def get_history(self, request):
+        prompt_id = request.match_info['prompt_id']
+        if prompt_id not in self.history:
+            return web.json_response({})
+        return web.json_response({prompt_id: self.history[prompt_id]})
+
+    async def view(self, request):
+        return web.Response(body=f"{request.query['type']}/{request.query['filename']}".encode())
+
+    async def ws(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets[request.query['clientId']] = socket
+        async for _ in socket:
+            pass
+        return socket
+
+    async def send(self, client_id, event):
+        socket = self.sockets.get(client_id)
+        if socket is not None and not socket.closed:
+            await socket.send_json(event)
+
+    async def run_queue(self):
+        # GPU 큐처럼 한 번에 하나씩 실행
+        while True:
+            prompt_id, client_id = await self.queue.get()
+            if not self.complete:
+                continue
+            for step in range(1, self.steps + 1):
+                await asyncio.sleep(0.01)
+                await self.send(client_id, {"type": "progress", "data": {"value": step, "max": self.steps, "prompt_id": prompt_id}})
+            self.history[prompt_id] = {
+                "outputs": {"39": {"images": [{"filename": f"{prompt_id}.png", "subfolder": "", "type": "output"}]}}
+            }
+            await self.send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+
+
+def run_with_stub(scenario, **options):
+    async def run():
+        async with StubComfyUI(**options) as stub:
+            async with ComfyClient(stub.url) as client:
+                return await scenario(stub, client)
+    return asyncio.run(run())
+
+
+def test_jobs_complete_from_websocket_events():
+    async def scenario(stub, client):
+        events = []
+
+        async def on_event(name, event):
+            events.append((name, event['status']))
+
+        image_name = await client.upload_image(b"image")
+        workflows = {name: {"1": {"inputs": {"image": image_name}}} for name in ("joy", "anger")}
+        results = await client.run_jobs(workflows, timeout=5, on_event=on_event)
+        output = await client.fetch_output(results["joy"]["history"]["outputs"]["39"]["images"][0])
+        return stub, events, results, output
+
+    stub, events, results, output = run_with_stub(scenario)
+    assert len(stub.uploads) == 1
+    assert {result['status'] for result in results.values()} == {'complete'}
+    assert ("joy", "queued") in events and ("anger", "queued") in events
+    assert ("joy", "progress") in events
+    assert len({prompt['client_id'] for prompt in stub.prompts}) == 1
+    assert output.startswith(b"output/")
+
+
+def test_falls_back_to_history_polling_without_websocket(monkeypatch):
+    monkeypatch.setattr(comfy_client, "POLL_INTERVAL", 0.02)
+
+    async def scenario(stub, client):
+        return await client.run_jobs({"joy": {}, "sadness": {}}, timeout=5)
+
+    results = run_with_stub(scenario, websocket=False)
+    assert {result['status'] for result in results.values()} == {'complete'}
+
+
+def test_unfinished_jobs_time_out(monkeypatch):
+    monkeypatch.setattr(comfy_client, "POLL_INTERVAL", 0.02)
+
+    async def scenario(stub, client):
+        return await client.run_jobs({"joy": {}}, timeout=0.2)
+
+    results = run_with_stub(scenario, complete=False)
+    assert results["joy"]["status"] == "error"
+    assert "Timeout" in results["joy"]["message"]
+
+
+def test_on_result_runs_as_each_job_finishes():
+    async def scenario(stub, client):
+        finished = []
+
+        async def on_result(name, result):
+            finished.append(name)
+            return {'status': result['status'], 'name': name}
+
+        results = await client.run_jobs({"joy": {}, "anger": {}, "sadness": {}}, timeout=5, on_result=on_result)
+        return finished, results
+
+    finished, results = run_with_stub(scenario)
+    assert finished == ["joy", "anger", "sadness"]
+    assert results["anger"] == {'status': 'complete', 'name': 'anger'}
+
+
+def test_same_image_is_uploaded_once():
+    async def scenario(stub, client):
+        names = await asyncio.gather(*[client.upload_image(b"same image") for _ in range(5)])
+        names.append(await client.upload_image(b"same image"))
+        other = await client.upload_image(b"other image")
+        return stub, names, other
+
+    stub, names, other = run_with_stub(scenario)
+    assert len(set(names)) == 1
+    assert other != names[0]
+    assert len(stub.uploads) == 2
+
+
+def test_failed_upload_is_retried_next_time():
+    async def scenario(stub, client):
+        try:
+            await client.upload_image(b"image")
+        except RuntimeError:
+            pass
+        else:
+            raise AssertionError("first upload should fail")
+        return stub, await client.upload_image(b"image")
+
+    stub, name = run_with_stub(scenario, fail_uploads=1)
+    assert stub.uploads == [name]
@@ -0,0 +1,88 @@
+import json
+
+import pytest
+
+from workflow_registry import WorkflowRegistry, WorkflowTemplate
+
+PARAMS = {
+    "prompt": [("25", "text"), ("34", "text")],
+    "seed": [("19", "noise_seed"), ("28", "noise_seed")],
+    "image": [("1", "image")],
+}
+
+
+def make_workflow():
+    return {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "old.png"}},
+        "19": {"class_type": "KSamplerAdvanced", "inputs": {"noise_seed": 1, "steps": 30}},
+        "25": {"class_type": "CLIPTextEncode", "inputs": {"text": "old", "clip": ["4", 0]}},
+        "28": {"class_type": "KSamplerAdvanced", "inputs": {"noise_seed": 1, "steps": 30}},
+        "34": {"class_type": "CLIPTextEncode", "inputs": {"text": "old", "clip": ["4", 0]}},
+        "39": {"class_type": "SaveImage", "inputs": {"images": ["26", 0]}},
+        "4": {"class_type": "CheckpointLoaderSimple", "inputs": {"ckpt_name": "model"}},
+    }
+
+
+def test_build_patches_copies_of_changed_nodes_only():
+    workflow = make_workflow()
+    original = json.loads(json.dumps(workflow))
+    template = WorkflowTemplate("test", workflow, PARAMS, "39")
+
+    job = template.build(prompt="smile", seed=42, image="src.png")
+
+    assert template.workflow == original
+    assert job["25"]["inputs"]["text"] == job["34"]["inputs"]["text"] == "smile"
+    assert job["19"]["inputs"]["noise_seed"] == job["28"]["inputs"]["noise_seed"] == 42
+    assert job["1"]["inputs"]["image"] == "src.png"
+    for node_id in ("1", "19", "25", "28", "34"):
+        assert job[node_id] is not workflow[node_id]
+    # 바꾸지 않은 노드는 템플릿 객체를 그대로 공유
+    assert job["4"] is workflow["4"]
+    assert job["39"] is workflow["39"]
+    assert job["25"]["inputs"]["clip"] is workflow["25"]["inputs"]["clip"]
+
+
+def test_build_keeps_template_value_for_none():
+    template = WorkflowTemplate("test", make_workflow(), PARAMS, "39")
+    job = template.build(prompt=None, seed=7)
+    assert job["25"] is template.workflow["25"]
+    assert job["19"]["inputs"]["noise_seed"] == 7
+
+
+@pytest.mark.parametrize("values", [{"seed": "42"}, {"seed": True}, {"prompt": 3}])
+def test_build_rejects_wrong_types(values):
+    template = WorkflowTemplate("test", make_workflow(), PARAMS, "39")
+    with pytest.raises(TypeError):
+        template.build(**values)
+
+
+def test_build_rejects_unsupported_parameter():
+    template = WorkflowTemplate("test", make_workflow(), PARAMS, "39")
+    with pytest.raises(ValueError):
+        template.build(negative_prompt="blurry")
+
+
+def test_validate_rejects_missing_nodes_and_inputs():
+    with pytest.raises(ValueError):
+        WorkflowTemplate("test", make_workflow(), {"prompt": [("99", "text")]}, "39")
+    with pytest.raises(ValueError):
+        WorkflowTemplate("test", make_workflow(), {"prompt": [("25", "missing")]}, "39")
+    with pytest.raises(ValueError):
+        WorkflowTemplate("test", make_workflow(), PARAMS, "99")
+    with pytest.raises(ValueError):
+        WorkflowTemplate("test", make_workflow(), {"unknown": [("25", "text")]}, "39")
+
+
+def test_output_images():
+    template = WorkflowTemplate("test", make_workflow(), PARAMS, "39")
+    history = {"outputs": {"39": {"images": [{"filename": "out.png"}]}}}
+    assert template.output_images(history) == [{"filename": "out.png"}]
+    assert template.output_images({}) == []
+
+
+def test_registered_workflows_load():
+    registry = WorkflowRegistry()
+    registry.load_all()
+    assert registry.get("character") is registry.get("character")
+    with pytest.raises(KeyError):
+        registry.get("missing")
@@ -0,0 +1,119 @@
+import os
+import json
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# 워크플로우 이름 → 파일 경로 / 파라미터가 들어갈 노드 입력 / 출력 노드
+REGISTRY_PATH = os.path.join(BASE_DIR, "workflows.json")
+
+# 파라미터 이름 → 허용하는 값 타입
+PARAM_TYPES = {
+    "prompt": str,
+    "negative_prompt": str,
+    "seed": int,
+    "image": str,
+}
+
+
+class WorkflowTemplate:
+    """한 번 읽고 검증한 ComfyUI 워크플로우
+
+    작업별 워크플로우는 deepcopy 대신 파라미터가 들어가는 노드와 그 inputs만 새로 만들고,
+    나머지 노드는 템플릿의 객체를 그대로 공유합니다. (템플릿 객체는 수정하면 안 됨)
+    """
+
+    def __init__(self, name: str, workflow: dict, params: dict, output: str):
+        self.name = name
+        self.workflow = workflow
+        self.params = params  # 파라미터 이름 → [(node_id, input_name)]
+        self.output = output
+        self._validate()
+
+    @classmethod
+    def from_config(cls, name: str, config: dict) -> "WorkflowTemplate":
+        path = os.path.join(BASE_DIR, config["path"])
+        with open(path, 'r', encoding='utf-8') as file:
+            workflow = json.load(file)
+        params = {
+            param: [(str(node_id), input_name) for node_id, input_name in targets]
+            for param, targets in config.get("params", {}).items()
+        }
+        return cls(name, workflow, params, str(config["output"]))
+
+    def _validate(self):
+        for param, targets in self.params.items():
+            if param not in PARAM_TYPES:
+                raise ValueError(f"{self.name}: 알 수 없는 파라미터 {param}")
+            for node_id, input_name in targets:
+                node = self.workflow.get(node_id)
+                if node is None or input_name not in node.get("inputs", {}):
+                    raise ValueError(f"{self.name}: {param} 대상 노드 입력 {node_id}.{input_name}이 없습니다")
+        if self.output not in self.workflow:
+            raise ValueError(f"{self.name}: 출력 노드 {self.output}이 없습니다")
+
+    def build(self, **values) -> dict:
+        """파라미터 값을 넣은 작업용 워크플로우 (값이 None인 파라미터는 템플릿 값 유지)"""
+        job = dict(self.workflow)
+        patched = set()
+        for param, value in values.items():
+            if value is None:
+                continue
+            targets = self.params.get(param)
+            if targets is None:
+                raise ValueError(f"{self.name}: 파라미터 {param}를 지원하지 않습니다")
+            expected = PARAM_TYPES[param]
+            if not isinstance(value, expected) or isinstance(value, bool):
+                raise TypeError(f"{self.name}: {param}는 {expected.__name__}여야 합니다")
+
+            for node_id, input_name in targets:
+                if node_id not in patched:
+                    node = dict(job[node_id])
+                    node["inputs"] = dict(node["inputs"])
+                    job[node_id] = node
+                    patched.add(node_id)
+                job[node_id]["inputs"][input_name] = value
+        return job
+
+    def output_images(self, history: dict) -> list:
+        """실행 결과에서 출력 노드의 이미지 정보 목록 (없으면 빈 리스트)"""
+        return history.get("outputs", {}).get(self.output, {}).get("images", [])
+
+
+class WorkflowRegistry:
+    """workflows.json에 등록된 워크플로우를 처음 요청될 때 한 번만 읽어서 보관"""
+
+    def __init__(self, registry_path: str = REGISTRY_PATH):
+        self.registry_path = registry_path
+        self._config = None
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def _load_config(self):
+        if self._config is None:
+            with open(self.registry_path, 'r', encoding='utf-8') as file:
+                self._config = json.load(file)
+        return self._config
+
+    def get(self, name: str) -> WorkflowTemplate:
+        template = self._templates.get(name)
+        if template is not None:
+            return template
+        with self._lock:
+            template = self._templates.get(name)
+            if template is None:
+                config = self._load_config().get(name)
+                if config is None:
+                    raise KeyError(f"등록되지 않은 워크플로우: {name}")
+                template = WorkflowTemplate.from_config(name, config)
+                self._templates[name] = template
+            return template
+
+    def load_all(self):
+        """등록된 워크플로우를 모두 읽고 검증 (서버 시작 시 잘못된 설정을 바로 확인)"""
+        with self._lock:
+            names = list(self._load_config())
+        for name in names:
+            self.get(name)
+
+
+workflow_registry = WorkflowRegistry()
@@ -1,5 +1,6 @@
 from fastapi import FastAPI,  HTTPException, BackgroundTasks, UploadFile, File
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from contextlib import asynccontextmanager
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
@@ -9,6 +10,8 @@ from models import NotificationRequest
 from service.sendNofiticaion import send_expo_push_notification
 from service.services import (
     chat_with_persona,
+    stream_chat_with_persona,
+    validate_persona_name,
     get_personas,
     create_feed_post,
     persona_chat,
@@ -21,9 +24,9 @@ from typing import List
 from datetime import datetime, timedelta
 import pytz
 from dateutil import parser
-from database import db
+from database import db, embedding_cache, memory_writer, collection_registry, async_redis_client
 from fastapi import Request   
-from service.personaLoopChat import persona_chat_v2
+from service.personaLoopChat import persona_chat_v2, prepare_persona_chat, stream_persona_chat_v2, drain_background_jobs
 from service.personaChatVer3 import simulate_conversation
 from service.smsservice import send_sms_service
 import uvicorn
@@ -55,8 +58,21 @@ async def lifespan(app: FastAPI):
         print("스케줄러가 시작되었습니다.")
     except Exception as e:
         print(f"스케줄러 시작 중 오류 발생: {str(e)}")
+    memory_writer.start()
     yield
     # 애플리케이션 종료 시
+    try:
+        await drain_background_jobs()  # 진행 중인 응답 후처리 완료 대기
+    except Exception as e:
+        print(f"응답 후처리 작업 대기 중 오류 발생: {str(e)}")
+    try:
+        await memory_writer.stop()  # 남은 메모리 쓰기 flush
+    except Exception as e:
+        print(f"메모리 writer 종료 중 오류 발생: {str(e)}")
+    try:
+        await async_redis_client.aclose()
+    except Exception as e:
+        print(f"Redis 연결 종료 중 오류 발생: {str(e)}")
     try:
         scheduler.shutdown()
         print("스케줄러가 종료되었습니다.")
@@ -106,6 +122,16 @@ async def get_scheduler_status():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# 캐시 상태 확인 엔드포인트
+@app.get("/cache-status")
+async def get_cache_status():
+    print("get_cache_status 호출")
+    return {
+        "embedding_cache": embedding_cache.get_stats(),
+        "memory_writer": memory_writer.get_stats(),
+        "collection_registry": collection_registry.get_stats()
+    }
+
 
 # 라우트 정의
 @app.post("/chat", response_model=ChatResponse)
@@ -124,6 +150,17 @@ async def chat_endpoint(chat_request: ChatRequest):
     return ChatResponse(persona_name=persona_name, response=response_text)
     # return await chat_with_persona(chat_request) 전에는 이거였음
 
+@app.post("/chat/stream")
+async def chat_stream_endpoint(chat_request: ChatRequest):
+    """/chat의 SSE 스트리밍 버전 (token → done 이벤트)"""
+    print("chat_stream_endpoint 호출")
+    validate_persona_name(chat_request.persona_name)
+    return StreamingResponse(
+        stream_chat_with_persona(chat_request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.post("/v2/chat")
 async def persona_chat_v2_endpoint(chat_request: ChatRequestV2):
     print("persona_chat_v2_endpoint 호출")
@@ -133,6 +170,21 @@ async def persona_chat_v2_endpoint(chat_request: ChatRequestV2):
         logging.error(f"채팅 처리 에러: {str(e)} | 요청 데이터: {chat_request}")
         raise HTTPException(status_code=500, detail=f"채팅 처리 오류: {str(e)}")
 
+@app.post("/v2/chat/stream")
+async def persona_chat_v2_stream_endpoint(chat_request: ChatRequestV2):
+    """/v2/chat의 SSE 스트리밍 버전 (token / response → done 이벤트)"""
+    print("persona_chat_v2_stream_endpoint 호출")
+    try:
+        chat = await prepare_persona_chat(chat_request)
+    except Exception as e:
+        logging.error(f"채팅 처리 에러: {str(e)} | 요청 데이터: {chat_request}")
+        raise HTTPException(status_code=500, detail=f"채팅 처리 오류: {str(e)}")
+    return StreamingResponse(
+        stream_persona_chat_v2(chat),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 
 @app.get("/personas")
 async def get_personas_endpoint():
@@ -0,0 +1,58 @@
+import threading
+from collections import OrderedDict
+
+
+class CollectionRegistry:
+    """ChromaDB 컬렉션 핸들 캐시
+
+    get_or_create_collection은 호출할 때마다 영구 저장소의 메타데이터를 조회하므로
+    한 번 가져온 핸들을 이름별로 보관해서 재사용합니다.
+    최근에 사용되지 않은 사용자의 핸들은 max_size를 넘으면 LRU 순서로 정리됩니다.
+    """
+
+    def __init__(self, client, max_size: int = 512):
+        self.client = client
+        self.max_size = max_size
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+        }
+
+    def get(self, name: str):
+        with self._lock:
+            collection = self._handles.get(name)
+            if collection is not None:
+                self._handles.move_to_end(name)
+                self.stats["hits"] += 1
+                return collection
+
+        # 메타데이터 조회는 lock 밖에서 실행 (다른 컬렉션 조회를 막지 않도록)
+        collection = self.client.get_or_create_collection(name)
+
+        with self._lock:
+            self.stats["misses"] += 1
+            # 동시에 같은 이름을 조회한 경우 먼저 등록된 핸들을 사용
+            collection = self._handles.setdefault(name, collection)
+            self._handles.move_to_end(name)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+                self.stats["evictions"] += 1
+        return collection
+
+    def invalidate(self, name: str = None):
+        """컬렉션 삭제 등으로 핸들이 무효화됐을 때 호출 (name이 없으면 전체 초기화)"""
+        with self._lock:
+            if name is None:
+                self._handles.clear()
+            else:
+                self._handles.pop(name, None)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["live_handles"] = len(self._handles)
+            stats["max_size"] = self.max_size
+        return stats
@@ -4,7 +4,13 @@ from firebase_admin import credentials, firestore
 from dotenv import load_dotenv
 import chromadb
 import redis
+import redis.asyncio as aioredis
+import httpx
+import asyncio
 from datetime import datetime
+from embedding_cache import EmbeddingCache
+from memory_writer import MemoryBatchWriter
+from collection_registry import CollectionRegistry
 
 load_dotenv()
 
@@ -18,26 +24,72 @@ db = firestore.client()
 # ChromaDB 클라이언트 초기화
 client = chromadb.PersistentClient(path="./chroma_db")
 
+# 컬렉션 핸들 캐시 (요청마다 get_or_create_collection을 호출하지 않도록)
+collection_registry = CollectionRegistry(client, max_size=int(os.getenv('CHROMA_COLLECTION_CACHE_SIZE', 512)))
+
+redis_client = redis.Redis(host='localhost', port=6379, db=0)
+# async 경로(임베딩 캐시 등)에서 이벤트 루프를 막지 않도록 쓰는 비동기 클라이언트
+async_redis_client = aioredis.Redis(host='localhost', port=6379, db=0)
+
 # OpenAI API 키 설정
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 aiclient = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_TIMEOUT = float(os.getenv('OPENAI_EMBEDDING_TIMEOUT', 10))  # 임베딩 호출 타임아웃 (초)
+CHAT_TIMEOUT = float(os.getenv('OPENAI_CHAT_TIMEOUT', 30))  # 채팅 호출 타임아웃 (초)
+
+# 비동기 OpenAI 클라이언트 (이벤트 루프를 막지 않도록 FastAPI 엔드포인트에서 사용)
+# 프로세스 전체에서 하나의 커넥션 풀을 공유합니다.
+async_aiclient = AsyncOpenAI(
+    api_key=os.getenv('OPENAI_API_KEY'),
+    timeout=CHAT_TIMEOUT,
+    max_retries=2,
+    http_client=httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+        timeout=CHAT_TIMEOUT,
+    ),
+)
+
+# 같은 텍스트를 반복해서 임베딩하지 않도록 캐시 (로컬 LRU + Redis)
+embedding_cache = EmbeddingCache(redis_client=redis_client, async_redis_client=async_redis_client)
+
+def embed_text(text: str):
+    """캐시를 거치는 동기 임베딩 생성"""
+    embedding = embedding_cache.get(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    embedding = aiclient.embeddings.create(
+        input=text,
+        model=EMBEDDING_MODEL,
+        timeout=EMBEDDING_TIMEOUT
+    ).data[0].embedding
+    embedding_cache.set(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+def persona_collection_name(uid, persona_name):
+    return f"{uid}_inside_out_persona_{persona_name}"
+
+def user_collection_name(uid):
+    return f"user_{uid}_memories"
+
+def get_collection(name):
+    return collection_registry.get(name)
+
 def get_persona_collection(uid, persona_name):
-    return client.get_or_create_collection(f"{uid}_inside_out_persona_{persona_name}")
+    return get_collection(persona_collection_name(uid, persona_name))
 
 def get_user_collection(uid):
     """사용자별 단일 컬렉션 생성 또는 가져오기"""
-    return client.get_or_create_collection(f"user_{uid}_memories")
+    return get_collection(user_collection_name(uid))
 
 def store_long_term_memory(uid: str, persona_name: str, memory: str, memory_type: str):
     """벡터 DB에 통합 메모리 저장"""
     collection = get_user_collection(uid)
 
     # 임베딩 생성
-    embedding = aiclient.embeddings.create(
-        input=memory,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
+    embedding = embed_text(memory)
 
     # 메타데이터 구성
     metadata = {
@@ -57,6 +109,20 @@ def store_long_term_memory(uid: str, persona_name: str, memory: str, memory_type
         ids=[unique_id]
     )
 
+def build_where(memory_type: str = None, persona_name: str = None):
+    """검색 필터 조건 구성 (조건이 2개 이상이면 ChromaDB는 $and 형식이 필요)"""
+    conditions = []
+    if memory_type:
+        conditions.append({"type": memory_type})
+    if persona_name:
+        conditions.append({"persona_name": persona_name})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
 def query_memories(
     uid: str, 
     query: str, 
@@ -68,24 +134,14 @@ def query_memories(
     collection = get_user_collection(uid)
     
     # 쿼리 임베딩 생성
-    query_embedding = aiclient.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
-    
-    # 필터 조건 구성
-    where_conditions = {}
-    if memory_type:
-        where_conditions["type"] = memory_type
-    if persona_name:
-        where_conditions["persona_name"] = persona_name
+    query_embedding = embed_text(query)
     
     try:
         # 검색 실행
         results = collection.query(
             query_embeddings=[query_embedding],
             n_results=limit,
-            where=where_conditions if where_conditions else None
+            where=build_where(memory_type, persona_name)
         )
         return results
     except Exception as e:
@@ -97,4 +153,86 @@ def query_memories(
             "metadatas": []
         }
 
-redis_client = redis.Redis(host='localhost', port=6379, db=0)
\ No newline at end of file
+async def embed_text_async(text: str):
+    """캐시를 거치는 비동기 임베딩 생성"""
+    embedding = await embedding_cache.aget(EMBEDDING_MODEL, text)
+    if embedding is not None:
+        return embedding
+
+    response = await async_aiclient.embeddings.create(
+        input=text,
+        model=EMBEDDING_MODEL,
+        timeout=EMBEDDING_TIMEOUT
+    )
+    embedding = response.data[0].embedding
+    await embedding_cache.aset(EMBEDDING_MODEL, text, embedding)
+    return embedding
+
+async def embed_texts_async(texts: list):
+    """여러 텍스트를 캐시 확인 후 한 번의 임베딩 요청으로 생성 (입력 순서대로 반환)"""
+    embeddings = await embedding_cache.aget_many(EMBEDDING_MODEL, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+    if missing:
+        response = await async_aiclient.embeddings.create(
+            input=[texts[i] for i in missing],
+            model=EMBEDDING_MODEL,
+            timeout=EMBEDDING_TIMEOUT
+        )
+        for i, data in zip(missing, sorted(response.data, key=lambda d: d.index)):
+            embeddings[i] = data.embedding
+        await embedding_cache.aset_many(EMBEDDING_MODEL, [(texts[i], embeddings[i]) for i in missing])
+
+    return embeddings
+
+# 메모리 쓰기를 모아서 임베딩/저장하는 writer (Main.lifespan 종료 시 flush)
+memory_writer = MemoryBatchWriter(embed_texts=embed_texts_async, get_collection=get_collection)
+
+async def store_long_term_memory_async(uid: str, persona_name: str, memory: str, memory_type: str, importance: int = None,
+                                       wait: bool = False):
+    """store_long_term_memory의 비동기 버전 (배치 writer를 통해 저장, wait=True면 저장 완료와 오류까지 대기)"""
+    metadata = {
+        "timestamp": datetime.now().isoformat(),
+        "type": memory_type,
+        "persona_name": persona_name,
+    }
+    if importance is not None:
+        metadata["importance"] = int(importance)
+
+    unique_id = f"{uid}_{metadata['type']}_{metadata['persona_name']}_{metadata['timestamp']}"
+
+    await memory_writer.submit(user_collection_name(uid), memory, metadata, unique_id, wait=wait)
+
+async def store_memory_to_vectordb(uid: str, content: str, metadata: dict, wait: bool = False):
+    """메타데이터를 그대로 사용해 사용자 컬렉션에 메모리 저장 (배치 writer를 통해 저장, wait=True면 저장 완료와 오류까지 대기)"""
+    unique_id = f"{uid}_{metadata.get('type', 'memory')}_{metadata.get('persona_name', '')}_{datetime.now().isoformat()}"
+
+    await memory_writer.submit(user_collection_name(uid), content, metadata, unique_id, wait=wait)
+
+async def query_memories_async(
+    uid: str,
+    query: str,
+    memory_type: str = None,
+    persona_name: str = None,
+    limit: int = 5,
+    query_embedding: list = None
+):
+    """query_memories의 비동기 버전 (이미 계산된 query_embedding이 있으면 재사용)"""
+    if query_embedding is None:
+        query_embedding = await embed_text_async(query)
+
+    try:
+        collection = await asyncio.to_thread(get_user_collection, uid)
+        return await asyncio.to_thread(
+            collection.query,
+            query_embeddings=[query_embedding],
+            n_results=limit,
+            where=build_where(memory_type, persona_name)
+        )
+    except Exception as e:
+        print(f"메모리 검색 오류: {str(e)}")
+        return {
+            "documents": [[]],
+            "distances": [],
+            "metadatas": []
+        }
@@ -0,0 +1,160 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+
+class EmbeddingCache:
+    """(모델, sha256(텍스트)) 키 기반 임베딩 캐시
+
+    1차: 프로세스 내 LRU (dict 조회라 지연 없음)
+    2차: Redis (프로세스/워커 간 공유, TTL 적용)
+    Redis 오류는 캐시 미스로 취급해서 임베딩 생성 자체는 막지 않습니다.
+
+    get/set은 동기 코드용(redis_client), aget/aset은 async 코드용(async_redis_client, redis.asyncio)이라
+    비동기 경로에서는 Redis 왕복이 이벤트 루프를 막지 않습니다.
+    """
+
+    def __init__(self, redis_client=None, async_redis_client=None, max_size: int = 2048, ttl: int = 604800,
+                 prefix: str = "embedding"):
+        self.redis_client = redis_client
+        self.async_redis_client = async_redis_client
+        self.max_size = max_size
+        self.ttl = ttl  # Redis 보관 기간 (기본 1주일)
+        self.prefix = prefix
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "redis_errors": 0,
+        }
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{model}:{digest}"
+
+    def get(self, model: str, text: str):
+        key = self.make_key(model, text)
+        embedding = self._get_local(key)
+        if embedding is not None:
+            return embedding
+        return self._record_redis_result(key, self._get_redis(key))
+
+    def set(self, model: str, text: str, embedding):
+        key = self.make_key(model, text)
+        embedding = list(embedding)
+        self._set_local(key, embedding)
+        self._set_redis(key, embedding)
+
+    async def aget(self, model: str, text: str):
+        return (await self.aget_many(model, [text]))[0]
+
+    async def aget_many(self, model: str, texts):
+        """여러 텍스트의 임베딩 조회 (로컬 미스는 한 번의 MGET으로 Redis 조회, 입력 순서대로 반환)"""
+        keys = [self.make_key(model, text) for text in texts]
+        embeddings = [self._get_local(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            raws = await self._aget_redis([keys[i] for i in missing])
+            for i, raw in zip(missing, raws):
+                embeddings[i] = self._record_redis_result(keys[i], self._decode(raw))
+        return embeddings
+
+    async def aset(self, model: str, text: str, embedding):
+        await self.aset_many(model, [(text, embedding)])
+
+    async def aset_many(self, model: str, items):
+        """(텍스트, 임베딩) 여러 개를 저장 (Redis에는 한 번의 파이프라인으로 저장)"""
+        entries = []
+        for text, embedding in items:
+            key = self.make_key(model, text)
+            embedding = list(embedding)
+            self._set_local(key, embedding)
+            entries.append((key, embedding))
+        await self._aset_redis(entries)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats["local_size"] = len(self._local)
+        total = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["local_hits"] + stats["redis_hits"]) / total, 4) if total else 0.0
+        return stats
+
+    def _get_local(self, key):
+        with self._lock:
+            embedding = self._local.get(key)
+            if embedding is not None:
+                self._local.move_to_end(key)
+                self.stats["local_hits"] += 1
+            return embedding
+
+    def _record_redis_result(self, key, embedding):
+        if embedding is not None:
+            self._set_local(key, embedding)
+            with self._lock:
+                self.stats["redis_hits"] += 1
+            return embedding
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def _record_redis_error(self, action, e):
+        print(f"임베딩 캐시 Redis {action} 오류: {str(e)}")
+        with self._lock:
+            self.stats["redis_errors"] += 1
+
+    @staticmethod
+    def _decode(raw):
+        if raw is None:
+            return None
+        return array("d", raw).tolist()
+
+    def _set_local(self, key, embedding):
+        with self._lock:
+            self._local[key] = embedding
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
+
+    def _get_redis(self, key):
+        if self.redis_client is None:
+            return None
+        try:
+            raw = self.redis_client.get(f"{self.prefix}:{key}")
+        except Exception as e:
+            self._record_redis_error("조회", e)
+            return None
+        return self._decode(raw)
+
+    def _set_redis(self, key, embedding):
+        if self.redis_client is None:
+            return
+        try:
+            # float64 배열 바이트로 저장 (JSON보다 작고 손실 없음)
+            self.redis_client.set(f"{self.prefix}:{key}", array("d", embedding).tobytes(), ex=self.ttl)
+        except Exception as e:
+            self._record_redis_error("저장", e)
+
+    async def _aget_redis(self, keys):
+        if self.async_redis_client is None or not keys:
+            return [None] * len(keys)
+        try:
+            return await self.async_redis_client.mget([f"{self.prefix}:{key}" for key in keys])
+        except Exception as e:
+            self._record_redis_error("조회", e)
+            return [None] * len(keys)
+
+    async def _aset_redis(self, entries):
+        if self.async_redis_client is None or not entries:
+            return
+        try:
+            pipe = self.async_redis_client.pipeline(transaction=False)
+            for key, embedding in entries:
+                pipe.set(f"{self.prefix}:{key}", array("d", embedding).tobytes(), ex=self.ttl)
+            await pipe.execute()
+        except Exception as e:
+            self._record_redis_error("저장", e)
@@ -0,0 +1,204 @@
+import asyncio
+import time
+
+
+class MemoryBatchWriter:
+    """ChromaDB 메모리 쓰기를 짧은 시간 동안 모아서 한 번에 처리하는 백그라운드 writer
+
+    - 모인 문서들은 한 번의 multi-input 임베딩 요청으로 임베딩
+    - 같은 컬렉션에 들어갈 항목은 collection.add 한 번으로 저장
+    - 같은 문서를 여러 컬렉션에 저장하는 경우(페르소나 간 대화) 임베딩은 한 번만 생성
+    - 배치 임베딩이 실패하면 문서별로 다시 임베딩해서, 실패한 문서만 오류 처리
+    """
+
+    def __init__(self, embed_texts, get_collection, flush_interval: float = 0.5, max_batch_size: int = 64):
+        self.embed_texts = embed_texts  # async (texts: list[str]) -> list[embedding]
+        self.get_collection = get_collection  # (name: str) -> chromadb Collection
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self._queue = None
+        self._task = None
+        self.stats = {
+            "submitted": 0,
+            "written": 0,
+            "skipped": 0,
+            "failed": 0,
+            "batches": 0,
+            "embedding_requests": 0,
+        }
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        # 작업이 죽었다가 다시 시작되는 경우에도 큐에 남아 있는 요청은 그대로 처리
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        print("메모리 배치 writer가 시작되었습니다.")
+
+    async def submit(self, collection_name: str, document: str, metadata: dict, id: str, embedding=None, wait: bool = False):
+        """메모리 쓰기 요청 등록
+
+        wait=False(기본)이면 등록만 하고 바로 반환합니다. (오류는 로그와 stats로만 남음)
+        wait=True이면 실제로 ChromaDB에 저장될 때까지 기다리고 저장 오류를 그대로 전달합니다.
+        """
+        if not self.running:
+            self.start()
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put({
+            "collection_name": collection_name,
+            "document": document,
+            "metadata": metadata,
+            "id": id,
+            "embedding": embedding,
+            "future": future,
+        })
+        self.stats["submitted"] += 1
+
+        if future is not None:
+            await future
+
+    async def flush(self):
+        """지금까지 등록된 쓰기 요청이 모두 처리될 때까지 대기"""
+        if self.running:
+            await self._queue.join()
+
+    async def stop(self):
+        """남은 요청을 모두 저장한 뒤 writer 종료 (애플리케이션 종료 시 호출)"""
+        if not self.running:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        print("메모리 배치 writer가 종료되었습니다.")
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["pending"] = self._queue.qsize() if self._queue is not None else 0
+        stats["running"] = self.running
+        return stats
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+
+            # 이미 큐에 쌓인 요청은 바로 모음
+            while len(batch) < self.max_batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            # 저장을 기다리는 호출자가 없을 때만 flush_interval 동안 들어오는 요청을 더 모음
+            # (기다리는 호출자가 혼자 flush_interval만큼 지연되지 않도록)
+            while len(batch) < self.max_batch_size and all(item["future"] is None for item in batch):
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._write_batch(batch)
+            except Exception as e:
+                # 예상하지 못한 오류로 writer가 멈추지 않도록 남은 요청만 실패 처리
+                print(f"메모리 배치 처리 오류: {str(e)}")
+                for item in batch:
+                    self._finish(item, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_batch(self, batch):
+        self.stats["batches"] += 1
+
+        # 임베딩이 없는 문서만 중복 없이 모아서 한 번에 임베딩
+        texts = list(dict.fromkeys(item["document"] for item in batch if item["embedding"] is None))
+        embeddings, errors = await self._embed(texts)
+
+        # 컬렉션별로 묶어서 저장
+        groups = {}
+        for item in batch:
+            if item["embedding"] is None:
+                if item["document"] in errors:
+                    self._finish(item, errors[item["document"]])
+                    continue
+                item["embedding"] = embeddings[item["document"]]
+
+            group = groups.setdefault(item["collection_name"], {})
+            if item["id"] in group:
+                print(f"메모리 배치 중복 ID 건너뜀: {item['id']}")
+                self._skip(item)
+                continue
+            group[item["id"]] = item
+
+        for collection_name, items in groups.items():
+            items = list(items.values())
+            try:
+                collection = await asyncio.to_thread(self.get_collection, collection_name)
+                await asyncio.to_thread(
+                    collection.add,
+                    documents=[item["document"] for item in items],
+                    embeddings=[item["embedding"] for item in items],
+                    metadatas=[item["metadata"] for item in items],
+                    ids=[item["id"] for item in items]
+                )
+                for item in items:
+                    self._finish(item)
+            except Exception as e:
+                print(f"메모리 배치 저장 오류 ({collection_name}): {str(e)}")
+                for item in items:
+                    self._finish(item, e)
+
+    async def _embed(self, texts):
+        """텍스트별 임베딩과 실패한 텍스트별 오류 (배치 요청이 실패하면 텍스트 하나씩 다시 요청)"""
+        if not texts:
+            return {}, {}
+        try:
+            self.stats["embedding_requests"] += 1
+            return dict(zip(texts, await self.embed_texts(texts))), {}
+        except Exception as e:
+            if len(texts) == 1:
+                print(f"메모리 배치 임베딩 오류: {str(e)}")
+                return {}, {texts[0]: e}
+            print(f"메모리 배치 임베딩 오류, 문서별로 다시 시도합니다: {str(e)}")
+
+        embeddings, errors = {}, {}
+        for text in texts:
+            try:
+                self.stats["embedding_requests"] += 1
+                embeddings[text] = (await self.embed_texts([text]))[0]
+            except Exception as e:
+                print(f"메모리 임베딩 오류: {str(e)}")
+                errors[text] = e
+        return embeddings, errors
+
+    def _skip(self, item):
+        """같은 배치에 같은 ID가 이미 있어서 저장하지 않은 요청"""
+        self.stats["skipped"] += 1
+        future = item["future"]
+        if future is not None and not future.done():
+            future.set_exception(ValueError(f"같은 배치에 중복된 메모리 ID: {item['id']}"))
+
+    def _finish(self, item, error=None):
+        if error is None:
+            self.stats["written"] += 1
+        else:
+            self.stats["failed"] += 1
+
+        future = item["future"]
+        if future is None or future.done():
+            return
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
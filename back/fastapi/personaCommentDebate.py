@@ -256,7 +256,7 @@ async def run_debate(request: FeedCommentRequest):
                     await debate.add_message(persona['Name'], opinion)
                     
                     # 의견을 단기 메모리에 저장
-                    store_long_term_memory(
+                    await store_long_term_memory(
                         uid=request.uid,
                         persona_name=persona['Name'],
                         memory=opinion,
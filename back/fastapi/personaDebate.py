@@ -92,7 +92,7 @@ class DebateRound:
             
             # 중요도가 5 이상이면 장기 기억에 저장
             if importance >= 5:
-                store_long_term_memory(
+                await store_long_term_memory(
                     self.request.uid,
                     speaker,
                     text,
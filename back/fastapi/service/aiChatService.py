@@ -1,4 +1,4 @@
-from database import db, redis_client, store_long_term_memory, query_memories
+from database import db, redis_client, query_memories, store_memory_to_vectordb, store_long_term_memory_async
 from google.cloud import firestore
 from service.personaLoopChat import (
     model, tools, get_short_term_memory, 
@@ -150,7 +150,7 @@ async def store_long_term_memory(chat_request: ChatRequest, message: str):
         }
         
         # 벡터 DB에 저장
-        store_memory_to_vectordb(
+        await store_memory_to_vectordb(
             uid=chat_request.recipientId,
             content=json.dumps(content, ensure_ascii=False),
             metadata=metadata
@@ -261,7 +261,7 @@ async def save_chat_message(chat_request: ChatRequest, message: str, is_ai: bool
                 )
                 
                 # 장기 기억 저장 (store_memory_to_vectordb 대신 store_long_term_memory 사용)
-                store_long_term_memory(
+                await store_long_term_memory_async(
                     uid=chat_request.recipientId,
                     persona_name="clone",
                     memory=message,
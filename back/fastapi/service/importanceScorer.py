@@ -0,0 +1,144 @@
+import os
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from langchain_core.prompts import PromptTemplate
+from langchain_openai import ChatOpenAI
+
+# 중요도 평가 엔진 선택 (heuristic: 로컬 규칙 기반 / llm: gpt-4o-mini 배치 평가)
+IMPORTANCE_SCORER = os.getenv('IMPORTANCE_SCORER', 'heuristic')
+DEFAULT_IMPORTANCE = 5
+
+# 감정 강도가 높은 표현
+EMOTION_WORDS = [
+    "사랑", "좋아", "행복", "최고", "고마워", "감사", "축하", "신나", "설레",
+    "싫어", "화나", "짜증", "열받", "미워", "슬퍼", "우울", "외로", "눈물", "울었",
+    "걱정", "불안", "무서", "두려", "긴장", "힘들", "지쳐", "죽겠", "미안", "후회",
+]
+
+# 기억할 필요가 있는 생활 이벤트
+EVENT_WORDS = [
+    "생일", "기념일", "시험", "면접", "발표", "마감", "회의", "약속", "일정", "예약",
+    "결혼", "이사", "병원", "수술", "입원", "합격", "불합격", "졸업", "입학", "입사",
+    "퇴사", "이직", "헤어", "이별", "여행", "출장", "월급", "계약",
+]
+
+# 날짜/시간 정보
+TIME_PATTERN = re.compile(r"(\d{1,2}\s*시|\d{1,2}:\d{2}|\d{1,2}\s*월\s*\d{1,2}\s*일|내일|모레|다음\s*주|이번\s*주|주말)")
+# 의미 없는 짧은 반응
+FILLER_PATTERN = re.compile(r"^[\sㅋㅎㅠㅜ.!?~^]*(응|웅|그래|ㅇㅇ|네|넵|오키|ㅇㅋ)?[\sㅋㅎㅠㅜ.!?~^]*$")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 4096
+
+_llm = None
+
+
+def score_importance(text: str) -> int:
+    """규칙 기반 중요도 계산 (1-10, 네트워크 호출 없음)"""
+    if not text or not text.strip():
+        return 1
+
+    text = text.strip()
+    if FILLER_PATTERN.match(text):
+        return 2
+
+    score = 3
+    score += min(3, sum(1 for word in EMOTION_WORDS if word in text))
+    score += min(3, 2 * sum(1 for word in EVENT_WORDS if word in text))
+    if TIME_PATTERN.search(text):
+        score += 1
+    if "!" in text or "ㅠ" in text or "ㅜ" in text:
+        score += 1
+    if len(text) > 80:
+        score += 1
+    elif len(text) < 10:
+        score -= 1
+
+    return max(1, min(10, score))
+
+
+async def _score_heuristic(texts):
+    return [score_importance(text) for text in texts]
+
+
+async def _score_llm(texts):
+    """여러 텍스트를 한 번의 LLM 호출로 평가"""
+    global _llm
+    if _llm is None:
+        _llm = ChatOpenAI(model="gpt-4o-mini", temperature=0)
+
+    prompt = PromptTemplate.from_template("""
+    다음 텍스트들의 중요도를 각각 1-10 사이의 숫자로 평가해주세요.
+    평가 기준:
+    - 감정적 강도
+    - 정보의 가치
+    - 기억할 필요성
+
+    텍스트 순서대로 숫자만 쉼표로 구분해서 응답하세요. (예: 3, 7, 5)
+
+    {texts}""")
+    numbered = "\n".join(f"{i + 1}. {text}" for i, text in enumerate(texts))
+
+    try:
+        result = await (prompt | _llm).ainvoke({"texts": numbered})
+        scores = [int(n) for n in re.findall(r"\d+", result.content)]
+        if len(scores) != len(texts):
+            raise ValueError(f"응답 개수 불일치: {len(scores)} != {len(texts)}")
+        return [max(1, min(10, score)) for score in scores]
+    except Exception as e:
+        print(f"LLM 중요도 계산 중 오류, 규칙 기반으로 대체: {str(e)}")
+        return [score_importance(text) for text in texts]
+
+
+# 엔진 이름 → async (texts) -> list[int]
+SCORERS = {
+    "heuristic": _score_heuristic,
+    "llm": _score_llm,
+}
+
+
+def register_scorer(name: str, scorer):
+    """새로운 중요도 평가 엔진 등록 (scorer는 async (texts) -> list[int])"""
+    SCORERS[name] = scorer
+
+
+def _cache_key(engine: str, text: str):
+    return f"{engine}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+async def calculate_importance_batch(texts, engine: str = None):
+    """여러 텍스트의 중요도를 한 번에 계산 (캐시된 텍스트는 다시 평가하지 않음)"""
+    engine = engine or IMPORTANCE_SCORER
+    scorer = SCORERS.get(engine, _score_heuristic)
+
+    keys = [_cache_key(engine, text) for text in texts]
+    scores = []
+    with _cache_lock:
+        for key in keys:
+            scores.append(_cache.get(key))
+
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        try:
+            new_scores = await scorer([texts[i] for i in missing])
+        except Exception as e:
+            print(f"중요도 계산 중 오류: {str(e)}")
+            new_scores = [DEFAULT_IMPORTANCE] * len(missing)
+
+        with _cache_lock:
+            for i, score in zip(missing, new_scores):
+                scores[i] = score
+                _cache[keys[i]] = score
+                _cache.move_to_end(keys[i])
+            while len(_cache) > _CACHE_SIZE:
+                _cache.popitem(last=False)
+
+    return scores
+
+
+async def calculate_importance(text: str, engine: str = None) -> int:
+    """텍스트 하나의 중요도 계산 (1-10)"""
+    return (await calculate_importance_batch([text], engine=engine))[0]
@@ -14,7 +14,7 @@ from langchain_core.runnables import RunnableWithMessageHistory
 from langchain_community.chat_message_histories import ChatMessageHistory
 from pydantic import BaseModel
 from redis import Redis
-from database import redis_client, get_user_collection, query_memories
+from database import redis_client, get_user_collection, query_memories, store_long_term_memory_async
 from personas import personas
 import re
 import json
@@ -26,6 +26,8 @@ from langchain_core.runnables import RunnableSequence
 from langchain_openai import ChatOpenAI
 import asyncio
 from fastapi import HTTPException
+from service.importanceScorer import calculate_importance
+from service.shortTermMemory import store_short_term_memory, get_short_term_memory
 
 # Ollama 대신 OllamaLLM 사용
 llm = OllamaLLM(
@@ -38,30 +40,8 @@ llm = OllamaLLM(
 gpt4_model = ChatOpenAI(model="gpt-4o", temperature=0.7)
 
 async def calculate_importance_llama(text: str) -> int:
-    """텍스트의 중요도를 계산"""
-    try:
-        llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        prompt = PromptTemplate.from_template("""
-        다음 텍스트의 중요도를 1-10 사이의 숫자로 평가해주세요.
-        평가 기준:
-        - 감정적 강도
-        - 정보의 가치
-        - 기억할 필요성
-        
-        텍스트: {text}
-        
-        중요도 (1-10):""")
-        
-        # 체인 실행
-        chain = prompt | llm
-        result = await chain.ainvoke({"text": text})
-        importance = int(result.content.strip())
-        
-        return max(1, min(10, importance))  # 1-10 사이로 제한
-        
-    except Exception as e:
-        print(f"중요도 계산 중 오류: {str(e)}")
-        return 5  # 오류 발생시 기본값
+    """텍스트의 중요도를 계산 (service.importanceScorer 사용)"""
+    return await calculate_importance(text)
 
 async def summarize_content(text: str) -> str:
     """텍스트 요약"""
@@ -136,7 +116,8 @@ def get_short_term_memory_tool(params):
         
         return get_short_term_memory(
             uid=params_dict.get('uid'),
-            persona_name=params_dict.get('persona_name')
+            persona_name=params_dict.get('persona_name'),
+            memory_type=params_dict.get('memory_type', 'recent')
         )
     except json.JSONDecodeError as e:
         print(f"JSON 파싱 오류: {str(e)}")
@@ -146,113 +127,16 @@ def get_short_term_memory_tool(params):
         return f"오류가 발생했습니다: {str(e)}"
 
 
-# 단기 기억 함수 (요약 및 대화 시간 포함)
-def store_short_term_memory(uid, persona_name, memory):
-    # 응답 요약
-    summary = summarize_content(memory)
-    
-    # 현재 시간 추가
-    current_time = datetime.now()
-    timestamp = current_time.strftime("%Y-%m-%d %H:%M:%S")
-    
-    # 메모리 데이터 구조화
-    memory_data = {
-        "timestamp": timestamp,
-        "content": summary,
-        "importance": calculate_importance_llama(memory),
-        "type": "chat"  # 'chat', 'event', 'emotion' 등으로 구분 가능
-    }
-    
-    # JSON으로 직렬화
-    memory_json = json.dumps(memory_data, ensure_ascii=False)
-    
-    # Redis 키 설정
-    base_key = f"{uid}:{persona_name}"
-    
-    # 시간대별 저장
-    time_keys = {
-        "recent": {
-            "key": f"{base_key}:recent",
-            "max_items": 20,
-            "ttl": 3600  # 1시간
-        },
-        "today": {
-            "key": f"{base_key}:today",
-            "max_items": 50,
-            "ttl": 86400  # 24시간
-        },
-        "weekly": {
-            "key": f"{base_key}:weekly",
-            "max_items": 100,
-            "ttl": 604800  # 1주일
-        }
-    }
-    
-    # 각 시간대별로 저장
-    for storage_type, config in time_keys.items():
-        # 중요도가 7 이상인 경우만 weekly에 저장
-        if storage_type == "weekly" and memory_data["importance"] < 7:
-            continue
-            
-        redis_client.lpush(config["key"], memory_json)
-        redis_client.ltrim(config["key"], 0, config["max_items"] - 1)
-        redis_client.expire(config["key"], config["ttl"])
-
-def get_short_term_memory(uid, persona_name, memory_type="recent"):
-    base_key = f"{uid}:{persona_name}:{memory_type}"
-    
-    # Redis에서 데이터 가져오기
-    raw_memories = redis_client.lrange(base_key, 0, -1)
-    
-    if not raw_memories:
-        return []
-        
-    # JSON 디코딩 및 시간순 정렬
-    memories = []
-    for memory in raw_memories:
-        try:
-            decoded = json.loads(memory)
-            memories.append(decoded)
-        except json.JSONDecodeError:
-            continue
-            
-    # 시간순 정렬
-    memories.sort(key=lambda x: datetime.strptime(x["timestamp"], "%Y-%m-%d %H:%M:%S"))
-    
-    # 포맷팅된 문자 반환
-    return [
-        f"[{m['timestamp']}] [{m['type']}] (중요도: {m['importance']}) {m['content']}"
-        for m in memories
-    ]
-
 # 장기 기억 함수
-def store_long_term_memory(uid: str, persona_name: str, memory: str, memory_type: str):
-    """벡터 DB에 통합 메모리 저장"""
-    collection = get_user_collection(uid)
-    
-    # 임베딩 생성
-    embedding = gpt4_model.embeddings.create(
-        input=memory,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
-    
-    # 메타데이터 구성
-    metadata = {
-        "timestamp": datetime.now().isoformat(),
-        "type": memory_type,  # 파라미터로 받은 타입 사용
-        "persona_name": persona_name,
-        "importance": calculate_importance_llama(memory)
-    }
-    
-    # 고유 ID 생성
-    unique_id = f"{uid}_{metadata['type']}_{metadata['persona_name']}_{metadata['timestamp']}"
-    
-    # 컬렉션에 저장
-    collection.add(
-        documents=[memory],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[unique_id]
+async def store_long_term_memory(uid: str, persona_name: str, memory: str, memory_type: str):
+    """벡터 DB에 통합 메모리 저장 (비동기 OpenAI 클라이언트 사용)"""
+    importance = await calculate_importance_llama(memory)
+    await store_long_term_memory_async(
+        uid=uid,
+        persona_name=persona_name,
+        memory=memory,
+        memory_type=memory_type,
+        importance=importance
     )
 
 def get_long_term_memory(uid, persona_name, query, limit=3):
@@ -592,7 +476,7 @@ async def store_conversation_memory(uid, persona, message, chat_ref):
         
         # 중요도가 5 이상이면 장기 메모리 저장
         if importance >= 5:
-            store_long_term_memory(
+            await store_long_term_memory(
                 uid=uid,
                 persona_name=persona,
                 memory=message,
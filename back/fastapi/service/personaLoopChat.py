@@ -9,8 +9,9 @@ from langchain.agents.format_scratchpad import format_log_to_str
 from langchain.agents.output_parsers import ReActSingleInputOutputParser
 from langchain.tools.render import render_text_description
 from datetime import datetime
-from database import db, redis_client
+from database import db, redis_client, store_memory_to_vectordb
 from models import ChatRequestV2
+from utils import format_sse
 from personas import personas
 from google.cloud import firestore
 import json
@@ -21,8 +22,11 @@ import asyncio
 from service.sendNofiticaion import send_expo_push_notification 
 from models import NotificationRequest
 from service.interactionStore import store_user_interaction
+from service.importanceScorer import DEFAULT_IMPORTANCE, calculate_importance, calculate_importance_batch
+from service.shortTermMemory import store_short_term_memory, get_short_term_memory, get_short_term_memories, get_recent_history, format_memory
 
 model = ChatOpenAI(model="gpt-4o",temperature=0.5,streaming=False)
+streaming_model = ChatOpenAI(model="gpt-4o",temperature=0.5,streaming=True)  # SSE 스트리밍 엔드포인트용
 web_search = TavilySearchResults(max_results=1)
 embeddings = OpenAIEmbeddings(model="text-embedding-ada-002")
 
@@ -174,13 +178,36 @@ agent_executor = AgentExecutor(
     verbose=True
 )
 
+# 스트리밍용 에이전트 (토큰 단위로 on_chat_model_stream 이벤트 발생)
+streaming_agent_executor = AgentExecutor(
+    agent=create_react_agent(
+        llm=streaming_model,
+        tools=tools,
+        prompt=PromptTemplate.from_template(template)
+    ),
+    tools=tools,
+    max_iterations=10,
+    max_execution_time=30,
+    early_stopping_method="generate",
+    verbose=True
+)
+
 def get_conversation_history(uid, persona_name):
-    # recent와 today의 기억을 모두 가져와서 시간순으로 정렬
-    recent_history = get_short_term_memory(uid, persona_name, "recent")
-    today_history = get_short_term_memory(uid, persona_name, "today")
+    # 저장 시점에 유지되는 대화 기록에서 최근 10개 조회
+    history = get_recent_history(uid, persona_name, limit=10)
+    if history:
+        return "\n".join(history)
+
+    # 대화 기록이 아직 없는 경우 (이전 형식으로만 저장된 기억) recent/today를 합쳐서 구성
+    memories = get_short_term_memories(uid, persona_name, ("recent", "today"))
     
     # 두 리스트 합치기
-    all_history = recent_history + today_history
+    all_history = []
+    for memory_data in memories["recent"] + memories["today"]:
+        try:
+            all_history.append(format_memory(memory_data))
+        except KeyError:
+            continue
     
     # 중복 제거 및 시간순 정렬
     unique_history = list(set(all_history))
@@ -188,167 +215,225 @@ def get_conversation_history(uid, persona_name):
     
     return "\n".join(unique_history[-10:])  # 최근 10개만 반환
 
-def get_short_term_memory(uid, persona_name, memory_type="recent"):
-    redis_key = f"memory:{uid}:{persona_name}:{memory_type}"
-    print(f"Searching Redis with key: {redis_key}")  # 디버그 로그
+async def calculate_importance_llama(text: str) -> int:
+    """텍스트의 중요도를 계산 (service.importanceScorer 사용)"""
+    return await calculate_importance(text)
+
+RESPONSE_PATTERN = r'Response(\d+): (.*?)(?=Response\d+:|$)'
+DEFAULT_RESPONSE = "죄송해요, 잠시 생각이 필요해요... 다시시도해주세요... 🤔"
+
+def parse_responses(output: str):
+    """에이전트 Final Answer에서 ResponseN 응답들을 순서대로 추출"""
+    responses = re.findall(RESPONSE_PATTERN, output, re.DOTALL)
+    return [response_text.strip() for _, response_text in sorted(responses) if response_text.strip()]
+
+def get_chat_ref(uid, persona_name):
+    return db.collection('chats').document(uid).collection('personas').document(persona_name).collection('messages')
+
+async def prepare_persona_chat(chat_request: ChatRequestV2):
+    """사용자/페르소나 정보를 조회하고 에이전트 입력을 구성"""
+    uid = chat_request.uid
+    persona_name = chat_request.persona_name
+    user_input = chat_request.user_input
+
+    # Firestore에서 사용자 프로필 가져오기
+    user_doc = await asyncio.to_thread(db.collection('users').document(uid).get)
+    user_profile = user_doc.to_dict().get('profile', {}) if user_doc.exists else {}
+    
+    # 사용자의 페르소나 정보 가져오기
+    personas = user_doc.to_dict().get('persona', []) if user_doc.exists else []
+    current_persona = next(
+        (p for p in personas if p.get('Name') == persona_name),
+        None
+    )
     
-    chat_history = redis_client.lrange(redis_key, 0, -1)
-    print(f"Found memories: {len(chat_history)}")  # 디버그 로그
+    if not current_persona:
+        raise HTTPException(
+            status_code=404, 
+            detail=f"Persona {persona_name} not found"
+        )
     
-    if not chat_history:
-        print("No memories found")  # 디버그 로그
-        return []
+    # persona_name을 실제 Name 값으로 변경
+    actual_persona_name = current_persona.get('Name')
+    display_name = current_persona.get('DPNAME')
+    conversation_history = get_conversation_history(uid, actual_persona_name)
     
-    decoded_history = []
-    for memory in chat_history:
-        try:
-            if isinstance(memory, bytes):
-                memory = memory.decode('utf-8', errors='ignore')
-            memory_data = json.loads(memory)
-            formatted_memory = f"[{memory_data['timestamp']}] [{memory_data['type']}] (중요도: {memory_data['importance']}) {memory_data['content']}"
-            decoded_history.append(formatted_memory)
-        except (json.JSONDecodeError, KeyError):
-            continue
-            
-    return decoded_history
+    agent_input = {
+        "input": user_input,
+        "persona_name": display_name,
+        "actual_persona_name": actual_persona_name,
+        "persona_description": current_persona.get('description', ''),
+        "persona_tone": current_persona.get('tone', ''),
+        "persona_example": current_persona.get('example', ''),
+        "conversation_history": conversation_history,
+        "tools": render_text_description(tools),
+        "tool_names": ", ".join([tool.name for tool in tools]),
+        "agent_scratchpad": "",
+        "uid": uid,
+        "user_profile": user_profile
+    }
 
-def store_short_term_memory(uid, persona_name, memory):
-    try:
-        # 메모리 데이터 구성
-        memory_data = {
-            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "content": memory,
-            "importance": 5,  # 기본 중요도
-            "type": "chat",
-            "persona_name": persona_name
+    # 사용자 메시지 저장
+    await store_user_interaction(
+        uid=uid,
+        interaction_data={
+            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'message': user_input,
+            'type': 'chat',
+            'importance': 5  # 기본 중요도 설정
         }
-        memory_json = json.dumps(memory_data, ensure_ascii=False)
-        
-        # Redis 키 구성
-        recent_key = f"memory:{uid}:{persona_name}:recent"
-        today_key = f"memory:{uid}:{persona_name}:today"
-        weekly_key = f"memory:{uid}:{persona_name}:weekly"
+    )
+
+    return {
+        "uid": uid,
+        "persona_name": persona_name,
+        "actual_persona_name": actual_persona_name,
+        "display_name": display_name,
+        "agent_input": agent_input
+    }
+
+# 응답 후처리(저장) 백그라운드 작업 참조 보관 (GC 방지 및 종료 시 대기용)
+background_jobs = set()
+
+def run_in_background(coro):
+    task = asyncio.create_task(coro)
+    background_jobs.add(task)
+    task.add_done_callback(background_jobs.discard)
+    return task
+
+async def drain_background_jobs():
+    """진행 중인 응답 후처리 작업이 끝날 때까지 대기 (애플리케이션 종료 시 호출)"""
+    if background_jobs:
+        print(f"응답 후처리 작업 {len(background_jobs)}개 완료 대기 중...")
+        await asyncio.gather(*list(background_jobs), return_exceptions=True)
+
+async def deliver_responses(chat_ref, persona_name, responses, typing_delay):
+    """타이핑 간격을 두고 응답을 순서대로 Firestore에 저장"""
+    for cleaned_response in responses:
+        if typing_delay:
+            await asyncio.sleep(typing_delay)
         
-        # 직접 저장 시도
+        # Firestore에 저장
+        await asyncio.to_thread(chat_ref.add, {
+            "timestamp": firestore.SERVER_TIMESTAMP,
+            'sender': persona_name,
+            'message': cleaned_response
+        })
+
+        # 알림 전송
+        # notification_request = NotificationRequest(
+        #     uid=uid, 
+        #     whoSendMessage=persona_name, 
+        #     message=cleaned_response, 
+        #     pushType="persona_chat"
+        # )
+        # notification = await send_expo_push_notification(notification_request)
+        # print(f"persona_chat_v2 > Notification: {notification}")
+
+async def store_short_term_memories(uid, actual_persona_name, display_name, responses):
+    """단기 기억 저장 (Redis) - 대화 순서 유지를 위해 순서대로 저장"""
+    for cleaned_response in responses:
         try:
-            # recent (최근 1시간)
-            redis_client.lpush(recent_key, memory_json)
-            redis_client.ltrim(recent_key, 0, 19)  # 최근 20개만 유지
-            redis_client.expire(recent_key, 3600)  # 1시간
-            
-            # today (오늘)
-            redis_client.lpush(today_key, memory_json)
-            redis_client.ltrim(today_key, 0, 49)  # 최근 50개만 유지
-            redis_client.expire(today_key, 86400)  # 24시간
-            
-            print(f"메모리 저장 완료 - recent: {recent_key}, today: {today_key}")
-            
+            await asyncio.to_thread(
+                store_short_term_memory,
+                uid=uid,
+                persona_name=actual_persona_name,
+                memory=f"{display_name}: {cleaned_response}"
+            )
+            print(f"단기 메모리 저장 성공: {cleaned_response[:30]}...")
         except Exception as e:
-            print(f"Redis 저장 오류: {str(e)}")
-            
+            print(f"단기 메모리 저장 실패: {str(e)}")
+
+async def store_response_memory(uid, actual_persona_name, display_name, cleaned_response, importance):
+    """장기 기억 저장 (ChromaDB) - 중요도가 잘못됐거나 저장에 실패하면 기본 중요도로 다시 저장"""
+    try:
+        importance = int(importance)  # 정수형으로 변환
+    except (TypeError, ValueError):
+        print(f"잘못된 중요도 {importance!r}, 기본 중요도로 저장합니다.")
+        importance = DEFAULT_IMPORTANCE
+
+    def make_metadata(importance):
+        return {
+            "sender": display_name,
+            "message": cleaned_response,
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "type": "persona_chat",
+            "importance": importance,
+            "persona_name": actual_persona_name  # 페르소나 이름 추가
+        }
+
+    # 백그라운드 작업이므로 저장 완료까지 기다려서 오류를 받음
+    try:
+        await store_memory_to_vectordb(
+            uid=uid,
+            content=cleaned_response,  # 실제 텍스트 내용
+            metadata=make_metadata(importance),  # 메타데이터
+            wait=True
+        )
+        return
     except Exception as e:
-        print(f"단기 메모리 저장 오류: {str(e)}")
+        print(f"Error storing memory: {str(e)}")
 
-async def calculate_importance_llama(text: str) -> int:
-    """텍스트의 중요도를 계산"""
+    # 오류 발생 시 기본값으로 저장
     try:
-        llm = ChatOpenAI(model="gpt-4o", temperature=0)
-        prompt = PromptTemplate.from_template("""
-        다음 텍스트의 중요도를 1-10 사이의 숫자로만 응답해주세요. 다른 설명은 하지 말고 숫자만 응답하세요.
-        
-        평가 기준:
-        - 감정적 강도
-        - 정보의 가치
-        - 기억할 필요성
-        
-        텍스트: {text}""")
-        
-        # 체인 실행
-        chain = prompt | llm
-        result = await chain.ainvoke({"text": text})
-        # 숫자만 추출
-        importance = int(''.join(filter(str.isdigit, result.content.strip())))
-        
-        return max(1, min(10, importance))  # 1-10 사이로 제한
-        
+        await store_memory_to_vectordb(
+            uid=uid,
+            content=cleaned_response,
+            metadata=make_metadata(DEFAULT_IMPORTANCE),
+            wait=True
+        )
     except Exception as e:
-        print(f"중요도 계산 중 오류: {str(e)}")
-        return 5  # 오류 발생시 기본값
+        print(f"Error storing memory with default values: {str(e)}")
+
+async def save_persona_responses(uid, persona_name, actual_persona_name, display_name, responses, typing_delay=2):
+    """파싱된 응답들을 Firestore/Redis/ChromaDB에 저장
+
+    Firestore 전송(타이핑 간격), 단기 기억, 응답별 중요도 계산/장기 기억 저장을 동시에 진행합니다.
+    """
+    chat_ref = get_chat_ref(uid, persona_name)
+
+    async def store_long_term_memories():
+        # 응답들의 중요도를 한 번에 계산 (실패하면 기본 중요도로 저장)
+        try:
+            importances = list(await calculate_importance_batch(responses))
+        except Exception as e:
+            print(f"Error calculating importance: {str(e)}")
+            importances = []
+        importances += [DEFAULT_IMPORTANCE] * (len(responses) - len(importances))
+        await asyncio.gather(*[
+            store_response_memory(uid, actual_persona_name, display_name, response, importance)
+            for response, importance in zip(responses, importances)
+        ])
+
+    results = await asyncio.gather(
+        deliver_responses(chat_ref, persona_name, responses, typing_delay),
+        store_short_term_memories(uid, actual_persona_name, display_name, responses),
+        store_long_term_memories(),
+        return_exceptions=True
+    )
+    for result in results:
+        if isinstance(result, Exception):
+            print(f"응답 후처리 오류: {str(result)}")
 
 async def persona_chat_v2(chat_request: ChatRequestV2):
     print("personaLoopChat > persona_chat_v2 > chat_request : ", chat_request)
     try:
-        uid = chat_request.uid
-        persona_name = chat_request.persona_name
-        user_input = chat_request.user_input
-
-        # Firestore에서 사용자 프로필 가져오기
-        user_doc = db.collection('users').document(uid).get()
-        user_profile = user_doc.to_dict().get('profile', {}) if user_doc.exists else {}
-        
-        # 사용자의 페르소나 정보 가져오기
-        personas = user_doc.to_dict().get('persona', [])
-        current_persona = next(
-            (p for p in personas if p.get('Name') == persona_name),
-            None
-        )
-        
-        if not current_persona:
-            raise HTTPException(
-                status_code=404, 
-                detail=f"Persona {persona_name} not found"
-            )
-        
-        # persona_name을 실제 Name 값으로 변경
-        actual_persona_name = current_persona.get('Name')
-        display_name = current_persona.get('DPNAME')
-        conversation_history = get_conversation_history(uid, actual_persona_name)
-        
-        agent_input = {
-            "input": user_input,
-            "persona_name": display_name,
-            "actual_persona_name": actual_persona_name,
-            "persona_description": current_persona.get('description', ''),
-            "persona_tone": current_persona.get('tone', ''),
-            "persona_example": current_persona.get('example', ''),
-            "conversation_history": conversation_history,
-            "tools": render_text_description(tools),
-            "tool_names": ", ".join([tool.name for tool in tools]),
-            "agent_scratchpad": "",
-            "uid": uid,
-            "user_profile": user_profile
-        }
-        
-        # 사용자 메시지 저장
-        await store_user_interaction(
-            uid=chat_request.uid,
-            interaction_data={
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'message': chat_request.user_input,
-                'type': 'chat',
-                'importance': 5  # 기본 중요도 설정
-            }
-        )
+        chat = await prepare_persona_chat(chat_request)
         
         # 에이전트 실행
-        response = await agent_executor.ainvoke(agent_input)
+        response = await agent_executor.ainvoke(chat["agent_input"])
         output = response.get("output", "")
         
         print("=== Debug Logs ===")
         print("Raw output:", output)
-        # 사용자 입력 먼저 저장
-        chat_ref = db.collection('chats').document(uid).collection('personas').document(persona_name).collection('messages')
-        # 수정된 Response 패턴
-        response_pattern = r'Response(\d+): (.*?)(?=Response\d+:|$)'
-        responses = re.findall(response_pattern, output, re.DOTALL)
+        responses = parse_responses(output)
 
         # 응답이 없는 경우 기본 응답 저장
         if not responses:
-            default_response = "죄송해요, 잠시 생각이 필요해요... 다시시도해주세요... 🤔"
-            chat_ref.add({
+            await asyncio.to_thread(get_chat_ref(chat["uid"], chat["persona_name"]).add, {
                 "timestamp": firestore.SERVER_TIMESTAMP,
-                'sender': persona_name,
-                'message': default_response
+                'sender': chat["persona_name"],
+                'message': DEFAULT_RESPONSE
             })
             # notification_request = NotificationRequest(
             #     uid=uid, 
@@ -360,85 +445,108 @@ async def persona_chat_v2(chat_request: ChatRequestV2):
             # print(f"persona_chat_v2 >Notification (기본 응답 저장): {notification}")  
             return {"message": "Default response saved successfully"}
         
+        # 응답 저장은 백그라운드에서 진행하고 바로 반환
+        run_in_background(save_persona_responses(
+            chat["uid"],
+            chat["persona_name"],
+            chat["actual_persona_name"],
+            chat["display_name"],
+            responses
+        ))
 
-        # 응답 저장
-        for _, response_text in sorted(responses):
-            cleaned_response = response_text.strip()
-            if cleaned_response:
-                await asyncio.sleep(2)
-                
-                # Firestore에 저장
-                chat_ref.add({
-                    "timestamp": firestore.SERVER_TIMESTAMP,
-                    'sender': persona_name,
-                    'message': cleaned_response
-                })
-
-                # 알림 전송
-                # notification_request = NotificationRequest(
-                #     uid=uid, 
-                #     whoSendMessage=persona_name, 
-                #     message=cleaned_response, 
-                #     pushType="persona_chat"
-                # )
-                # notification = await send_expo_push_notification(notification_request)
-                # print(f"persona_chat_v2 > Notification: {notification}")
-
-                # 단기 기억 저장 (Redis)
-                try:
-                    store_short_term_memory(
-                        uid=uid,
-                        persona_name=actual_persona_name,
-                        memory=f"{display_name}: {cleaned_response}"
-                    )
-                    print(f"단기 메모리 저장 성공: {cleaned_response[:30]}...")
-                except Exception as e:
-                    print(f"단기 메모리 저장 실패: {str(e)}")
-
-                try:
-                    # 중요도 계산
-                    importance = await calculate_importance_llama(cleaned_response)
-                    
-                    # ChromaDB에 저장 메타데이터 준비
-                    metadata = {
-                        "sender": display_name,
-                        "message": cleaned_response,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "type": "persona_chat",
-                        "importance": int(importance),  # 정수형으로 변환
-                        "persona_name": actual_persona_name  # 페르소나 이름 추가
-                    }
-                    
-                    # ChromaDB에 직접 저장
-                    from database import store_memory_to_vectordb
-                    store_memory_to_vectordb(
-                        uid=uid,
-                        content=cleaned_response,  # 실제 텍스트 내용
-                        metadata=metadata  # 메타데이터
-                    )
-                    
-                except Exception as e:
-                    print(f"Error storing memory: {str(e)}")
-                    # 오류 발생 시 기본값으로 저장
-                    metadata = {
-                        "sender": display_name,
-                        "message": cleaned_response,
-                        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                        "type": "persona_chat",
-                        "importance": 5,  # 기본 중요도
-                        "persona_name": actual_persona_name
-                    }
-                    try:
-                        store_memory_to_vectordb(
-                            uid=uid,
-                            content=cleaned_response,
-                            metadata=metadata
-                        )
-                    except Exception as e:
-                        print(f"Error storing memory with default values: {str(e)}")
-
-        return {"message": "Conversation completed successfully"}
+        return {"message": "Conversation completed successfully", "responses": responses}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error during conversation: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+
+async def stream_persona_chat_v2(chat):
+    """에이전트 실행 중 Final Answer 토큰과 완성된 ResponseN을 SSE로 바로 전송
+
+    chat은 prepare_persona_chat의 결과입니다.
+    이벤트: token (Final Answer 토큰), response (완성된 ResponseN), done, error
+    """
+    run_buffers = {}  # LLM 호출(run)별 누적 텍스트
+    final_run_id = None
+    streamed_chars = 0
+    sent_responses = 0
+    output = ""
+
+    try:
+        async for event in streaming_agent_executor.astream_events(chat["agent_input"], version="v2"):
+            kind = event["event"]
+
+            # 최상위 AgentExecutor 종료 이벤트에서 최종 output 확보
+            if kind == "on_chain_end" and not event.get("parent_ids"):
+                event_output = event["data"].get("output")
+                if isinstance(event_output, dict):
+                    output = event_output.get("output", "")
+                continue
+
+            if kind != "on_chat_model_stream":
+                continue
+
+            token = event["data"]["chunk"].content
+            if not token:
+                continue
+
+            run_id = event["run_id"]
+            run_buffers[run_id] = run_buffers.get(run_id, "") + token
+            marker = run_buffers[run_id].find("Final Answer:")
+            if marker == -1:
+                continue  # Thought/Action 단계는 전송하지 않음
+
+            if final_run_id != run_id:
+                final_run_id = run_id
+                streamed_chars = 0
+                sent_responses = 0
+
+            final_text = run_buffers[run_id][marker + len("Final Answer:"):]
+            if len(final_text) > streamed_chars:
+                yield format_sse("token", {"text": final_text[streamed_chars:]})
+                streamed_chars = len(final_text)
+
+            # 다음 ResponseN 마커가 나온 응답은 완성된 것으로 보고 바로 전송
+            completed = parse_responses(final_text)[:-1]
+            for message in completed[sent_responses:]:
+                yield format_sse("response", {"index": sent_responses + 1, "message": message})
+                sent_responses += 1
+
+        if not output and final_run_id is not None:
+            final = run_buffers[final_run_id]
+            output = final[final.find("Final Answer:") + len("Final Answer:"):]
+
+        responses = parse_responses(output)
+        if not responses:
+            responses = [DEFAULT_RESPONSE]
+            sent_responses = 0
+
+        for message in responses[sent_responses:]:
+            yield format_sse("response", {"index": sent_responses + 1, "message": message})
+            sent_responses += 1
+
+        # 클라이언트에 이미 전송했으므로 타이핑 지연 없이 백그라운드에서 저장
+        # (done 전에 등록해서 클라이언트가 done 직후 연결을 끊어도 저장됨)
+        if responses == [DEFAULT_RESPONSE]:
+            run_in_background(asyncio.to_thread(get_chat_ref(chat["uid"], chat["persona_name"]).add, {
+                "timestamp": firestore.SERVER_TIMESTAMP,
+                'sender': chat["persona_name"],
+                'message': DEFAULT_RESPONSE
+            }))
+        else:
+            run_in_background(save_persona_responses(
+                chat["uid"],
+                chat["persona_name"],
+                chat["actual_persona_name"],
+                chat["display_name"],
+                responses,
+                typing_delay=0
+            ))
+
+        yield format_sse("done", {"responses": responses})
+
+    except Exception as e:
+        print(f"Error during streaming conversation: {str(e)}")
+        yield format_sse("error", {"detail": str(e)})
@@ -1,6 +1,9 @@
-from database import db, client, aiclient, get_persona_collection, store_long_term_memory
+from database import (
+    db, client, async_aiclient, get_persona_collection, persona_collection_name, memory_writer,
+    embed_text_async, query_memories_async, store_long_term_memory_async, CHAT_TIMEOUT
+)
 from personas import personas
-from utils import get_current_time_str, generate_unique_id, parse_firestore_timestamp
+from utils import get_current_time_str, generate_unique_id, parse_firestore_timestamp, format_sse
 from fastapi import HTTPException, BackgroundTasks
 from typing import List
 from datetime import datetime
@@ -8,6 +11,7 @@ import json
 import base64
 import requests
 from firebase_admin import firestore
+from service.personaLoopChat import run_in_background
 from models import PersonaChatRequest
 import random
 
@@ -85,27 +89,25 @@ def print_schedules(all_schedules):
             print(f"{item.time}: {persona_schedule.persona} : target : {item.interaction_target}: {item.topic}")
         print()
 
-def get_relevant_memories(uid, persona_name, query, k=3):
-    collection = get_persona_collection(uid, persona_name)
-    query_embedding = aiclient.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
-    results = collection.query(
+async def get_relevant_memories(uid, persona_name, query, k=3, query_embedding=None):
+    collection = await asyncio.to_thread(get_persona_collection, uid, persona_name)
+    if query_embedding is None:
+        query_embedding = await embed_text_async(query)
+    results = await asyncio.to_thread(
+        collection.query,
         query_embeddings=[query_embedding],
         n_results=k
     )
     return results['documents'][0] if results['documents'] else []
 
-def get_relevant_conversations(uid: str, persona_name: str, query: str, limit: int = 5): # 사용자의 대화 중 관련된 대화를 가져오는 함수 벡터db서치
+async def get_relevant_conversations(uid: str, persona_name: str, query: str, limit: int = 5, query_embedding=None): # 사용자의 대화 중 관련된 대화를 가져오는 함수 벡터db서치
     print("services.py > get_relevant_conversations 호출")
-    collection = get_persona_collection(uid, persona_name)
-    query_embedding = aiclient.embeddings.create(
-        input=query,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
+    collection = await asyncio.to_thread(get_persona_collection, uid, persona_name)
+    if query_embedding is None:
+        query_embedding = await embed_text_async(query)
     
-    results = collection.query(
+    results = await asyncio.to_thread(
+        collection.query,
         query_embeddings=[query_embedding],
         n_results=limit,
         where={"type": "persona_conversation"}  # 페르소나 간 대화만 가져오기
@@ -124,13 +126,14 @@ def get_relevant_conversations(uid: str, persona_name: str, query: str, limit: i
     
     return conversations
 
-def get_relevant_feed_posts(uid, query, k=3): # 사용자의 피드 중 관련된 피드를 가져오는 함수 벡터db서치
-    results = query_memories(
+async def get_relevant_feed_posts(uid, query, k=3, query_embedding=None): # 사용자의 피드 중 관련된 피드를 가져오는 함수 벡터db서치
+    results = await query_memories_async(
         uid=uid,
         query=query,
         memory_type="feed_post",  # 피드 포스트 타입으로 검색
         persona_name="feed",
-        limit=k
+        limit=k,
+        query_embedding=query_embedding
     )
     if results['documents']:
         parsed_docs = []
@@ -145,12 +148,39 @@ def get_relevant_feed_posts(uid, query, k=3): # 사용자의 피드 중 관련
         return parsed_docs
     return []
 
-def generate_response(persona_name, user_input, user):
-    print("services.py > generate_response 출")
+async def retrieve_context(uid, persona_name, query, memory_k=3, conversation_limit=5, feed_k=3):
+    """쿼리 임베딩을 한 번만 만들고 기억/대화/피드 검색을 동시에 실행
+
+    feed_k가 0이면 피드 검색은 건너뜁니다.
+    """
+    query_embedding = await embed_text_async(query)
+
+    searches = [
+        get_relevant_memories(uid, persona_name, query, k=memory_k, query_embedding=query_embedding),
+        get_relevant_conversations(uid, persona_name, query, limit=conversation_limit, query_embedding=query_embedding),
+    ]
+    if feed_k:
+        searches.append(get_relevant_feed_posts(uid, query, k=feed_k, query_embedding=query_embedding))
+
+    results = await asyncio.gather(*searches, return_exceptions=True)
+
+    # 한 검색이 실패해도 나머지 결과로 답변할 수 있도록 빈 결과로 대체
+    bundle = {}
+    for key, result in zip(["memories", "conversations", "feed_posts"], results):
+        if isinstance(result, Exception):
+            print(f"services.py > retrieve_context > {key} 검색 오류: {str(result)}")
+            result = []
+        bundle[key] = result
+    bundle.setdefault("feed_posts", [])
+    return bundle
+
+async def build_chat_messages(persona_name, user_input, user):
+    """검색 결과와 사용자 정보로 채팅 completion 메시지 구성"""
     persona = personas[persona_name]
-    relevant_memories = get_relevant_memories(user.get('uid', ''), persona_name, user_input, k=3)
-    recent_conversations = get_relevant_conversations(user.get('uid', ''), persona_name, user_input)  # user_input을 query로 추가
-    relevant_feed_posts = get_relevant_feed_posts(user.get('uid', ''), user_input, k=3)
+    context = await retrieve_context(user.get('uid', ''), persona_name, user_input)  # user_input을 query로 추가
+    relevant_memories = context["memories"]
+    recent_conversations = context["conversations"]
+    relevant_feed_posts = context["feed_posts"]
     print("services.py > generate_response > relevant_memories : ", relevant_memories)  
     print("services.py > generate_response > recent_conversations : ", recent_conversations)
     print("services.py > generate_response > relevant_feed_posts : ", relevant_feed_posts)
@@ -221,28 +251,28 @@ MBTI: {user_profile.get('mbti', '정보 없음')}
 사용자: {user_input}
 """
 
-    messages = [
+    return [
         {"role": "system", "content": system_message.strip()},
         {"role": "user", "content": prompt.strip()},
         {"role": "assistant", "content": assistant_instructions.strip()},
     ]
 
-    response = aiclient.chat.completions.create(
+async def generate_response(persona_name, user_input, user):
+    print("services.py > generate_response 출")
+    messages = await build_chat_messages(persona_name, user_input, user)
+
+    response = await async_aiclient.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         max_tokens=150,
         temperature=0.7,
+        timeout=CHAT_TIMEOUT,
     )
     return response.choices[0].message.content.strip()
 
 # 사용자 페르소나 대화 임베딩
-def store_conversation(uid, persona_name, user_input, response):
+async def store_conversation(uid, persona_name, user_input, response):
     conversation = f"사용자: {user_input}\n{persona_name}: {response}"
-    embedding = aiclient.embeddings.create(
-        input=conversation,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
-    collection = get_persona_collection(uid, persona_name)
     metadata = {
         "is_user_input": True,
         "persona": persona_name,
@@ -251,20 +281,11 @@ def store_conversation(uid, persona_name, user_input, response):
         "response": response
     }
     unique_id = generate_unique_id()
-    collection.add(
-        documents=[conversation],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[unique_id]
-    )
+    await memory_writer.submit(persona_collection_name(uid, persona_name), conversation, metadata, unique_id)
 
 # 페르소나 끼리의 대화 임베딩
-def store_persona_conversation(uid: str, persona1_name: str, persona2_name: str, conversation: List[str]):
+async def store_persona_conversation(uid: str, persona1_name: str, persona2_name: str, conversation: List[str]):
     full_conversation = "\n".join(conversation)
-    embedding = aiclient.embeddings.create(
-        input=full_conversation,
-        model="text-embedding-ada-002"
-    ).data[0].embedding
     
     metadata = {
         "persona1": persona1_name,
@@ -275,22 +296,10 @@ def store_persona_conversation(uid: str, persona1_name: str, persona2_name: str,
     }
     unique_id = generate_unique_id()
     
-    # 첫 번째 페르소나의 컬렉션에 저장
-    collection1 = get_persona_collection(uid, persona1_name)
-    collection1.add(
-        documents=[full_conversation],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[f"{unique_id}_1"]
-    )
-    
-    #  번째 페르소나의 컬렉션에 저장
-    collection2 = get_persona_collection(uid, persona2_name)
-    collection2.add(
-        documents=[full_conversation],
-        embeddings=[embedding],
-        metadatas=[metadata],
-        ids=[f"{unique_id}_2"]
+    # 두 페르소나의 컬렉션에 저장 (같은 배치로 묶여 임베딩은 한 번만 생성)
+    await asyncio.gather(
+        memory_writer.submit(persona_collection_name(uid, persona1_name), full_conversation, metadata, f"{unique_id}_1"),
+        memory_writer.submit(persona_collection_name(uid, persona2_name), full_conversation, metadata, f"{unique_id}_2")
     )
 
 def store_conversation_firestore(uid, persona_name, user_input, response):
@@ -301,35 +310,84 @@ def store_conversation_firestore(uid, persona_name, user_input, response):
         'timestamp': firestore.SERVER_TIMESTAMP
     })
 
+def validate_persona_name(persona_name):
+    if persona_name.lower() not in [persona.lower() for persona in personas]:
+        print("chat_request.persona_name : ", persona_name)
+        raise HTTPException(status_code=400, detail="선택한 페르소나가 존재하지 않습니다.")
+
 async def chat_with_persona(chat_request):
     print("services.py > chat_with_persona 호출")
-    if chat_request.persona_name.lower() not in [persona.lower() for persona in personas]:
-        print("chat_request.persona_name : ", chat_request.persona_name)
-        raise HTTPException(status_code=400, detail="선택한 페르소나가 존재하지 않습니다.")
+    validate_persona_name(chat_request.persona_name)
     
-    response = generate_response(chat_request.persona_name, chat_request.user_input, chat_request.user) # 모델 호출 답변을 만들어주는 gpt에 넘기는
+    response = await generate_response(chat_request.persona_name, chat_request.user_input, chat_request.user) # 모델 호출 답변을 만들어주는 gpt에 넘기는
     print("services.py > chat_with_persona > response : ", response)
     
     # 대화 내역 장 (ChromaDB)
-    store_conversation(chat_request.user.get('uid', ''), chat_request.persona_name, chat_request.user_input, response)
+    await store_conversation(chat_request.user.get('uid', ''), chat_request.persona_name, chat_request.user_input, response)
     
     # 대화 내역 저장 (Firestore)
-    store_conversation_firestore(chat_request.user.get('uid', ''), chat_request.persona_name, chat_request.user_input, response)
+    await asyncio.to_thread(store_conversation_firestore, chat_request.user.get('uid', ''), chat_request.persona_name, chat_request.user_input, response)
     
     return {"persona_name": chat_request.persona_name, "response": response}
 
+async def stream_chat_with_persona(chat_request):
+    """chat_with_persona의 스트리밍 버전 - 토큰을 SSE로 바로 전송하고 완료 후 저장
+
+    이벤트: token, done, error
+    """
+    print("services.py > stream_chat_with_persona 호출")
+    uid = chat_request.user.get('uid', '')
+    try:
+        messages = await build_chat_messages(chat_request.persona_name, chat_request.user_input, chat_request.user)
+
+        stream = await async_aiclient.chat.completions.create(
+            model="gpt-4o-mini",
+            messages=messages,
+            max_tokens=150,
+            temperature=0.7,
+            timeout=CHAT_TIMEOUT,
+            stream=True,
+        )
+
+        chunks = []
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if token:
+                chunks.append(token)
+                yield format_sse("token", {"text": token})
+
+        response = "".join(chunks).strip()
+    except Exception as e:
+        print(f"services.py > stream_chat_with_persona 오류: {str(e)}")
+        yield format_sse("error", {"detail": str(e)})
+        return
+
+    # 대화 내역 저장은 백그라운드에서 (클라이언트가 done 이후 연결을 끊어도 저장되고, 스트림은 done으로 끝남)
+    run_in_background(save_chat_turn(uid, chat_request.persona_name, chat_request.user_input, response))
+    yield format_sse("done", {"persona_name": chat_request.persona_name, "response": response})
+
+async def save_chat_turn(uid, persona_name, user_input, response):
+    """대화 내역 저장 (ChromaDB / Firestore)"""
+    try:
+        await store_conversation(uid, persona_name, user_input, response)
+        await asyncio.to_thread(store_conversation_firestore, uid, persona_name, user_input, response)
+    except Exception as e:
+        print(f"services.py > save_chat_turn 오류: {str(e)}")
+
 def get_personas():
     return list(personas.keys())
 
 async def create_feed_post(post):
     try:
         # 이미지 분석
-        response = requests.get(post.image)
+        response = await asyncio.to_thread(requests.get, post.image, timeout=30)
         response.raise_for_status()
         image_data = response.content
         img_data = base64.b64encode(image_data).decode('utf-8')
 
-        analysis = aiclient.chat.completions.create(
+        analysis = await async_aiclient.chat.completions.create(
             model="gpt-4o-mini",
             messages=[{
                 "role": "user",
@@ -338,7 +396,8 @@ async def create_feed_post(post):
                     {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{img_data}"}}
                 ]
             }],
-            max_tokens=300
+            max_tokens=300,
+            timeout=CHAT_TIMEOUT
         )
 
         image_description = analysis.choices[0].message.content.strip()
@@ -360,20 +419,19 @@ async def create_feed_post(post):
 
         # Firestore 피드 문서 업데이트
         feed_doc = db.collection('feeds').document(post.id)
-        feed_doc.update({
+        await asyncio.to_thread(feed_doc.update, {
             'image_description': image_description
         })
 
         # 벡터 DB 저장
         embedding_text = f"{post.caption} {image_description}"
-        embedding = aiclient.embeddings.create(
-            input=embedding_text,
-            model="text-embedding-ada-002"
-        ).data[0].embedding
-
-        collection = get_persona_collection(post.userId, "feed")
-        collection.add(
-            documents=[json.dumps(feed_doc.get().to_dict())],
+        embedding = await embed_text_async(embedding_text)
+        feed_snapshot = await asyncio.to_thread(feed_doc.get)
+
+        collection = await asyncio.to_thread(get_persona_collection, post.userId, "feed")
+        await asyncio.to_thread(
+            collection.add,
+            documents=[json.dumps(feed_snapshot.to_dict())],
             embeddings=[embedding],
             metadatas=[{"post_id": post.id, "created_at": post.createdAt}],
             ids=[post.id]
@@ -402,7 +460,7 @@ async def create_feed_post(post):
 
         # 피드 내용을 장기 메모리로 저장
         feed_content = f"Caption: {post.caption}\nImage Description: {image_description}"
-        store_long_term_memory(
+        await store_long_term_memory_async(
             uid=post.userId,
             persona_name="feed",
             memory=feed_content,
@@ -424,28 +482,28 @@ async def persona_chat(chat_request: PersonaChatRequest):
     total_rounds = chat_request.rounds
 
     # 첫 번째 페르소나가 주제에 대해 먼저 말하도록 합니다.
-    initial_response = generate_persona_response(chat_request.uid, chat_request.persona1, current_topic, [], total_rounds, 1, is_initial=True)
+    initial_response = await generate_persona_response(chat_request.uid, chat_request.persona1, current_topic, [], total_rounds, 1, is_initial=True)
     conversation.append(f"{chat_request.persona1}: {initial_response}")
 
     for i in range(total_rounds):
         current_round = i + 1
         # 두 번째 페르소나가 이전 대화에 반응합니다.
-        response2 = generate_persona_response(chat_request.uid, chat_request.persona2, current_topic, conversation, total_rounds, current_round)
+        response2 = await generate_persona_response(chat_request.uid, chat_request.persona2, current_topic, conversation, total_rounds, current_round)
         conversation.append(f"{chat_request.persona2}: {response2}")
 
         # 첫 번째 페르소나가 다시 반응합니다 (마지막 라운드가 아닌 경우에만)
         if current_round < total_rounds:
-            response1 = generate_persona_response(chat_request.uid, chat_request.persona1, current_topic, conversation, total_rounds, current_round)
+            response1 = await generate_persona_response(chat_request.uid, chat_request.persona1, current_topic, conversation, total_rounds, current_round)
             conversation.append(f"{chat_request.persona1}: {response1}")
 
     # 대화 내용을 벡터 DB에 저장
-    store_persona_conversation(chat_request.uid, chat_request.persona1, chat_request.persona2, conversation)
+    await store_persona_conversation(chat_request.uid, chat_request.persona1, chat_request.persona2, conversation)
 
     return {"conversation": conversation}
 
 
 
-def generate_persona_response(uid: str, persona_name: str, topic: str, conversation: List[str], total_rounds: int, current_round: int, is_initial: bool = False):
+async def generate_persona_response(uid: str, persona_name: str, topic: str, conversation: List[str], total_rounds: int, current_round: int, is_initial: bool = False):
     persona = personas[persona_name]
     conversation_str = "\n".join(conversation[-4:])  # 최근 4개의 대화 포함
 
@@ -456,8 +514,9 @@ def generate_persona_response(uid: str, persona_name: str, topic: str, conversat
         # 가장 최근의 대화를 쿼리로 사용합니다.
         query = conversation[-1]
 
-    relevant_memories = get_relevant_memories(uid, persona_name, query, k=3)
-    relevant_conversations = get_relevant_conversations(uid, persona_name, query, limit=3)
+    context = await retrieve_context(uid, persona_name, query, memory_k=3, conversation_limit=3, feed_k=0)
+    relevant_memories = context["memories"]
+    relevant_conversations = context["conversations"]
 
     system_message = f"""당신은 '{persona_name}'이라는 페르소나입니다. 
 {persona['description']}
@@ -498,11 +557,12 @@ def generate_persona_response(uid: str, persona_name: str, topic: str, conversat
         {"role": "user", "content": prompt.strip()},
     ]
 
-    response = aiclient.chat.completions.create(
+    response = await async_aiclient.chat.completions.create(
         model="gpt-4o-mini",
         messages=messages,
         max_tokens=150,
         temperature=0.8,
+        timeout=CHAT_TIMEOUT,
     )
 
     generated_response = response.choices[0].message.content.strip()
@@ -0,0 +1,124 @@
+from datetime import datetime
+from database import redis_client
+from service.importanceScorer import score_importance
+import json
+
+# Redis 키 형식: memory:{uid}:{persona_name}:{tier}
+KEY_PREFIX = "memory"
+
+# 시간대별 저장 설정
+TIERS = {
+    "recent": {
+        "max_items": 20,
+        "ttl": 3600,  # 1시간
+        "min_importance": 0
+    },
+    "today": {
+        "max_items": 50,
+        "ttl": 86400,  # 24시간
+        "min_importance": 0
+    },
+    "weekly": {
+        "max_items": 100,
+        "ttl": 604800,  # 1주일
+        "min_importance": 7  # 중요도 7 이상만 저장
+    },
+}
+
+# 프롬프트용 대화 기록 (저장 시점에 포맷팅해서 timestamp 점수의 sorted set에 유지)
+HISTORY_KEY_PREFIX = "history"
+HISTORY_MAX_ITEMS = 50
+HISTORY_TTL = 86400  # 24시간
+
+
+def memory_key(uid, persona_name, tier):
+    return f"{KEY_PREFIX}:{uid}:{persona_name}:{tier}"
+
+
+def history_key(uid, persona_name):
+    return f"{HISTORY_KEY_PREFIX}:{uid}:{persona_name}"
+
+
+def store_short_term_memory(uid, persona_name, memory, importance=None, memory_type="chat"):
+    """모든 시간대(tier)에 단기 기억을 한 번의 MULTI 트랜잭션으로 저장"""
+    if importance is None:
+        importance = score_importance(memory)
+
+    now = datetime.now()
+    memory_data = {
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "content": memory,
+        "importance": int(importance),
+        "type": memory_type,  # 'chat', 'debate', 'event', 'emotion' 등으로 구분
+        "persona_name": persona_name
+    }
+    memory_json = json.dumps(memory_data, ensure_ascii=False)
+
+    try:
+        pipe = redis_client.pipeline(transaction=True)
+        for tier, config in TIERS.items():
+            if memory_data["importance"] < config["min_importance"]:
+                continue
+            key = memory_key(uid, persona_name, tier)
+            pipe.lpush(key, memory_json)
+            pipe.ltrim(key, 0, config["max_items"] - 1)
+            pipe.expire(key, config["ttl"])
+
+        # 대화 기록: 같은 초에 같은 내용은 하나로 합쳐지고, 최근 HISTORY_MAX_ITEMS개만 유지
+        key = history_key(uid, persona_name)
+        pipe.zadd(key, {format_memory(memory_data): int(now.timestamp())})
+        pipe.zremrangebyrank(key, 0, -(HISTORY_MAX_ITEMS + 1))
+        pipe.expire(key, HISTORY_TTL)
+        pipe.execute()
+    except Exception as e:
+        print(f"단기 메모리 저장 오류: {str(e)}")
+        return None
+
+    return memory_data
+
+
+def get_short_term_memories(uid, persona_name, tiers=("recent",)):
+    """여러 시간대의 기억을 한 번의 왕복으로 조회 (tier → 디코딩된 기억 리스트, 최신순)"""
+    pipe = redis_client.pipeline(transaction=False)
+    for tier in tiers:
+        pipe.lrange(memory_key(uid, persona_name, tier), 0, -1)
+    raw_results = pipe.execute()
+
+    memories = {}
+    for tier, raw_memories in zip(tiers, raw_results):
+        decoded = []
+        for memory in raw_memories:
+            try:
+                if isinstance(memory, bytes):
+                    memory = memory.decode('utf-8', errors='ignore')
+                decoded.append(json.loads(memory))
+            except json.JSONDecodeError:
+                continue
+        memories[tier] = decoded
+    return memories
+
+
+def get_recent_history(uid, persona_name, limit=10):
+    """저장 시점에 포맷팅된 최근 대화 기록을 시간순으로 조회 (디코딩/정렬 없이 한 번의 조회)"""
+    history = redis_client.zrange(history_key(uid, persona_name), -limit, -1)
+    return [
+        line.decode('utf-8', errors='ignore') if isinstance(line, bytes) else line
+        for line in history
+    ]
+
+
+def format_memory(memory_data):
+    return f"[{memory_data['timestamp']}] [{memory_data['type']}] (중요도: {memory_data['importance']}) {memory_data['content']}"
+
+
+def get_short_term_memory(uid, persona_name, memory_type="recent"):
+    """한 시간대의 기억을 시간순으로 포맷팅해서 반환"""
+    memories = get_short_term_memories(uid, persona_name, (memory_type,))[memory_type]
+
+    formatted = []
+    for memory_data in sorted(memories, key=lambda m: m.get("timestamp", "")):
+        try:
+            formatted.append(format_memory(memory_data))
+        except KeyError:
+            continue
+    return formatted
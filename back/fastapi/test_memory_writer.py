@@ -0,0 +1,141 @@
+import asyncio
+import time
+
+import pytest
+
+from memory_writer import MemoryBatchWriter
+
+
+class FakeCollection:
+    def __init__(self):
+        self.ids = []
+        self.embeddings = []
+
+    def add(self, documents, embeddings, metadatas, ids):
+        self.ids.extend(ids)
+        self.embeddings.extend(embeddings)
+
+
+def make_writer(embed_texts, collections):
+    return MemoryBatchWriter(
+        embed_texts=embed_texts,
+        get_collection=lambda name: collections.setdefault(name, FakeCollection()),
+        flush_interval=0.05
+    )
+
+
+async def embed_lengths(texts):
+    return [[float(len(text))] for text in texts]
+
+
+def test_duplicate_id_in_batch_is_skipped_not_written():
+    async def run():
+        collections = {}
+        writer = make_writer(embed_lengths, collections)
+        results = await asyncio.gather(
+            writer.submit("c", "first", {}, "same-id", wait=True),
+            writer.submit("c", "second", {}, "same-id", wait=True),
+            return_exceptions=True
+        )
+        await writer.stop()
+        return collections, writer.get_stats(), results
+
+    collections, stats, results = asyncio.run(run())
+    assert collections["c"].ids == ["same-id"]
+    assert stats["written"] == 1
+    assert stats["skipped"] == 1
+    assert results[0] is None
+    assert isinstance(results[1], ValueError)
+
+
+def test_embedding_failure_only_fails_the_bad_document():
+    async def embed(texts):
+        if "bad" in texts:
+            raise RuntimeError("embedding failed")
+        return await embed_lengths(texts)
+
+    async def run():
+        collections = {}
+        writer = make_writer(embed, collections)
+        results = await asyncio.gather(
+            writer.submit("user_a", "good", {}, "a", wait=True),
+            writer.submit("user_b", "bad", {}, "b", wait=True),
+            writer.submit("user_c", "also good", {}, "c", wait=True),
+            return_exceptions=True
+        )
+        await writer.stop()
+        return collections, writer.get_stats(), results
+
+    collections, stats, results = asyncio.run(run())
+    assert collections["user_a"].ids == ["a"]
+    assert collections["user_c"].ids == ["c"]
+    assert "user_b" not in collections
+    assert results[0] is None and results[2] is None
+    assert isinstance(results[1], RuntimeError)
+    assert stats["written"] == 2
+    assert stats["failed"] == 1
+
+
+def test_storage_error_reaches_waiting_caller():
+    class BrokenCollection:
+        def add(self, **kwargs):
+            raise RuntimeError("chroma down")
+
+    async def run():
+        writer = MemoryBatchWriter(embed_texts=embed_lengths, get_collection=lambda name: BrokenCollection(),
+                                   flush_interval=0.01)
+        try:
+            with pytest.raises(RuntimeError):
+                await writer.submit("c", "doc", {}, "id", wait=True)
+        finally:
+            await writer.stop()
+
+    asyncio.run(run())
+
+
+def test_restart_keeps_queued_items():
+    async def run():
+        collections = {}
+        writer = make_writer(embed_lengths, collections)
+        writer.start()
+        queue = writer._queue
+        writer._task.cancel()
+        await asyncio.sleep(0)
+        await writer.submit("c", "doc", {}, "id", wait=False)
+        writer.start()
+        assert writer._queue is queue
+        await writer.stop()
+        return collections
+
+    assert asyncio.run(run())["c"].ids == ["id"]
+
+
+def test_sequential_submits_share_embedding_requests():
+    async def run():
+        collections = {}
+        writer = make_writer(embed_lengths, collections)
+        for i in range(10):
+            await writer.submit("c", f"memory {i}", {}, f"id-{i}")
+        await writer.stop()
+        return collections, writer.get_stats()
+
+    collections, stats = asyncio.run(run())
+    assert len(collections["c"].ids) == 10
+    assert stats["embedding_requests"] < 10
+
+
+def test_waiting_caller_on_idle_writer_is_not_delayed():
+    async def run():
+        collections = {}
+        writer = MemoryBatchWriter(embed_texts=embed_lengths,
+                                   get_collection=lambda name: collections.setdefault(name, FakeCollection()),
+                                   flush_interval=5)
+        started = time.monotonic()
+        await writer.submit("c", "doc", {}, "id", wait=True)
+        elapsed = time.monotonic() - started
+        await writer.stop()
+        return collections, elapsed
+
+    collections, elapsed = asyncio.run(run())
+    assert collections["c"].ids == ["id"]
+    assert elapsed < 1
@@ -10,4 +10,7 @@ def generate_unique_id():
 
 def parse_firestore_timestamp(timestamp):
     return timestamp.strftime("%Y-%m-%d %H:%M:%S") if timestamp else "시간 정보 없음"
-    
\ No newline at end of file
+
+def format_sse(event: str, data) -> str:
+    """Server-Sent Events 형식의 메시지 생성"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"